@@ -28,7 +28,11 @@ _C.DATASET.IMAGE_MODALITY = "rgb"  # mode options=["rgb", "flow", "joint"]
 _C.DATASET.FRAMES_PER_SEGMENT = 16
 _C.DATASET.NUM_REPEAT = 5  # 10
 _C.DATASET.WEIGHT_TYPE = "natural"
-_C.DATASET.SIZE_TYPE = "max"  # options=["source", "max"]
+_C.DATASET.SIZE_TYPE = "max"  # options=["source", "max", "min", "batches", "samples", "time"]
+_C.DATASET.EPOCH_SIZE = None  # number of batches, samples or seconds of an epoch, for "batches", "samples" or "time"
+_C.DATASET.JOINT_LOADING = False  # load the rgb and flow frames of each video together, for the "joint" modality
+_C.DATASET.TEST_N_CLIPS = 1  # number of clips of each test video for multi-view testing in test.py
+_C.DATASET.TEST_N_CROPS = 1  # number of spatial crops of each test clip for multi-view testing in test.py
 # ---------------------------------------------------------------------------- #
 # Solver
 # ---------------------------------------------------------------------------- #
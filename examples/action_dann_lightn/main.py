@@ -57,6 +57,8 @@ def main():
         seed=seed,
         config_weight_type=cfg.DATASET.WEIGHT_TYPE,
         config_size_type=cfg.DATASET.SIZE_TYPE,
+        epoch_size=cfg.DATASET.EPOCH_SIZE,
+        joint_loading=cfg.DATASET.JOINT_LOADING,
     )
 
     # ---- training/test process ----
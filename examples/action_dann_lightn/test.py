@@ -11,8 +11,9 @@ import torch
 from config import get_cfg_defaults
 from model import get_model
 
-from kale.loaddata.video_access import VideoDataset
+from kale.loaddata.video_access import get_image_modality, JointVideoDatasetAccess, VideoDataset
 from kale.loaddata.video_multi_domain import VideoMultiDomainDatasets
+from kale.pipeline.video_evaluation import get_video_predictor, predict_multi_view
 
 
 def arg_parse():
@@ -60,6 +61,8 @@ def main():
         seed=seed,
         config_weight_type=cfg.DATASET.WEIGHT_TYPE,
         config_size_type=cfg.DATASET.SIZE_TYPE,
+        epoch_size=cfg.DATASET.EPOCH_SIZE,
+        joint_loading=cfg.DATASET.JOINT_LOADING,
     )
 
     # ---- setup model and logger ----
@@ -76,6 +79,25 @@ def main():
     # test scores
     trainer.test(model=model_test)
 
+    # multi-view test scores of the target videos, averaging the logits of several clips and crops of each video
+    n_views = cfg.DATASET.TEST_N_CLIPS * cfg.DATASET.TEST_N_CROPS
+    if n_views > 1:
+        rgb, flow = get_image_modality(cfg.DATASET.IMAGE_MODALITY)
+        if rgb and flow:
+            target_access = JointVideoDatasetAccess(target["rgb"], target["flow"], seed)
+        else:
+            target_access = target["rgb"] if rgb else target["flow"]
+        views = target_access.get_test_views(cfg.DATASET.TEST_N_CLIPS, cfg.DATASET.TEST_N_CROPS)
+        model_test.eval()
+        logits, labels = predict_multi_view(
+            get_video_predictor(model_test, cfg.DATASET.IMAGE_MODALITY),
+            views,
+            batch_size=max(cfg.SOLVER.TRAIN_BATCH_SIZE // n_views, 1),
+            device=next(model_test.parameters()).device,
+        )
+        accuracy = (logits.argmax(dim=1) == labels).float().mean().item()
+        print(f"Multi-view target test accuracy ({n_views} views): {accuracy:.4f}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,64 @@
+"""
+Benchmark of the epoch planning time of BalancedBatchSampler, which builds class-balanced batches when
+``DATASET.WEIGHT_TYPE`` is ``"balanced"``.
+
+A synthetic label set with many classes is sampled for one epoch with the per-batch Python path (``precompute=False``)
+and with the precomputed epoch plan (``precompute=True``), e.g.
+
+    python benchmark_sampler.py --n-samples 1000000 --n-classes 1000 --batch-size 2000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from kale.loaddata.sampler import BalancedBatchSampler
+
+
+def arg_parse():
+    parser = argparse.ArgumentParser(description="Epoch planning time of BalancedBatchSampler")
+    parser.add_argument("--n-samples", default=1000000, type=int, help="number of samples")
+    parser.add_argument("--n-classes", default=1000, type=int, help="number of classes")
+    parser.add_argument("--batch-size", default=2000, type=int, help="batch size")
+    parser.add_argument("--repeats", default=3, type=int, help="number of epochs")
+    return parser.parse_args()
+
+
+class LabelDataset(torch.utils.data.Dataset):
+    """Labels only, the samplers read nothing else."""
+
+    def __init__(self, targets):
+        self.targets = targets
+
+    def __getitem__(self, index):
+        return index, self.targets[index]
+
+    def __len__(self):
+        return len(self.targets)
+
+
+def main():
+    args = arg_parse()
+    # imbalanced classes, from a few to thousands of samples
+    weights = np.random.RandomState(0).pareto(1.5, size=args.n_classes) + 0.01
+    targets = np.random.RandomState(1).choice(args.n_classes, size=args.n_samples, p=weights / weights.sum())
+    dataset = LabelDataset(torch.from_numpy(targets))
+
+    print(f"{'precompute':>10} {'ms / epoch':>11} {'speed-up':>9}")
+    reference = None
+    for precompute in [False, True]:
+        sampler = BalancedBatchSampler(dataset, args.batch_size, precompute=precompute, generator=0)
+        list(sampler)  # build the label index and warm up
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            for batch in sampler:
+                pass
+        duration = (time.perf_counter() - start) / args.repeats
+        reference = reference or duration
+        print(f"{str(precompute):>10} {1000 * duration:>11.1f} {reference / duration:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
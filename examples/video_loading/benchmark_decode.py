@@ -0,0 +1,72 @@
+"""
+Benchmark of the clip loading latency of VideoFrameDataset vs. the number of frame decoding threads.
+
+Synthetic videos of EPIC-Kitchens sized JPEG frames (256 x 456) are written to a temporary folder, then each clip of
+16 frames is loaded with ``decode_threads`` in 0 (sequential decoding), 1, 2, 4 and 8, e.g.
+
+    python benchmark_decode.py --n-videos 8 --frames-per-segment 16
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from kale.loaddata.videos import VideoFrameDataset
+
+
+def arg_parse():
+    parser = argparse.ArgumentParser(description="Clip loading latency vs. number of decoding threads")
+    parser.add_argument("--n-videos", default=8, type=int, help="number of synthetic videos")
+    parser.add_argument("--n-frames", default=64, type=int, help="number of frames of each video")
+    parser.add_argument("--frames-per-segment", default=16, type=int, help="number of frames of each clip")
+    parser.add_argument("--threads", default=[0, 1, 2, 4, 8], nargs="+", type=int, help="numbers of threads")
+    parser.add_argument("--repeats", default=3, type=int, help="number of passes over the videos")
+    return parser.parse_args()
+
+
+def make_videos(root, n_videos, n_frames, size=(256, 456)):
+    random_state = np.random.RandomState(0)
+    # smooth images, which compress like natural images
+    base = random_state.randint(0, 256, size=(size[0] // 8, size[1] // 8, 3), dtype=np.uint8)
+    base = np.kron(base, np.ones((8, 8, 1), dtype=np.uint8))
+    with open(os.path.join(root, "annotations.txt"), "w") as annotations:
+        for video in range(n_videos):
+            video_dir = os.path.join(root, f"video_{video}")
+            os.makedirs(video_dir)
+            for i in range(1, n_frames + 1):
+                frame = np.roll(base, shift=video + i, axis=1)
+                Image.fromarray(frame).save(os.path.join(video_dir, f"img_{i:05d}.jpg"), quality=90)
+            annotations.write(f"video_{video} 1 {n_frames} 0\n")
+
+
+def main():
+    args = arg_parse()
+    with tempfile.TemporaryDirectory() as root:
+        make_videos(root, args.n_videos, args.n_frames)
+        print(f"{'threads':>8} {'ms / clip':>10} {'speed-up':>9}")
+        reference = None
+        for decode_threads in args.threads:
+            dataset = VideoFrameDataset(
+                root,
+                os.path.join(root, "annotations.txt"),
+                num_segments=1,
+                frames_per_segment=args.frames_per_segment,
+                test_mode=True,
+                decode_threads=decode_threads,
+            )
+            dataset[0]  # warm up the page cache and the thread pool
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                for index in range(len(dataset)):
+                    dataset[index]
+            latency = (time.perf_counter() - start) / (args.repeats * len(dataset))
+            reference = reference or latency
+            print(f"{decode_threads:>8} {1000 * latency:>10.1f} {reference / latency:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
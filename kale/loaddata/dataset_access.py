@@ -2,9 +2,12 @@
 Dataset Access API adapted from https://github.com/criteo-research/pytorch-ada/blob/master/adalib/ada/datasets/dataset_access.py
 """
 
+import numpy as np
 import torch
 import torch.utils.data
 
+from kale.loaddata.sampler import get_labels
+
 
 class DatasetAccess:
     """
@@ -50,11 +53,19 @@ class DatasetAccess:
 
 def get_class_subset(dataset, class_ids):
     """
+    Filter a dataset by class. When the labels of the dataset can be read without loading the samples (see
+    ``kale.loaddata.sampler.get_labels``), the filtering is a single vectorized lookup on the label vector. Otherwise,
+    every sample is loaded to read its label.
+
     Args:
         dataset: a torch.utils.data.Dataset
         class_ids (list, optional): List of chosen subset of class ids.
     Returns: a torch.utils.data.Dataset
         Dataset: a torch.utils.data.Dataset with only classes in class_ids
     """
-    sub_indices = [i for i in range(0, len(dataset)) if dataset[i][1] in class_ids]
+    labels = get_labels(dataset)
+    if labels is not None and labels.ndim == 1 and len(labels) == len(dataset):
+        sub_indices = np.flatnonzero(np.isin(labels, class_ids)).tolist()
+    else:
+        sub_indices = [i for i in range(0, len(dataset)) if dataset[i][1] in class_ids]
     return torch.utils.data.Subset(dataset, sub_indices)
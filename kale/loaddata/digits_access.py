@@ -11,6 +11,7 @@ from torchvision.datasets import MNIST, SVHN
 import kale.prepdata.image_transform as image_transform
 from kale.loaddata.dataset_access import DatasetAccess
 from kale.loaddata.mnistm import MNISTM
+from kale.loaddata.tensor_cache import CachedDatasetAccess
 from kale.loaddata.usps import USPS
 
 
@@ -22,13 +23,15 @@ class DigitDataset(Enum):
 
     # Originally get_access
     @staticmethod
-    def get_source_target(source: "DigitDataset", target: "DigitDataset", data_path):
+    def get_source_target(source: "DigitDataset", target: "DigitDataset", data_path, cache=False):
         """Gets data loaders for source and target datasets
 
         Args:
             source (DigitDataset): source dataset name
             target (DigitDataset): target dataset name
             data_path (string): root directory of dataset
+            cache (bool, optional): whether to keep the transformed images in memory after their first use, see
+                ``kale.loaddata.tensor_cache.CachedDatasetAccess``. Defaults to False.
 
         Examples::
             >>> source, target, num_channel = get_source_target(sourcename, targetname, data_path)
@@ -61,7 +64,13 @@ class DigitDataset(Enum):
         source_tf = transform_names[(source, num_channels)]
         target_tf = transform_names[(target, num_channels)]
 
-        return (factories[source](data_path, source_tf), factories[target](data_path, target_tf), num_channels)
+        source_access = factories[source](data_path, source_tf)
+        target_access = factories[target](data_path, target_tf)
+        if cache:
+            source_access = CachedDatasetAccess(source_access)
+            target_access = CachedDatasetAccess(target_access)
+
+        return source_access, target_access, num_channels
 
 
 class DigitDatasetAccess(DatasetAccess):
@@ -76,6 +85,7 @@ class DigitDatasetAccess(DatasetAccess):
         super().__init__(n_classes=10)
         self._data_path = data_path
         self._transform = image_transform.get_transform(transform_kind)
+        self._batch_transform = image_transform.get_batch_transform(transform_kind)
 
 
 class MNISTDatasetAccess(DigitDatasetAccess):
@@ -96,10 +106,22 @@ class MNISTMDatasetAccess(DigitDatasetAccess):
     """
 
     def get_train(self):
-        return MNISTM(self._data_path, train=True, transform=self._transform, download=True)
+        return MNISTM(
+            self._data_path,
+            train=True,
+            transform=self._transform,
+            download=True,
+            batch_transform=self._batch_transform,
+        )
 
     def get_test(self):
-        return MNISTM(self._data_path, train=False, transform=self._transform, download=True)
+        return MNISTM(
+            self._data_path,
+            train=False,
+            transform=self._transform,
+            download=True,
+            batch_transform=self._batch_transform,
+        )
 
 
 class USPSDatasetAccess(DigitDatasetAccess):
@@ -108,10 +130,22 @@ class USPSDatasetAccess(DigitDatasetAccess):
     """
 
     def get_train(self):
-        return USPS(self._data_path, train=True, transform=self._transform, download=True)
+        return USPS(
+            self._data_path,
+            train=True,
+            transform=self._transform,
+            download=True,
+            batch_transform=self._batch_transform,
+        )
 
     def get_test(self):
-        return USPS(self._data_path, train=False, transform=self._transform, download=True)
+        return USPS(
+            self._data_path,
+            train=False,
+            transform=self._transform,
+            download=True,
+            batch_transform=self._batch_transform,
+        )
 
 
 class SVHNDatasetAccess(DigitDatasetAccess):
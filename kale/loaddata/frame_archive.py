@@ -0,0 +1,205 @@
+"""
+Indexed frame archives of videos. The frame files of each video are packed into a single shard file holding an offset
+table and the concatenated encoded frames, so that loading a clip opens one file instead of one file per frame (e.g.
+32 files for 16 optical flow frames), which matters on network file systems. Shards are read through ``mmap``, with
+random access to the frames by file name.
+
+The archive mirrors the folders of the frames: the shard of the video folder ``<frames_root>/<video>`` is the file
+``<archive_root>/<video>.frames``. Shard layout, with little-endian integers::
+
+    magic (8 bytes) | n_frames (uint64) | names_size (uint64) | names (utf-8, one per line, zero-padded to 8 bytes)
+    | offsets (n_frames + 1 uint64, from the start of the data) | data (concatenated frame files)
+"""
+
+import collections
+import logging
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+
+SHARD_MAGIC = b"KFRAMES1"
+SHARD_SUFFIX = ".frames"
+_HEADER = struct.Struct("<8sQQ")
+
+
+def get_shard_path(archive_root, frames_root, video_dir):
+    """Path of the shard of the frames in ``video_dir``, a folder of ``frames_root``, in the archive."""
+    relative_dir = os.path.relpath(video_dir, frames_root)
+    if relative_dir.startswith(os.pardir):
+        raise ValueError(f"Video folder {video_dir} is not in the frames folder {frames_root}")
+    return os.path.join(archive_root, relative_dir + SHARD_SUFFIX)
+
+
+def pack_video(video_dir, shard_path):
+    """
+    Pack the frame files of a video folder, including those of its sub-folders (e.g. ``u`` and ``v`` for the optical
+    flow of EPIC-Kitchens), into a shard file.
+
+    Args:
+        video_dir (string): the folder of the frames of the video.
+        shard_path (string): the shard file to write.
+
+    Returns:
+        int: the number of packed frames.
+    """
+    names = []
+    for directory, _, filenames in os.walk(video_dir):
+        relative_dir = os.path.relpath(directory, video_dir)
+        for filename in filenames:
+            names.append(filename if relative_dir == os.curdir else os.path.join(relative_dir, filename))
+    names = sorted(name.replace(os.sep, "/") for name in names)
+    sizes = [os.path.getsize(os.path.join(video_dir, name)) for name in names]
+    offsets = np.zeros(len(names) + 1, dtype="<u8")
+    np.cumsum(sizes, out=offsets[1:])
+
+    encoded_names = "\n".join(names).encode()
+    encoded_names += b"\0" * (-len(encoded_names) % 8)
+    os.makedirs(os.path.dirname(os.path.abspath(shard_path)), exist_ok=True)
+    tmp_path = f"{shard_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as shard:
+        shard.write(_HEADER.pack(SHARD_MAGIC, len(names), len(encoded_names)))
+        shard.write(encoded_names)
+        shard.write(offsets.tobytes())
+        for name in names:
+            with open(os.path.join(video_dir, name), "rb") as frame:
+                shard.write(frame.read())
+    os.replace(tmp_path, shard_path)
+    return len(names)
+
+
+def pack_frame_archive(dataset, archive_root, overwrite=False):
+    """
+    Pack the frames of all the videos of a video dataset into an archive, one shard per video folder.
+
+    Args:
+        dataset (VideoFrameDataset): the dataset, reading the frames from individual files.
+        archive_root (string): the root folder of the archive, see ``FrameArchive``.
+        overwrite (bool, optional): whether to pack again the videos which already have a shard. Defaults to False.
+
+    Returns:
+        int: the number of packed videos.
+    """
+    video_dirs = sorted({str(record.path) for record in dataset.video_list})
+    n_packed = 0
+    for video_dir in video_dirs:
+        shard_path = get_shard_path(archive_root, dataset.root_path, video_dir)
+        if overwrite or not os.path.exists(shard_path):
+            n_frames = pack_video(video_dir, shard_path)
+            logging.debug(f"packed {n_frames} frames of {video_dir} into {shard_path}")
+            n_packed += 1
+    logging.info(f"packed {n_packed}/{len(video_dirs)} videos into {archive_root}")
+    return n_packed
+
+
+class FrameShard:
+    """
+    Read-only access to the frames of a shard file, mapped in memory.
+
+    Args:
+        path (string): the shard file, written by ``pack_video``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as shard:
+            self._buffer = mmap.mmap(shard.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_frames, names_size = _HEADER.unpack_from(self._buffer)
+        if magic != SHARD_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a frame shard")
+        names = self._buffer[_HEADER.size : _HEADER.size + names_size].rstrip(b"\0").decode()
+        self.names = names.split("\n") if n_frames > 0 else []
+        self._index = {name: i for i, name in enumerate(self.names)}
+        offsets_start = _HEADER.size + names_size
+        # copied, so that the mapping is not exported and can be closed
+        self._offsets = np.frombuffer(self._buffer, dtype="<u8", count=n_frames + 1, offset=offsets_start).copy()
+        self._data_start = offsets_start + self._offsets.nbytes
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def read(self, name):
+        """
+        Args:
+            name (string): the path of the frame file in the video folder, with ``/`` separators.
+
+        Returns:
+            bytes: the content of the frame file.
+        """
+        i = self._index.get(name)
+        if i is None:
+            raise KeyError(f"No frame {name} in {self.path}")
+        start, end = (int(offset) + self._data_start for offset in self._offsets[i : i + 2])
+        return self._buffer[start:end]
+
+    def close(self):
+        self._buffer.close()
+
+
+class FrameArchive:
+    """
+    Access to the frames of videos packed into shard files by ``pack_frame_archive``. The most recently used shards
+    are kept open, and the open shards are not pickled, so that each data loader worker process opens its own. The
+    frames can be read from several threads, e.g. the decoding threads of ``VideoFrameDataset``.
+
+    Args:
+        archive_root (string): the root folder of the shards.
+        frames_root (string): the root folder of the video frame folders that the archive mirrors.
+        max_open_shards (int, optional): maximum number of shards kept open. Defaults to 64.
+    """
+
+    def __init__(self, archive_root, frames_root, max_open_shards=64):
+        self.archive_root = archive_root
+        self.frames_root = frames_root
+        self._max_open_shards = max_open_shards
+        self._shards = collections.OrderedDict()
+        # guards the open shards, which are shared by the threads reading frames
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = collections.OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_shard(self, video_dir):
+        video_dir = str(video_dir)
+        shard = self._shards.get(video_dir)
+        if shard is None:
+            shard = FrameShard(get_shard_path(self.archive_root, self.frames_root, video_dir))
+            self._shards[video_dir] = shard
+            if len(self._shards) > self._max_open_shards:
+                self._shards.popitem(last=False)[1].close()
+        else:
+            self._shards.move_to_end(video_dir)
+        return shard
+
+    def get_shard(self, video_dir):
+        """
+        The (open) shard of the frames of a video folder. It may be closed when other shards are opened, so the frames
+        of a shard shared with other threads must be read with ``read``.
+        """
+        with self._lock:
+            return self._get_shard(video_dir)
+
+    def read(self, video_dir, name):
+        """The content of the frame file ``name`` (e.g. ``img_00001.jpg`` or ``u/img_00001.jpg``) of a video."""
+        # the frame is copied out of the shard before another thread can close it
+        with self._lock:
+            return self._get_shard(video_dir).read(name.replace(os.sep, "/"))
+
+    def close(self):
+        """Close all the open shards."""
+        with self._lock:
+            while self._shards:
+                self._shards.popitem()[1].close()
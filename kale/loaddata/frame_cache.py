@@ -0,0 +1,116 @@
+"""
+Cache of decoded video frames, shared by the data loader worker processes. Validation and test clips are sampled at
+the same (symmetric) frames every epoch, so caching the decoded frames saves decoding them again in the following
+epochs, for all the workers and all the datasets (e.g. source and target) given the same cache.
+"""
+
+import hashlib
+import multiprocessing
+
+import numpy as np
+import torch
+
+_N_SHAPE_DIMS = 3
+
+
+class FrameCache:
+    """
+    Least recently used cache of decoded frames (``uint8`` arrays of shape ``(height, width)`` or
+    ``(height, width, channels)``), keyed by strings such as the path of the frame file.
+
+    The frames are stored in fixed-size slots of ``max_frame_bytes`` bytes, and as many slots as fit in ``max_bytes``
+    are allocated at once in shared memory, along with the index of the cache. The cache can then be given to the
+    datasets of several data loaders, and is shared by their worker processes, whether they are forked or spawned.
+    Frames larger than a slot are not cached.
+
+    Args:
+        max_bytes (int): memory budget of the cached frames, in bytes.
+        max_frame_bytes (int, optional): size of the largest frame to cache, in bytes.
+            Defaults to 256 * 456 * 3 (=> RGB frames of EPIC-Kitchens).
+    """
+
+    def __init__(self, max_bytes, max_frame_bytes=256 * 456 * 3):
+        n_slots = max_bytes // max_frame_bytes
+        if n_slots == 0:
+            raise ValueError(f"A budget of {max_bytes} bytes cannot hold a frame of {max_frame_bytes} bytes")
+        self._frames = torch.empty((n_slots, max_frame_bytes), dtype=torch.uint8).share_memory_()
+        self._shapes = torch.zeros((n_slots, _N_SHAPE_DIMS), dtype=torch.int64).share_memory_()
+        # hash of the key of the frame in each slot, 0 for an empty slot
+        self._keys = torch.zeros(n_slots, dtype=torch.int64).share_memory_()
+        self._last_used = torch.zeros(n_slots, dtype=torch.int64).share_memory_()
+        # clock, number of hits, number of misses
+        self._counters = torch.zeros(3, dtype=torch.int64).share_memory_()
+        self._lock = multiprocessing.Lock()
+
+    def __len__(self):
+        return int((self._keys != 0).sum())
+
+    @property
+    def n_slots(self):
+        """Maximum number of cached frames."""
+        return len(self._keys)
+
+    @property
+    def n_hits(self):
+        """Number of frames found in the cache, by all processes."""
+        return int(self._counters[1])
+
+    @property
+    def n_misses(self):
+        """Number of frames not found in the cache, by all processes."""
+        return int(self._counters[2])
+
+    @staticmethod
+    def _hash(key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+        return digest or 1
+
+    def _find(self, key_hash):
+        slots = (self._keys == key_hash).nonzero()
+        return int(slots[0]) if len(slots) > 0 else -1
+
+    def _touch(self, slot):
+        self._counters[0] += 1
+        self._last_used[slot] = self._counters[0]
+
+    def get(self, key):
+        """
+        Args:
+            key (string): the key of the frame, e.g. the path of the frame file.
+
+        Returns:
+            np.ndarray: a copy of the cached frame, or None if it is not in the cache.
+        """
+        key_hash = self._hash(key)
+        with self._lock:
+            slot = self._find(key_hash)
+            if slot < 0:
+                self._counters[2] += 1
+                return None
+            self._counters[1] += 1
+            self._touch(slot)
+            shape = [size for size in self._shapes[slot].tolist() if size > 0]
+            return self._frames[slot, : int(np.prod(shape))].numpy().reshape(shape).copy()
+
+    def put(self, key, frame):
+        """
+        Add a frame to the cache, evicting the least recently used frame if the cache is full.
+
+        Args:
+            key (string): the key of the frame, e.g. the path of the frame file.
+            frame (np.ndarray): the ``uint8`` frame, of shape ``(height, width)`` or ``(height, width, channels)``.
+        """
+        frame = np.ascontiguousarray(frame)
+        if frame.dtype != np.uint8 or frame.ndim not in (2, 3):
+            raise ValueError(f"Only 2D or 3D uint8 frames can be cached, got {frame.dtype} of shape {frame.shape}")
+        if frame.nbytes > self._frames.shape[1]:
+            return
+        key_hash = self._hash(key)
+        with self._lock:
+            slot = self._find(key_hash)
+            if slot < 0:
+                slot = int(self._last_used.argmin())
+            self._frames[slot, : frame.nbytes].numpy()[:] = frame.reshape(-1)
+            self._shapes[slot] = torch.tensor(list(frame.shape) + [0] * (_N_SHAPE_DIMS - frame.ndim))
+            self._keys[slot] = key_hash
+            self._touch(slot)
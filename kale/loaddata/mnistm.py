@@ -36,6 +36,10 @@ class MNISTM(data.Dataset):
 
         download (bool optional): defaults to False.
             Whether to allow downloading the data if not found on disk.
+
+        batch_transform (callable, optional): default to None.
+            The batched counterpart of ``transform`` used by ``get_batch``,
+            see ``kale.prepdata.image_transform.get_batch_transform``.
     """
 
     url = "https://github.com/VanushVaswani/keras_mnistm/releases/download/1.0/keras_mnistm.pkl.gz"
@@ -46,7 +50,7 @@ class MNISTM(data.Dataset):
     test_file = "mnist_m_test.pt"
 
     def __init__(
-        self, root, train=True, transform=None, target_transform=None, download=False,
+        self, root, train=True, transform=None, target_transform=None, download=False, batch_transform=None,
     ):
         """Init MNIST-M dataset."""
         super(MNISTM, self).__init__()
@@ -54,6 +58,7 @@ class MNISTM(data.Dataset):
         self.mnist_root = root
         self.transform = transform
         self.target_transform = target_transform
+        self.batch_transform = batch_transform
         self.train = train  # training set or test set
 
         if download:
@@ -88,6 +93,22 @@ class MNISTM(data.Dataset):
 
         return img, target
 
+    def get_batch(self, indices):
+        """Get the images and targets of a whole batch at once, with ``batch_transform``.
+        Args:
+            indices (list): Indices of the batch
+        Returns:
+            tuple: (images, targets), batched like the collated outputs of ``__getitem__``.
+        """
+        if self.batch_transform is None:
+            raise ValueError("A batch_transform is required to get whole batches")
+        indices = torch.as_tensor(indices)
+        imgs = self.data[indices].permute(0, 3, 1, 2).float().div(255)
+        targets = self.targets[indices]
+        if self.target_transform is not None:
+            targets = torch.stack([torch.as_tensor(self.target_transform(target)) for target in targets])
+        return self.batch_transform(imgs), targets
+
     def __len__(self):
         """Return size of dataset."""
         return len(self.data)
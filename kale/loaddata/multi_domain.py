@@ -11,7 +11,14 @@ import torch.utils.data
 from sklearn.utils import check_random_state
 
 from kale.loaddata.dataset_access import DatasetAccess, get_class_subset
-from kale.loaddata.sampler import get_labels, MultiDataLoader, SamplingConfig
+from kale.loaddata.sampler import (
+    get_dist_info,
+    get_label_index,
+    MultiDataLoader,
+    SamplingConfig,
+    ScheduledMultiDataLoader,
+)
+from kale.loaddata.splits import StratifiedSplitter
 
 
 class WeightingType(Enum):
@@ -23,24 +30,102 @@ class WeightingType(Enum):
 class DatasetSizeType(Enum):
     Max = "max"  # size of the biggest dataset
     Source = "source"  # size of the source dataset
+    Min = "min"  # size of the smallest dataset
+    # budgeted epochs, whose length is set by an epoch size instead of the dataset sizes
+    Batches = "batches"  # fixed number of batches
+    Samples = "samples"  # fixed number of samples (per domain)
+    Time = "time"  # fixed duration in seconds, bounded by the size of the biggest dataset
 
     @staticmethod
     def get_size(size_type, source_dataset, *other_datasets):
-        if size_type is DatasetSizeType.Max:
-            return max(list(map(len, other_datasets)) + [len(source_dataset)])
-        elif size_type is DatasetSizeType.Source:
+        """
+        Number of samples of a domain in an epoch.
+
+        Args:
+            size_type (DatasetSizeType): how the epoch length is defined.
+            source_dataset (Dataset): the source dataset.
+            other_datasets (Dataset): the other datasets.
+
+        Returns:
+            int: the size of the source, smallest or biggest dataset. The budgeted types (``Batches``, ``Samples``
+            and ``Time``) return the size of the biggest dataset, which is only an upper bound of their epoch: the
+            number of batches of a budgeted epoch is given by ``get_n_batches``, and the length of the loaders of
+            ``get_domain_loaders``, which is the number of batches of the last epoch once an epoch of ``Time`` ended.
+        """
+        if size_type is DatasetSizeType.Source:
             return len(source_dataset)
+        elif size_type is DatasetSizeType.Min:
+            return min(list(map(len, other_datasets)) + [len(source_dataset)])
+        elif size_type in DatasetSizeType:
+            return max(list(map(len, other_datasets)) + [len(source_dataset)])
         else:
-            raise ValueError(f"Size type size must be 'max' or 'source', had '{size_type}'")
+            raise ValueError(f"Unknown size type '{size_type}'")
+
+    @staticmethod
+    def check_epoch_size(size_type, epoch_size):
+        """Raise a ValueError if a budgeted size type is not given a positive epoch size."""
+        if size_type in [DatasetSizeType.Batches, DatasetSizeType.Samples, DatasetSizeType.Time]:
+            if epoch_size is None or epoch_size <= 0:
+                raise ValueError(f"Size type '{size_type.value}' needs a positive epoch size, had '{epoch_size}'")
+
+    @staticmethod
+    def get_n_batches(size_type, batch_size, epoch_size, source_dataset, *other_datasets, num_replicas=1):
+        """
+        Number of batches of an epoch.
+
+        Args:
+            size_type (DatasetSizeType): how the epoch length is defined.
+            batch_size (int): number of samples per batch (and domain).
+            epoch_size (int or float): number of batches (``Batches``), samples (``Samples``) or seconds (``Time``)
+                of an epoch. Ignored by the other size types.
+            source_dataset (Dataset): the source dataset.
+            other_datasets (Dataset): the other datasets.
+            num_replicas (int, optional): number of processes sharing the epoch. Defaults to 1.
+
+        Returns:
+            int: number of batches of an epoch, for each process. For ``Time``, this is an upper bound.
+        """
+        DatasetSizeType.check_epoch_size(size_type, epoch_size)
+        if size_type is DatasetSizeType.Batches:
+            return max(int(epoch_size) // num_replicas, 1)
+        if size_type is DatasetSizeType.Samples:
+            n_samples = int(epoch_size)
+        else:
+            n_samples = DatasetSizeType.get_size(size_type, source_dataset, *other_datasets)
+        return max(n_samples // (batch_size * num_replicas), 1)
 
 
 class DomainsDatasetBase:
+    SPLITS = ["train", "valid", "test"]
+
     def prepare_data_loaders(self):
         """
         handles train/validation/test split to have 3 datasets each with data from all domains
         """
         raise NotImplementedError()
 
+    def _get_access_split(self, access, split, key):
+        """
+        Get a split of the dataset of an accessor, filtered by ``class_ids``. The training and validation splits come
+        from a single ``get_train_val`` call per ``key`` (e.g. the domain), memoized in ``self._train_val_by_key``,
+        so the validation split is disjoint from the training split whenever it is requested.
+        """
+        if split not in self.SPLITS:
+            raise ValueError(f"Unknown split '{split}', should be one of {self.SPLITS}")
+        if split == "test":
+            dataset = access.get_test()
+        else:
+            if key not in self._train_val_by_key:
+                if self._splitter is None:
+                    train_val = access.get_train_val(self._val_split_ratio)
+                else:
+                    train_val = self._splitter.train_val_split(access.get_train(), self._val_split_ratio)
+                self._train_val_by_key[key] = dict(zip(["train", "valid"], train_val))
+            dataset = self._train_val_by_key[key][split]
+        if self.class_ids is not None:
+            dataset = get_class_subset(dataset, self.class_ids)
+        return dataset
+
     def get_domain_loaders(self, split="train", batch_size=32):
         """
         handles the sampling of a dataset containing multiple domains
@@ -69,6 +154,13 @@ class MultiDomainDatasets(DomainsDatasetBase):
         n_fewshot=None,
         random_state=None,
         class_ids=None,
+        num_workers=0,
+        n_prefetch=0,
+        infinite_loaders=False,
+        distributed=False,
+        batched_fetch=False,
+        splitter=None,
+        epoch_size=None,
     ):
         """The class controlling how the source and target domains are
             iterated over.
@@ -78,6 +170,7 @@ class MultiDomainDatasets(DomainsDatasetBase):
             target_access (DatasetAccess): accessor for the target dataset
             config_weight_type (WeightingType, optional): The weight type for sampling. Defaults to 'natural'.
             config_size_type (DatasetSizeType, optional): Which dataset size to use to define the number of epochs vs batch_size. Defaults to DatasetSizeType.Max.
+                With "batches", "samples" or "time", the length of an epoch is set by ``epoch_size`` instead.
             val_split_ratio (float, optional): ratio for the validation part of the train dataset. Defaults to 0.1.
             source_sampling_config (SamplingConfig, optional): How to sample from the source. Defaults to None (=> RandomSampler).
             target_sampling_config (SamplingConfig, optional): How to sample from the target. Defaults to None (=> RandomSampler).
@@ -85,26 +178,56 @@ class MultiDomainDatasets(DomainsDatasetBase):
                 to define the few-shot, semi-supervised setting. Defaults to None.
             random_state ([int|np.random.RandomState], optional): Used for deterministic sampling/few-shot label selection. Defaults to None.
             class_ids (list, optional): List of chosen subset of class ids. Defaults to None (=> All Classes).
+            num_workers (int, optional): Number of (persistent) worker processes of each domain loader.
+                Defaults to 0 (=> data loaded in the main process).
+            n_prefetch (int, optional): Number of batches fetched ahead for each domain by a background thread,
+                so that domains are loaded concurrently. Defaults to 0 (=> no prefetching).
+            infinite_loaders (bool, optional): Whether each domain loader is an endless, reshuffling stream kept
+                across wrap-arounds and epochs, instead of being restarted (with new workers) each time it runs out.
+                Defaults to False.
+            distributed (bool, optional): Whether the batches of each epoch are sharded across the processes of a
+                distributed (e.g. DDP) run, so that each process samples its own share of the epoch with the same
+                class balance, instead of the whole epoch. All the processes must be seeded identically.
+                Defaults to False.
+            batched_fetch (bool, optional): Whether each batch is loaded at once with the ``get_batch`` method of
+                the datasets (e.g. USPS, MNIST-M), instead of sample by sample. Defaults to False.
+            splitter (StratifiedSplitter, optional): How to split the train/validation and few-shot datasets, see
+                ``kale.loaddata.splits.StratifiedSplitter``. Defaults to None (=> ``get_train_val`` of the accessors,
+                and stratified few-shot split with ``random_state``).
+            epoch_size (int or float, optional): Number of batches, samples or seconds of a training epoch, for the
+                "batches", "samples" or "time" size types. Time-budgeted epochs stop at the first batch past the
+                budget, or at the size of the biggest dataset. Defaults to None.
         Examples::
             >>> dataset = MultiDomainDatasets(source_access, target_access)
         """
         weight_type = WeightingType(config_weight_type)
         size_type = DatasetSizeType(config_size_type)
+        self._loader_params = {
+            "num_workers": num_workers,
+            "persistent_workers": num_workers > 0,
+            "infinite": infinite_loaders,
+            "distributed": distributed,
+            "batched_fetch": batched_fetch,
+        }
+        self._n_prefetch = n_prefetch
 
         if weight_type is WeightingType.PRESET0:
-            self._source_sampling_config = SamplingConfig(class_weights=np.arange(source_access.n_classes(), 0, -1))
+            self._source_sampling_config = SamplingConfig(
+                class_weights=np.arange(source_access.n_classes(), 0, -1), **self._loader_params
+            )
             self._target_sampling_config = SamplingConfig(
                 # class_weights=random_state.randint(1, 4, size=target_access.n_classes())
-                class_weights=np.random.randint(1, 4, size=target_access.n_classes())
+                class_weights=np.random.randint(1, 4, size=target_access.n_classes()),
+                **self._loader_params,
             )
         elif weight_type is WeightingType.BALANCED:
-            self._source_sampling_config = SamplingConfig(balance=True)
-            self._target_sampling_config = SamplingConfig(balance=True)
+            self._source_sampling_config = SamplingConfig(balance=True, **self._loader_params)
+            self._target_sampling_config = SamplingConfig(balance=True, **self._loader_params)
         elif weight_type not in WeightingType:
             raise ValueError(f"Unknown weighting method {weight_type}.")
         else:
-            self._source_sampling_config = SamplingConfig()
-            self._target_sampling_config = SamplingConfig()
+            self._source_sampling_config = SamplingConfig(**self._loader_params)
+            self._target_sampling_config = SamplingConfig(**self._loader_params)
 
         self._source_access = source_access
         self._target_access = target_access
@@ -120,51 +243,50 @@ class MultiDomainDatasets(DomainsDatasetBase):
         #     else SamplingConfig()
         # )
         self._size_type = size_type
+        self._epoch_size = epoch_size
+        DatasetSizeType.check_epoch_size(size_type, epoch_size)
         self._n_fewshot = n_fewshot
         self._random_state = check_random_state(random_state)
         self._source_by_split: Dict[str, torch.utils.data.Subset] = {}
-        self._labeled_target_by_split = None
+        self._labeled_target_by_split = {} if self.is_semi_supervised() else None
         self._target_by_split: Dict[str, torch.utils.data.Subset] = {}
+        self._train_val_by_key = {}
+        self._splitter = splitter
         self.class_ids = class_ids
 
     def is_semi_supervised(self):
         return self._n_fewshot is not None and self._n_fewshot > 0
 
     def prepare_data_loaders(self):
-        logging.debug("Load source")
-        (self._source_by_split["train"], self._source_by_split["valid"],) = self._source_access.get_train_val(
-            self._val_split_ratio
-        )
-        if self.class_ids is not None:
-            self._source_by_split["train"] = get_class_subset(self._source_by_split["train"], self.class_ids)
-            self._source_by_split["valid"] = get_class_subset(self._source_by_split["valid"], self.class_ids)
-
-        logging.debug("Load target")
-        (self._target_by_split["train"], self._target_by_split["valid"],) = self._target_access.get_train_val(
-            self._val_split_ratio
-        )
-        if self.class_ids is not None:
-            self._target_by_split["train"] = get_class_subset(self._target_by_split["train"], self.class_ids)
-            self._target_by_split["valid"] = get_class_subset(self._target_by_split["valid"], self.class_ids)
+        """Prepare the training split. The validation and test splits are prepared when they are first requested."""
+        self._prepare_split("train")
 
-        logging.debug("Load source Test")
-        self._source_by_split["test"] = self._source_access.get_test()
-        if self.class_ids is not None:
-            self._source_by_split["test"] = get_class_subset(self._source_by_split["test"], self.class_ids)
-        logging.debug("Load target Test")
-        self._target_by_split["test"] = self._target_access.get_test()
-        if self.class_ids is not None:
-            self._target_by_split["test"] = get_class_subset(self._target_by_split["test"], self.class_ids)
+    def _prepare_split(self, split):
+        if split in self._source_by_split and split in self._target_by_split:
+            return
+        logging.debug(f"Load source {split}")
+        self._source_by_split[split] = self._get_access_split(self._source_access, split, "source")
+        logging.debug(f"Load target {split}")
+        self._target_by_split[split] = self._get_access_split(self._target_access, split, "target")
 
-        if self._n_fewshot is not None and self._n_fewshot > 0:
+        if self.is_semi_supervised():
             # semi-supervised target domain
-            self._labeled_target_by_split = {}
-            for part in ["train", "valid", "test"]:
-                (self._labeled_target_by_split[part], self._target_by_split[part],) = _split_dataset_few_shot(
-                    self._target_by_split[part], self._n_fewshot
-                )
+            self._labeled_target_by_split[split], self._target_by_split[split] = _split_dataset_few_shot(
+                self._target_by_split[split], self._n_fewshot, splitter=self._splitter
+            )
+
+    def _get_n_batches(self, batch_size, source_dataset, *other_datasets):
+        """Number of batches of a training epoch, for each process of a distributed run."""
+        num_replicas = get_dist_info()[0] if self._loader_params["distributed"] else 1
+        return DatasetSizeType.get_n_batches(
+            self._size_type, batch_size, self._epoch_size, source_dataset, *other_datasets, num_replicas=num_replicas
+        )
+
+    def _get_time_budget(self):
+        return self._epoch_size if self._size_type is DatasetSizeType.Time else None
 
     def get_domain_loaders(self, split="train", batch_size=32):
+        self._prepare_split(split)
         source_ds = self._source_by_split[split]
         source_loader = self._source_sampling_config.create_loader(source_ds, batch_size)
         target_ds = self._target_by_split[split]
@@ -172,26 +294,31 @@ class MultiDomainDatasets(DomainsDatasetBase):
         if self._labeled_target_by_split is None:
             # unsupervised target domain
             target_loader = self._target_sampling_config.create_loader(target_ds, batch_size)
-            n_dataset = DatasetSizeType.get_size(self._size_type, source_ds, target_ds)
             return MultiDataLoader(
-                dataloaders=[source_loader, target_loader], n_batches=max(n_dataset // batch_size, 1),
+                dataloaders=[source_loader, target_loader],
+                n_batches=self._get_n_batches(batch_size, source_ds, target_ds),
+                n_prefetch=self._n_prefetch,
+                time_budget=self._get_time_budget(),
             )
         else:
             # semi-supervised target domain
             target_labeled_ds = self._labeled_target_by_split[split]
             target_unlabeled_ds = target_ds
             # label domain: always balanced
-            target_labeled_loader = SamplingConfig(balance=True, class_weights=None).create_loader(
-                target_labeled_ds, batch_size=min(len(target_labeled_ds), batch_size)
-            )
+            target_labeled_loader = SamplingConfig(
+                balance=True, class_weights=None, **self._loader_params
+            ).create_loader(target_labeled_ds, batch_size=min(len(target_labeled_ds), batch_size))
             target_unlabeled_loader = self._target_sampling_config.create_loader(target_unlabeled_ds, batch_size)
-            n_dataset = DatasetSizeType.get_size(self._size_type, source_ds, target_labeled_ds, target_unlabeled_ds)
             return MultiDataLoader(
                 dataloaders=[source_loader, target_labeled_loader, target_unlabeled_loader],
-                n_batches=max(n_dataset // batch_size, 1),
+                n_batches=self._get_n_batches(batch_size, source_ds, target_labeled_ds, target_unlabeled_ds),
+                n_prefetch=self._n_prefetch,
+                time_budget=self._get_time_budget(),
             )
 
     def __len__(self):
+        """The number of training samples per domain, see ``DatasetSizeType.get_size``."""
+        self._prepare_split("train")
         source_ds = self._source_by_split["train"]
         target_ds = self._target_by_split["train"]
         if self._labeled_target_by_split is None:
@@ -201,31 +328,141 @@ class MultiDomainDatasets(DomainsDatasetBase):
             return DatasetSizeType.get_size(self._size_type, source_ds, labeled_target_ds, target_ds)
 
 
-def _split_dataset_few_shot(dataset, n_fewshot, random_state=None):
+class MultiSourceDatasets(DomainsDatasetBase):
+    def __init__(
+        self,
+        source_accesses,
+        target_access: DatasetAccess,
+        config_weight_type="natural",
+        val_split_ratio=0.1,
+        schedule="round_robin",
+        n_sources_per_step=1,
+        temperature=1.0,
+        max_active_sources=None,
+        seed=None,
+        class_ids=None,
+        num_workers=0,
+        distributed=False,
+        batched_fetch=False,
+        splitter=None,
+    ):
+        """The class controlling how several source domains and a target domain are iterated over.
+            At each step, a batch is drawn from each of ``n_sources_per_step`` source domains chosen by a scheduling
+            policy, and from the target domain, see ``kale.loaddata.sampler.ScheduledMultiDataLoader``.
+
+        Args:
+            source_accesses (list): accessors (DatasetAccess) for the source datasets
+            target_access (DatasetAccess): accessor for the target dataset
+            config_weight_type (WeightingType, optional): The weight type for sampling, 'natural' or 'balanced'.
+                Defaults to 'natural'.
+            val_split_ratio (float, optional): ratio for the validation part of the train dataset. Defaults to 0.1.
+            schedule (string, optional): How the source domains of each step are chosen: "round_robin",
+                "proportional" (to their size) or "temperature" (size-proportional with a temperature).
+                Defaults to "round_robin".
+            n_sources_per_step (int, optional): Number of source domains per step. Defaults to 1.
+            temperature (float, optional): Temperature of the "temperature" schedule. Defaults to 1.0.
+            max_active_sources (int, optional): Maximum number of source domains whose loader iterators (and worker
+                processes) are kept alive. Defaults to None (=> all of them).
+            seed (int, optional): Seed of the samplers and of the random schedules. Defaults to None.
+            class_ids (list, optional): List of chosen subset of class ids. Defaults to None (=> All Classes).
+            num_workers (int, optional): Number of worker processes of each domain loader. Defaults to 0.
+            distributed (bool, optional): Whether the batches of each epoch are sharded across the processes of a
+                distributed run. Defaults to False.
+            batched_fetch (bool, optional): Whether each batch is loaded at once with the ``get_batch`` method of
+                the datasets. Defaults to False.
+            splitter (StratifiedSplitter, optional): How to split the train/validation datasets, see
+                ``kale.loaddata.splits.StratifiedSplitter``. Defaults to None (=> ``get_train_val`` of the accessors).
+        Examples::
+            >>> dataset = MultiSourceDatasets([source_access_1, source_access_2, source_access_3], target_access)
+        """
+        weight_type = WeightingType(config_weight_type)
+        if weight_type not in [WeightingType.NATURAL, WeightingType.BALANCED]:
+            raise ValueError(f"Weighting method {weight_type} is not supported with multiple sources.")
+        if not 0 < n_sources_per_step <= len(source_accesses):
+            raise ValueError(f"n_sources_per_step should be in [1, {len(source_accesses)}], had {n_sources_per_step}")
+
+        self._sampling_params = dict(
+            balance=weight_type is WeightingType.BALANCED,
+            num_workers=num_workers,
+            # evicted domains must release their workers
+            persistent_workers=num_workers > 0 and max_active_sources is None,
+            distributed=distributed,
+            batched_fetch=batched_fetch,
+        )
+        self._source_accesses = source_accesses
+        self._target_access = target_access
+        self._val_split_ratio = val_split_ratio
+        self._schedule = schedule
+        self._n_sources_per_step = n_sources_per_step
+        self._temperature = temperature
+        self._max_active_sources = max_active_sources
+        self._seed = seed
+        self._distributed = distributed
+        self.class_ids = class_ids
+        self._sources_by_split: Dict[str, list] = {}
+        self._target_by_split: Dict[str, torch.utils.data.Dataset] = {}
+        self._train_val_by_key = {}
+        self._splitter = splitter
+
+    def prepare_data_loaders(self):
+        """Prepare the training split. The validation and test splits are prepared when they are first requested."""
+        self._prepare_split("train")
+
+    def _prepare_split(self, split):
+        if split in self._sources_by_split:
+            return
+        self._sources_by_split[split] = []
+        for i, access in enumerate(self._source_accesses):
+            logging.debug(f"Load source {i} {split}")
+            self._sources_by_split[split].append(self._get_access_split(access, split, ("source", i)))
+        logging.debug(f"Load target {split}")
+        self._target_by_split[split] = self._get_access_split(self._target_access, split, "target")
+
+    def _get_sampling_config(self, domain):
+        """How to sample the domain of index ``domain`` (the sources, then the target), with a seed of its own."""
+        # the domains of the same size must not be sampled in the same order
+        seed = None if self._seed is None else int(np.random.default_rng([self._seed, domain]).integers(2 ** 31 - 1))
+        return SamplingConfig(seed=seed, **self._sampling_params)
+
+    def get_domain_loaders(self, split="train", batch_size=32):
+        self._prepare_split(split)
+        source_datasets = self._sources_by_split[split]
+        target_dataset = self._target_by_split[split]
+        source_loaders = [
+            self._get_sampling_config(i).create_loader(dataset, batch_size) for i, dataset in enumerate(source_datasets)
+        ]
+        target_loader = self._get_sampling_config(len(source_datasets)).create_loader(target_dataset, batch_size)
+
+        # an epoch goes once through the source samples
+        num_replicas = get_dist_info()[0] if self._distributed else 1
+        n_dataset = sum(map(len, source_datasets)) // self._n_sources_per_step
+        return ScheduledMultiDataLoader(
+            source_loaders,
+            n_batches=max(n_dataset // (batch_size * num_replicas), 1),
+            schedule=self._schedule,
+            n_per_step=self._n_sources_per_step,
+            temperature=self._temperature,
+            always_dataloaders=[target_loader],
+            max_active=self._max_active_sources,
+            sizes=[len(dataset) for dataset in source_datasets],
+            seed=self._seed,
+        )
+
+    def __len__(self):
+        self._prepare_split("train")
+        return sum(map(len, self._sources_by_split["train"]))
+
+
+def _split_dataset_few_shot(dataset, n_fewshot, random_state=None, splitter=None):
     if n_fewshot <= 0:
         raise ValueError(f"n_fewshot should be > 0, not '{n_fewshot}'")
-    assert n_fewshot > 0
-    labels = get_labels(dataset)
-    classes = sorted(set(labels))
     if n_fewshot < 1:
-        max_few = len(dataset) // len(classes)
+        n_classes = len(get_label_index(dataset).classes)
+        max_few = len(dataset) // n_classes
         n_fewshot = round(max_few * n_fewshot)
     n_fewshot = int(round(n_fewshot))
 
-    random_state = check_random_state(random_state)
-    # sample n_fewshot items per class from last dataset
-    tindices = []
-    uindices = []
-    for class_ in classes:
-        indices = np.where(labels == class_)[0]
-        random_state.shuffle(indices)
-        head, tail = np.split(indices, [n_fewshot])
-        assert len(head) == n_fewshot
-        tindices.append(head)
-        uindices.append(tail)
-    tindices = np.concatenate(tindices)
-    uindices = np.concatenate(uindices)
-    assert len(tindices) == len(classes) * n_fewshot
-    labeled_dataset = torch.utils.data.Subset(dataset, tindices)
-    unlabeled_dataset = torch.utils.data.Subset(dataset, uindices)
-    return labeled_dataset, unlabeled_dataset
+    if splitter is None:
+        # sample n_fewshot items per class
+        splitter = StratifiedSplitter(seed=check_random_state(random_state).randint(2 ** 31 - 1))
+    return splitter.few_shot_split(dataset, n_fewshot)
@@ -2,20 +2,80 @@
 from https://github.com/criteo-research/pytorch-ada/blob/master/adalib/ada/datasets/sampler.py
 """
 
+import collections
+import itertools
 import logging
+import queue
+import threading
+import time
+import weakref
 
 import numpy as np
 import torch.utils.data
 import torchvision
-from torch.utils.data.sampler import BatchSampler, RandomSampler
+
+from kale.utils.seed import get_seed
 
 
 class SamplingConfig:
-    def __init__(self, balance=False, class_weights=None):
+    """
+    How to sample batches from a dataset, and with which data loader options.
+
+    Args:
+        balance (bool, optional): whether to sample the same number of items from each class. Defaults to False.
+        class_weights (np.ndarray, optional): sampling weight of each class. Defaults to None (=> random sampling).
+        num_workers (int, optional): how many subprocesses to use for data loading. Defaults to 0 (=> the data
+            is loaded in the main process).
+        pin_memory (bool, optional): whether to copy the batches into CUDA pinned memory. Defaults to False.
+        persistent_workers (bool, optional): whether to keep the worker processes alive after the data loader has
+            been consumed once. Only used when ``num_workers > 0``. Defaults to False.
+        prefetch_factor (int, optional): number of batches loaded in advance by each worker. Only used when
+            ``num_workers > 0``. Defaults to 2.
+        infinite (bool, optional): whether the loader is an endless stream, see ``InfiniteBatchSampler``.
+            Defaults to False.
+        seed (int, optional): seed of the batch samplers, see ``ResumableBatchSampler``. Defaults to None
+            (=> each sampler draws its seed from the global numpy random state).
+        distributed (bool, optional): whether to shard the batches of each epoch across the processes of the
+            default ``torch.distributed`` process group, see ``ResumableBatchSampler``. All the processes must use
+            the same seed. Defaults to False.
+        batched_fetch (bool, optional): whether to load each batch with a single call to the ``get_batch(indices)``
+            method of the dataset, instead of one ``__getitem__`` call per sample followed by collation, see
+            ``BatchedFetchDataset``. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        balance=False,
+        class_weights=None,
+        num_workers=0,
+        pin_memory=False,
+        persistent_workers=False,
+        prefetch_factor=2,
+        infinite=False,
+        seed=None,
+        distributed=False,
+        batched_fetch=False,
+    ):
         if balance and class_weights is not None:
             raise ValueError("Params 'balance' and 'weights' are incompatible")
         self._balance = balance
         self._class_weights = class_weights
+        self._seed = seed
+        self._num_workers = num_workers
+        self._pin_memory = pin_memory
+        self._persistent_workers = persistent_workers
+        self._prefetch_factor = prefetch_factor
+        self._infinite = infinite
+        self._distributed = distributed
+        self._batched_fetch = batched_fetch
+
+    def _get_loader_params(self):
+        """Keyword arguments of the ``torch.utils.data.DataLoader`` built by ``create_loader``."""
+        params = {"num_workers": self._num_workers, "pin_memory": self._pin_memory}
+        if self._num_workers > 0:
+            params["persistent_workers"] = self._persistent_workers
+            params["prefetch_factor"] = self._prefetch_factor
+        return params
 
     def create_loader(self, dataset, batch_size):
         """Create the data loader
@@ -26,136 +86,679 @@ class SamplingConfig:
             dataset (Dataset): dataset from which to load the data.
             batch_size (int): how many samples per batch to load
         """
+        num_replicas, rank = get_dist_info() if self._distributed else (1, 0)
+        sampler_params = {"generator": self._seed, "num_replicas": num_replicas, "rank": rank}
         if self._balance:
-            sampler = BalancedBatchSampler(dataset, batch_size=batch_size)
+            sampler = BalancedBatchSampler(dataset, batch_size=batch_size, **sampler_params)
         elif self._class_weights is not None:
-            sampler = ReweightedBatchSampler(dataset, batch_size=batch_size, class_weights=self._class_weights)
+            sampler = ReweightedBatchSampler(
+                dataset, batch_size=batch_size, class_weights=self._class_weights, **sampler_params
+            )
         else:
-            if len(dataset) < batch_size:
-                sub_sampler = RandomSampler(dataset, replacement=True, num_samples=batch_size)
-            else:
-                sub_sampler = RandomSampler(dataset)
-            sampler = BatchSampler(sub_sampler, batch_size=batch_size, drop_last=True)
-        return torch.utils.data.DataLoader(dataset=dataset, batch_sampler=sampler)
+            sampler = RandomBatchSampler(dataset, batch_size=batch_size, **sampler_params)
+        if self._infinite:
+            sampler = InfiniteBatchSampler(sampler)
+        if self._batched_fetch:
+            # the sampler yields whole batches of indices, which the dataset loads at once without collation
+            return torch.utils.data.DataLoader(
+                dataset=BatchedFetchDataset(dataset), sampler=sampler, batch_size=None, **self._get_loader_params()
+            )
+        return torch.utils.data.DataLoader(dataset=dataset, batch_sampler=sampler, **self._get_loader_params())
+
+
+class BatchedFetchDataset(torch.utils.data.Dataset):
+    """
+    View of a dataset indexed by whole batches of indices: ``self[indices]`` is the batch ``get_batch(indices)`` of the
+    underlying dataset, e.g. ``kale.loaddata.usps.USPS``, which indexes its backing tensors once per batch and
+    transforms the whole batch at once. The indices of ``torch.utils.data.Subset`` wrappers (e.g. from
+    ``random_split``) are mapped to the underlying dataset.
+
+    Args:
+        dataset (Dataset): a dataset implementing ``get_batch(indices)``, or a (nested) subset of one.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._indices = None
+        base = dataset
+        while type(base) is torch.utils.data.Subset:
+            indices = np.asarray(base.indices, dtype=np.int64)
+            self._indices = indices if self._indices is None else indices[self._indices]
+            base = base.dataset
+        if not callable(getattr(base, "get_batch", None)):
+            raise ValueError(f"{type(base)} does not implement get_batch(indices)")
+        self._base = base
+
+    def __getitem__(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        if self._indices is not None:
+            indices = self._indices[indices]
+        return self._base.get_batch(indices)
+
+    def __len__(self):
+        return len(self.dataset)
 
 
 class FixedSeedSamplingConfig(SamplingConfig):
-    def __init__(self, seed=1, balance=False, class_weights=None):
-        """Sampling with fixed seed."""
-        super(FixedSeedSamplingConfig, self).__init__(balance, class_weights)
-        self._seed = seed
+    def __init__(self, seed=1, balance=False, class_weights=None, **loader_params):
+        """Sampling with fixed seed. ``loader_params`` are the data loader options of ``SamplingConfig``."""
+        super(FixedSeedSamplingConfig, self).__init__(balance, class_weights, seed=seed, **loader_params)
+
+
+class InfiniteBatchSampler(torch.utils.data.sampler.Sampler):
+    """
+    Endless batch sampler, starting a new pass over ``batch_sampler`` (and thus a new shuffle) each time it is
+    exhausted. A data loader using it never runs out of batches, so its iterator, and its worker processes, are
+    created only once instead of at each wrap-around. ``len`` is the number of batches of one pass.
+
+    Args:
+        batch_sampler (Sampler): the batch sampler of one pass.
+    """
+
+    def __init__(self, batch_sampler):
+        self.batch_sampler = batch_sampler
+        self.n_wraps = 0
+
+    def __iter__(self):
+        while True:
+            n_batches = 0
+            for batch in self.batch_sampler:
+                n_batches += 1
+                yield batch
+            if n_batches == 0:
+                raise ValueError("The batch sampler does not yield any batch")
+            self.n_wraps += 1
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
 
-    def create_loader(self, dataset, batch_size):
-        """Create the data loader with fixed seed."""
-        if self._balance:
-            sampler = BalancedBatchSampler(dataset, batch_size=batch_size)
-        elif self._class_weights is not None:
-            sampler = ReweightedBatchSampler(dataset, batch_size=batch_size, class_weights=self._class_weights)
-        else:
-            if len(dataset) < batch_size:
-                sub_sampler = RandomSampler(
-                    dataset,
-                    replacement=True,
-                    num_samples=batch_size,
-                    generator=torch.Generator().manual_seed(self._seed),
-                )
-            else:
-                sub_sampler = RandomSampler(dataset, generator=torch.Generator().manual_seed(self._seed))
-            sampler = BatchSampler(sub_sampler, batch_size=batch_size, drop_last=True)
-        return torch.utils.data.DataLoader(dataset=dataset, batch_sampler=sampler)
-
-
-# TODO: deterministic shuffle?
 class MultiDataLoader:
     """
     Batch Sampler for a MultiDataset. Iterates in parallel over different batch samplers for each dataset.
     Yields batches [(x_1, y_1), ..., (x_s, y_s)] for s datasets.
+
+    Data loaders built with ``infinite=True`` (see ``InfiniteBatchSampler``) are iterated as endless streams, kept
+    from one epoch to the next. The others are restarted when they run out of batches and at the end of each epoch.
+
+    When the batch samplers of all data loaders are ``ResumableBatchSampler``, ``state_dict`` records the position of
+    the last batch consumed from each of them, and ``load_state_dict`` resumes the iteration right after it, e.g.
+    after a job is pre-empted in the middle of an epoch. Batches loaded in advance (by workers or by prefetching)
+    but not consumed yet are loaded again after resuming.
+
+    With a ``time_budget``, an epoch ends at the first batch consumed after ``time_budget`` seconds, counting the time
+    spent by the caller on each batch, or after ``n_batches`` batches. The length of the loader is then the number of
+    batches of the last complete epoch, so that schedules based on the number of batches per epoch follow the actual
+    epochs. The batches prefetched from the endless streams but not consumed when an epoch ends early are consumed
+    first in the next epoch, so that no sample is skipped.
+
+    Args:
+        dataloaders (list): one data loader per dataset.
+        n_batches (int): number of batches per epoch.
+        n_prefetch (int, optional): if > 0, each data loader is consumed by its own background thread, which keeps
+            up to ``n_prefetch`` batches ready in a bounded queue, so that the domains are fetched concurrently.
+            Defaults to 0 (=> the data loaders are consumed one after the other when a batch is requested).
+        time_budget (float, optional): maximum duration of an epoch, in seconds. Defaults to None (=> no limit).
     """
 
-    def __init__(self, dataloaders, n_batches):
+    def __init__(self, dataloaders, n_batches, n_prefetch=0, time_budget=None):
         if n_batches <= 0:
             raise ValueError("n_batches should be > 0")
+        if time_budget is not None and time_budget <= 0:
+            raise ValueError("time_budget should be > 0")
         self._dataloaders = dataloaders
         self._n_batches = np.maximum(1, n_batches)
+        self._n_prefetch = n_prefetch
+        self._time_budget = time_budget
+        self.n_batches_last_epoch = None
+        self._n_reinits = [0] * len(dataloaders)
+        self._samplers = [_get_resumable_sampler(dl) for dl in dataloaders]
+        # (epoch, position) of the next batch of each sampler, when it is fetched and when it is consumed
+        self._fetched_positions = [None] * len(dataloaders)
+        self._consumed_positions = [None] * len(dataloaders)
+        self._position = 0
+        self._iterators = [None] * len(dataloaders)
+        # batches (and positions) of the endless streams prefetched but not consumed, for the next epoch
+        self._carried = [collections.deque() for _ in dataloaders]
         self._init_iterators()
 
     def _init_iterators(self):
-        self._iterators = [iter(dl) for dl in self._dataloaders]
+        for di, dl in enumerate(self._dataloaders):
+            if self._iterators[di] is None or not _is_infinite(dl):
+                self._carried[di].clear()
+                self._start_stream(di)
+
+    def _start_stream(self, di):
+        if self._samplers[di] is not None:
+            self._fetched_positions[di] = self._samplers[di].next_position()
+            self._consumed_positions[di] = self._fetched_positions[di]
+        self._iterators[di] = iter(self._dataloaders[di])
+
+    def _advance_position(self, di):
+        """Move the fetch position of a sampler by one batch and return it."""
+        sampler = self._samplers[di]
+        if sampler is None:
+            return None
+        epoch, position = self._fetched_positions[di]
+        position += 1
+        if position == len(sampler):
+            epoch, position = epoch + 1, 0
+        self._fetched_positions[di] = (epoch, position)
+        return self._fetched_positions[di]
+
+    def state_dict(self):
+        """
+        Returns:
+            dict: the position in the current epoch and, for each data loader, the state of its sampler
+            after the last consumed batch.
+        """
+        if any(sampler is None for sampler in self._samplers):
+            raise RuntimeError("All the batch samplers should be ResumableBatchSampler to save the iteration state")
+        sampler_states = []
+        for sampler, (epoch, position) in zip(self._samplers, self._consumed_positions):
+            state = sampler.state_dict()
+            state.update(epoch=epoch, position=position)
+            sampler_states.append(state)
+        return {"position": self._position, "samplers": sampler_states}
+
+    def load_state_dict(self, state_dict):
+        """Resume the iteration from a state returned by ``state_dict``."""
+        if len(state_dict["samplers"]) != len(self._dataloaders):
+            raise ValueError(f"Expected {len(self._dataloaders)} sampler states, got {len(state_dict['samplers'])}")
+        if any(sampler is None for sampler in self._samplers):
+            raise RuntimeError("All the batch samplers should be ResumableBatchSampler to load the iteration state")
+        for sampler, sampler_state in zip(self._samplers, state_dict["samplers"]):
+            sampler.load_state_dict(sampler_state)
+        self._position = state_dict["position"]
+        self._iterators = [None] * len(self._dataloaders)
+        self._init_iterators()
+
+    @property
+    def n_wraps(self):
+        """Number of times each data loader has run out of batches and started a new pass over its dataset."""
+        return [
+            _get_batch_sampler(dl).n_wraps if _is_infinite(dl) else n_reinits
+            for dl, n_reinits in zip(self._dataloaders, self._n_reinits)
+        ]
+
+    def _get_next_dl_batch(self, di):
+        try:
+            batch = next(self._iterators[di])
+        except StopIteration:
+            logging.debug(f"reinit loader {di} of type {type(self._dataloaders[di])}")
+            self._n_reinits[di] += 1
+            self._start_stream(di)
+            batch = next(self._iterators[di])
+        return batch, self._advance_position(di)
 
     def _get_nexts(self):
-        def _get_next_dl_batch(di, dl):
+        nexts = [
+            self._carried[di].popleft() if self._carried[di] else self._get_next_dl_batch(di)
+            for di in range(len(self._iterators))
+        ]
+        self._consumed_positions = [position for _, position in nexts]
+        return [batch for batch, _ in nexts]
+
+    def _iter_prefetched(self):
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=self._n_prefetch) for _ in self._dataloaders]
+        # the batch fetched by each thread when it was stopped
+        pending = [None] * len(self._dataloaders)
+
+        def _put(di, item):
+            while not stop.is_set():
+                try:
+                    queues[di].put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def _fetch(di):
             try:
-                batch = next(dl)
-            except StopIteration:
-                logging.debug(f"reinit loader {di} of type {type(dl)}")
-                new_dl = iter(self._dataloaders[di])
-                self._iterators[di] = new_dl
-                batch = next(new_dl)
-            return batch
+                for _ in range(self._position + len(self._carried[di]), self._n_batches):
+                    item = (self._get_next_dl_batch(di), None)
+                    if not _put(di, item):
+                        pending[di] = item
+                        return
+            except Exception as e:
+                _put(di, (None, e))
 
-        return [_get_next_dl_batch(di, dl) for di, dl in enumerate(self._iterators)]
+        threads = [threading.Thread(target=_fetch, args=(di,), daemon=True) for di in range(len(self._dataloaders))]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(self._position, self._n_batches):
+                batches = []
+                for di, q in enumerate(queues):
+                    if self._carried[di]:
+                        item, error = self._carried[di].popleft(), None
+                    else:
+                        item, error = q.get()
+                    if error is not None:
+                        raise error
+                    batch, self._consumed_positions[di] = item
+                    batches.append(batch)
+                yield batches
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            # the batches fetched in advance from the endless streams are consumed in the next epoch, not skipped
+            for di, q in enumerate(queues):
+                items = list(q.queue) + ([] if pending[di] is None else [pending[di]])
+                if _is_infinite(self._dataloaders[di]):
+                    self._carried[di].extend(item for item, error in items if error is None)
+
+    def _iter_batches(self):
+        if self._n_prefetch > 0:
+            yield from self._iter_prefetched()
+        else:
+            while self._position < self._n_batches:
+                yield self._get_nexts()
 
     def __iter__(self):
-        for _ in range(self._n_batches):
-            yield self._get_nexts()
+        start = time.monotonic()
+        batch_iterator = self._iter_batches()
+        try:
+            for batches in batch_iterator:
+                self._position += 1
+                yield batches
+                if self._time_budget is not None and time.monotonic() - start >= self._time_budget:
+                    logging.debug(f"time budget of {self._time_budget}s spent after {self._position} batches")
+                    break
+        finally:
+            # stop the prefetching threads
+            batch_iterator.close()
+        self.n_batches_last_epoch = self._position
+        self._position = 0
         self._init_iterators()
 
     def __len__(self):
+        if self._time_budget is not None and self.n_batches_last_epoch is not None:
+            return self.n_batches_last_epoch
         return self._n_batches
 
 
-class BalancedBatchSampler(torch.utils.data.sampler.BatchSampler):
+class ScheduledMultiDataLoader:
+    """
+    Batch sampler for many domains. At each step, ``n_per_step`` of the ``dataloaders`` (e.g. one per source domain)
+    are chosen by a scheduling policy, and a batch is drawn from each of them and from each of the
+    ``always_dataloaders`` (e.g. the target domain). Yields batches
+    [(x_1, y_1, d_1), ..., (x_k, y_k, d_k), *always_batches], where ``d_i`` is the index of the domain of
+    the i-th scheduled batch, repeated for each of its samples.
+
+    Scheduling policies:
+        - "round_robin": the domains take turns, continuing from one epoch to the next.
+        - "proportional": domains drawn at random with probability proportional to their size.
+        - "temperature": domains drawn at random with probability proportional to ``size ** (1 / temperature)``,
+          from proportional (``temperature=1``) to uniform (large ``temperature``).
+
+    The ``n_per_step`` domains of a step are distinct. Only the iterators (and worker processes) of the
+    ``max_active`` most recently used domains are kept alive, so that memory grows with the number of active
+    domains, not with the number of domains. The ``dataloaders`` should then not use persistent workers.
+
+    Args:
+        dataloaders (list): the data loaders of the scheduled domains.
+        n_batches (int): number of steps per epoch.
+        schedule (string, optional): ["round_robin"|"proportional"|"temperature"]. Defaults to "round_robin".
+        n_per_step (int, optional): number of scheduled domains per step. Defaults to 1.
+        temperature (float, optional): temperature of the "temperature" schedule. Defaults to 1.0.
+        always_dataloaders (list, optional): data loaders drawn from at every step. Defaults to None.
+        max_active (int, optional): maximum number of scheduled domains with a live iterator. Defaults to None
+            (=> all of them).
+        sizes (list, optional): sizes of the scheduled domains. Defaults to None (=> sizes of their datasets).
+        seed (int, optional): seed of the random schedules. Defaults to None (=> drawn from the global numpy random
+            state).
+    """
+
+    SCHEDULES = ["round_robin", "proportional", "temperature"]
+
+    def __init__(
+        self,
+        dataloaders,
+        n_batches,
+        schedule="round_robin",
+        n_per_step=1,
+        temperature=1.0,
+        always_dataloaders=None,
+        max_active=None,
+        sizes=None,
+        seed=None,
+    ):
+        if schedule not in self.SCHEDULES:
+            raise ValueError(f"Unknown schedule '{schedule}', should be one of {self.SCHEDULES}")
+        if not 0 < n_per_step <= len(dataloaders):
+            raise ValueError(f"n_per_step should be in [1, {len(dataloaders)}], had {n_per_step}")
+        if max_active is not None and max_active < n_per_step:
+            raise ValueError(f"max_active ({max_active}) should be at least n_per_step ({n_per_step})")
+        if n_batches <= 0:
+            raise ValueError("n_batches should be > 0")
+        self._dataloaders = dataloaders
+        self._n_batches = n_batches
+        self._schedule = schedule
+        self._n_per_step = n_per_step
+        self._max_active = len(dataloaders) if max_active is None else max_active
+        self._always_dataloaders = [] if always_dataloaders is None else always_dataloaders
+        self._always_iterators = [iter(dl) for dl in self._always_dataloaders]
+        sizes = np.array([len(dl.dataset) for dl in dataloaders] if sizes is None else sizes, dtype=np.float64)
+        weights = sizes if schedule == "proportional" else sizes ** (1.0 / temperature)
+        with np.errstate(divide="ignore"):
+            self._log_probs = np.log(weights / weights.sum())
+        self._random_state = np.random.default_rng(get_seed(seed))
+        self._next_domain = 0
+        # live iterators of the scheduled domains, from the least to the most recently used
+        self._iterators = collections.OrderedDict()
+        self.domain_counts = np.zeros(len(dataloaders), dtype=np.int64)
+
+    def get_schedule(self):
+        """
+        Draw the domains of the steps of an epoch.
+
+        Returns:
+            np.ndarray: int array of shape ``(n_batches, n_per_step)``, the domains of each step.
+        """
+        n_domains = len(self._dataloaders)
+        if self._schedule == "round_robin":
+            domains = (self._next_domain + np.arange(self._n_batches * self._n_per_step)) % n_domains
+            self._next_domain = (domains[-1] + 1) % n_domains
+            return domains.reshape(self._n_batches, self._n_per_step)
+        # sampling without replacement in each step: top-k of the Gumbel-perturbed log-probabilities
+        keys = self._log_probs + self._random_state.gumbel(size=(self._n_batches, n_domains))
+        return np.argsort(-keys, axis=1)[:, : self._n_per_step]
+
+    def _get_next_domain_batch(self, domain):
+        iterator = self._iterators.pop(domain, None)
+        if iterator is None:
+            iterator = iter(self._dataloaders[domain])
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            iterator = iter(self._dataloaders[domain])
+            batch = next(iterator)
+        self._iterators[domain] = iterator
+        while len(self._iterators) > self._max_active:
+            evicted, _ = self._iterators.popitem(last=False)
+            logging.debug(f"release the iterator of domain {evicted}")
+        self.domain_counts[domain] += 1
+        domain_ids = torch.full((len(batch[0]),), int(domain), dtype=torch.long)
+        return (*batch, domain_ids)
+
+    def _get_next_always_batch(self, i):
+        try:
+            return next(self._always_iterators[i])
+        except StopIteration:
+            self._always_iterators[i] = iter(self._always_dataloaders[i])
+            return next(self._always_iterators[i])
+
+    def __iter__(self):
+        for domains in self.get_schedule():
+            batches = [self._get_next_domain_batch(domain) for domain in domains]
+            batches.extend(self._get_next_always_batch(i) for i in range(len(self._always_dataloaders)))
+            yield batches
+
+    def __len__(self):
+        return self._n_batches
+
+
+def _get_batch_sampler(dataloader):
+    batch_sampler = getattr(dataloader, "batch_sampler", None)
+    if batch_sampler is None and isinstance(getattr(dataloader, "dataset", None), BatchedFetchDataset):
+        # batched fetching: the sampler of the data loader yields batches
+        batch_sampler = dataloader.sampler
+    return batch_sampler
+
+
+def _is_infinite(dataloader):
+    return isinstance(_get_batch_sampler(dataloader), InfiniteBatchSampler)
+
+
+def _get_resumable_sampler(dataloader):
+    sampler = _get_batch_sampler(dataloader)
+    if isinstance(sampler, InfiniteBatchSampler):
+        sampler = sampler.batch_sampler
+    return sampler if isinstance(sampler, ResumableBatchSampler) else None
+
+
+def get_dist_info():
+    """
+    Returns:
+        tuple: ``(world_size, rank)`` of the default ``torch.distributed`` process group, or ``(1, 0)`` when it is
+        not initialized.
+    """
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_world_size(), torch.distributed.get_rank()
+    return 1, 0
+
+
+class ResumableBatchSampler(torch.utils.data.sampler.BatchSampler):
+    """
+    Base class of the kale batch samplers, with explicit and resumable random state.
+
+    Each pass (epoch) over the sampler draws its batches from a ``np.random.Generator`` seeded with ``(seed, epoch)``
+    only, so that the state of the sampler is fully described by its seed, the epoch and the position of the next
+    batch in that epoch. ``state_dict`` and ``load_state_dict`` save and restore this state, and the first pass after
+    ``load_state_dict`` resumes right at the saved position, without replaying the batches before it.
+
+    For distributed training, the batches of each pass are dealt out to ``num_replicas`` processes: process
+    ``rank`` gets batches ``rank``, ``rank + num_replicas``, etc., so the processes share the work of an epoch
+    instead of each going through all of it, and every batch keeps the composition (e.g. class balance) it has in
+    the full plan. All the processes must use the same seed to draw the same plan. Each process gets
+    ``len(self)`` batches, the trailing batches of the plan that cannot be dealt evenly being dropped.
+
+    Subclasses implement ``_generate_batches(random_state)`` to yield the batches of one pass, and
+    ``_get_n_batches()`` to return their (constant) number.
+
+    Args:
+        generator (int, np.random.Generator or np.random.RandomState, optional): the seed, or a random generator
+            to draw it from. Defaults to None (=> drawn from the global numpy random state).
+        num_replicas (int, optional): number of processes sharing the batches. Defaults to 1.
+        rank (int, optional): rank of the current process, in ``[0, num_replicas)``. Defaults to 0.
+    """
+
+    def __init__(self, generator=None, num_replicas=1, rank=0):
+        if not 0 <= rank < num_replicas:
+            raise ValueError(f"Invalid rank {rank}, rank should be in the interval [0, {num_replicas - 1}]")
+        self._seed = get_seed(generator)
+        self._num_replicas = num_replicas
+        self._rank = rank
+        self._epoch = 0
+        self._position = 0
+        self._resuming = False
+
+    def _generate_batches(self, random_state):
+        raise NotImplementedError()
+
+    def _get_n_batches(self):
+        raise NotImplementedError()
+
+    def _shard(self, batches):
+        if self._num_replicas == 1:
+            return batches
+        # with fewer batches than processes, some processes share a batch
+        start = self._rank % self._get_n_batches()
+        return itertools.islice(batches, start, start + len(self) * self._num_replicas, self._num_replicas)
+
+    def __len__(self):
+        return max(self._get_n_batches() // self._num_replicas, 1)
+
+    def next_position(self):
+        """
+        Returns:
+            tuple: ``(epoch, position)`` of the first batch of the next call to ``__iter__``.
+        """
+        if self._resuming or self._position == 0:
+            return self._epoch, self._position
+        # an interrupted pass is not continued by a new iterator
+        return self._epoch + 1, 0
+
+    def __iter__(self):
+        self._epoch, self._position = self.next_position()
+        self._resuming = False
+        random_state = np.random.default_rng([self._seed, self._epoch])
+        batches = self._shard(self._generate_batches(random_state))
+        for batch in itertools.islice(batches, self._position, None):
+            self._position += 1
+            yield batch
+        self._epoch, self._position = self._epoch + 1, 0
+
+    def state_dict(self):
+        """
+        Returns:
+            dict: the seed of the sampler, the number of processes sharing it, and the epoch and position in the
+            epoch of the next batch.
+        """
+        return {
+            "seed": self._seed,
+            "num_replicas": self._num_replicas,
+            "epoch": self._epoch,
+            "position": self._position,
+        }
+
+    def load_state_dict(self, state_dict):
+        """Restore a state returned by ``state_dict``. The next iteration resumes at the saved position."""
+        num_replicas = state_dict.get("num_replicas", 1)
+        if num_replicas != self._num_replicas:
+            raise ValueError(
+                f"Cannot resume a sampler shared by {num_replicas} processes with {self._num_replicas} processes"
+            )
+        self._seed = state_dict["seed"]
+        self._epoch = state_dict["epoch"]
+        self._position = state_dict["position"]
+        self._resuming = True
+
+
+class RandomBatchSampler(ResumableBatchSampler):
+    """
+    Batches of a random permutation of the dataset, dropping the last incomplete batch. A dataset smaller than
+    ``batch_size`` gives a single batch drawn with replacement.
+
+    Args:
+        dataset (Dataset): dataset from which to sample.
+        batch_size (int): how many samples per batch to load.
+        generator (int or np.random.Generator, optional): see ``ResumableBatchSampler``. Defaults to None.
+        num_replicas (int, optional): see ``ResumableBatchSampler``. Defaults to 1.
+        rank (int, optional): see ``ResumableBatchSampler``. Defaults to 0.
+    """
+
+    def __init__(self, dataset, batch_size, generator=None, num_replicas=1, rank=0):
+        super(RandomBatchSampler, self).__init__(generator, num_replicas, rank)
+        self.n_dataset = len(dataset)
+        self._batch_size = batch_size
+
+    def _generate_batches(self, random_state):
+        if self.n_dataset < self._batch_size:
+            yield random_state.integers(self.n_dataset, size=self._batch_size)
+            return
+        n_batches = self._get_n_batches()
+        permutation = random_state.permutation(self.n_dataset)
+        yield from permutation[: n_batches * self._batch_size].reshape(n_batches, self._batch_size)
+
+    def _get_n_batches(self):
+        return max(self.n_dataset // self._batch_size, 1)
+
+
+class BalancedBatchSampler(ResumableBatchSampler):
     """
     BatchSampler - from a MNIST-like dataset, samples n_samples for each of the n_classes.
     Returns batches of size n_classes * (batch_size // n_classes)
     adapted from https://github.com/adambielski/siamese-triplet/blob/master/datasets.py
+
+    Args:
+        dataset (Dataset): dataset from which to sample.
+        batch_size (int): requested batch size, rounded down to a multiple of the number of classes.
+        precompute (bool, optional): if True, the index plan of a whole epoch is built at once as a single
+            ``(n_batches, batch_size)`` int64 array and batches are yielded as row views of it, instead of being
+            assembled class by class in Python. Defaults to False.
+        generator (int or np.random.Generator, optional): see ``ResumableBatchSampler``. Defaults to None.
+        num_replicas (int, optional): see ``ResumableBatchSampler``. Defaults to 1.
+        rank (int, optional): see ``ResumableBatchSampler``. Defaults to 0.
     """
 
-    def __init__(self, dataset, batch_size):
-        labels = get_labels(dataset)
-        classes = sorted(set(labels))
+    def __init__(self, dataset, batch_size, precompute=False, generator=None, num_replicas=1, rank=0):
+        super(BalancedBatchSampler, self).__init__(generator, num_replicas, rank)
+        label_index = get_label_index(dataset)
+        classes = label_index.classes
 
         n_classes = len(classes)
         self._n_samples = batch_size // n_classes
         if self._n_samples == 0:
             raise ValueError(f"batch_size should be bigger than the number of classes, got {batch_size}")
 
-        self._class_iters = [InfiniteSliceIterator(np.where(labels == class_)[0], class_=class_) for class_ in classes]
+        self._class_iters = [
+            InfiniteSliceIterator(label_index.class_indices(class_).copy(), class_=class_) for class_ in classes
+        ]
+        self._precompute = precompute
 
         batch_size = self._n_samples * n_classes
-        self.n_dataset = len(labels)
+        self._batch_size = batch_size
+        self.n_dataset = len(label_index)
         self._n_batches = self.n_dataset // batch_size
         if self._n_batches == 0:
             raise ValueError(f"Dataset is not big enough to generate batches with size {batch_size}")
         logging.debug("K=", n_classes, "nk=", self._n_samples)
         logging.debug("Batch size = ", batch_size)
 
-    def __iter__(self):
+    def _generate_batches(self, random_state):
+        if self._precompute:
+            yield from self._get_epoch_plan(random_state)
+            return
+
+        for class_iter in self._class_iters:
+            class_iter.restart(random_state)
         for _ in range(self._n_batches):
             indices = []
             for class_iter in self._class_iters:
                 indices.extend(class_iter.get(self._n_samples))
-            np.random.shuffle(indices)
+            random_state.shuffle(indices)
             yield indices
 
-        for class_iter in self._class_iters:
-            class_iter.reset()
+    def _get_epoch_plan(self, random_state):
+        """
+        Build the index plan of one epoch in a single pass.
 
-    def __len__(self):
+        Each class draws ``n_batches`` slices of ``n_samples`` indices from successive random permutations of its
+        members (tiled when the class has fewer than ``n_samples`` items), the per-class slices are interleaved into
+        batches and every batch is shuffled with one batched ``argsort``.
+
+        Returns:
+            np.ndarray: int64 array of shape ``(n_batches, batch_size)``, one row per batch.
+        """
+        plan = np.empty((self._n_batches, len(self._class_iters), self._n_samples), dtype=np.int64)
+        for k, class_iter in enumerate(self._class_iters):
+            plan[:, k, :] = _draw_class_slices(class_iter.array, self._n_samples, self._n_batches, random_state)
+        plan = plan.reshape(self._n_batches, self._batch_size)
+        order = np.argsort(random_state.random(plan.shape), axis=1)
+        return np.take_along_axis(plan, order, axis=1)
+
+    def _get_n_batches(self):
         return self._n_batches
 
 
-class ReweightedBatchSampler(torch.utils.data.sampler.BatchSampler):
+class ReweightedBatchSampler(ResumableBatchSampler):
     """
     BatchSampler - from a MNIST-like dataset, samples batch_size according to given input distribution
     assuming multi-class labels
     adapted from https://github.com/adambielski/siamese-triplet/blob/master/datasets.py
+
+    Args:
+        dataset (Dataset): dataset from which to sample.
+        batch_size (int): how many samples per batch to load.
+        class_weights (np.ndarray): sampling weight of each class.
+        precompute (bool, optional): if True, the classes of a whole epoch are drawn at once from a Walker alias
+            table built from ``class_weights``, and the matching indices are taken in bulk from per-class random
+            permutations. Batches are yielded as row views of a single ``(n_batches, batch_size)`` array.
+            Defaults to False.
+        generator (int or np.random.Generator, optional): see ``ResumableBatchSampler``. Defaults to None.
+        num_replicas (int, optional): see ``ResumableBatchSampler``. Defaults to 1.
+        rank (int, optional): see ``ResumableBatchSampler``. Defaults to 0.
     """
 
     # /!\ 'class_weights' should be provided in the "natural order" of the classes (i.e. sorted(classes)) /!\
-    def __init__(self, dataset, batch_size, class_weights):
-        labels = get_labels(dataset)
-        self._classes = sorted(set(labels))
+    def __init__(self, dataset, batch_size, class_weights, precompute=False, generator=None, num_replicas=1, rank=0):
+        super(ReweightedBatchSampler, self).__init__(generator, num_replicas, rank)
+        label_index = get_label_index(dataset)
+        self._classes = label_index.classes
 
         n_classes = len(self._classes)
         if n_classes > len(class_weights):
@@ -181,10 +784,15 @@ class ReweightedBatchSampler(torch.utils.data.sampler.BatchSampler):
             raise ValueError(f"batch_size should be bigger than the number of classes, got {batch_size}")
 
         self._class_to_iter = {
-            class_: InfiniteSliceIterator(np.where(labels == class_)[0], class_=class_) for class_ in self._classes
+            class_: InfiniteSliceIterator(label_index.class_indices(class_).copy(), class_=class_)
+            for class_ in self._classes
         }
 
-        self.n_dataset = len(labels)
+        self._precompute = precompute
+        if precompute:
+            self._alias_prob, self._alias = _build_alias_table(self._class_weights)
+
+        self.n_dataset = len(label_index)
         self._batch_size = batch_size
         self._n_batches = self.n_dataset // self._batch_size
         if self._n_batches == 0:
@@ -192,69 +800,247 @@ class ReweightedBatchSampler(torch.utils.data.sampler.BatchSampler):
         logging.debug("K=", n_classes, "nk=", self._batch_size)
         logging.debug("Batch size = ", self._batch_size)
 
-    def __iter__(self):
+    def _generate_batches(self, random_state):
+        if self._precompute:
+            yield from self._get_epoch_plan(random_state)
+            return
+
+        for class_iter in self._class_to_iter.values():
+            class_iter.restart(random_state)
         for _ in range(self._n_batches):
             # sample batch_size classes
-            class_idx = np.random.choice(self._classes, p=self._class_weights, replace=True, size=self._batch_size,)
+            class_idx = random_state.choice(self._classes, p=self._class_weights, replace=True, size=self._batch_size)
             indices = []
             for class_, num in zip(*np.unique(class_idx, return_counts=True)):
                 indices.extend(self._class_to_iter[class_].get(num))
-            np.random.shuffle(indices)
+            random_state.shuffle(indices)
             yield indices
 
-        for class_iter in self._class_to_iter.values():
-            class_iter.reset()
+    def _get_epoch_plan(self, random_state):
+        """
+        Build the index plan of one epoch in a single pass.
 
-    def __len__(self):
+        The class of every slot of the epoch is drawn in O(1) from the alias table. Slots are then grouped by class
+        with a stable ``argsort`` and filled with the class items, taken in order from successive random
+        permutations. As classes are drawn i.i.d., the batches need no further shuffling.
+
+        Returns:
+            np.ndarray: int64 array of shape ``(n_batches, batch_size)``, one row per batch.
+        """
+        n_draws = self._n_batches * self._batch_size
+        class_pos = _draw_alias(self._alias_prob, self._alias, n_draws, random_state)
+        counts = np.bincount(class_pos, minlength=len(self._classes))
+        streams = [
+            _draw_class_slices(self._class_to_iter[class_].array, 1, count, random_state).ravel()
+            for class_, count in zip(self._classes, counts)
+            if count > 0
+        ]
+        plan = np.empty(n_draws, dtype=np.int64)
+        plan[np.argsort(class_pos, kind="stable")] = np.concatenate(streams)
+        return plan.reshape(self._n_batches, self._batch_size)
+
+    def _get_n_batches(self):
         return self._n_batches
 
 
+class LabelIndex:
+    """
+    Index of the samples of a dataset by class label, stored CSR-style: the sample indices sorted by label (one stable
+    ``argsort``) and the offsets where each class starts in that order. Querying the members of a class is then a
+    slice instead of a scan of the whole label array.
+
+    Args:
+        labels (array-like): the label of each sample of the dataset.
+    """
+
+    def __init__(self, labels):
+        self.labels = np.asarray(labels)
+        self.order = np.argsort(self.labels, kind="stable")
+        self.classes, starts, self.counts = np.unique(self.labels[self.order], return_index=True, return_counts=True)
+        self.offsets = np.append(starts, len(self.labels))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def class_indices(self, class_):
+        """
+        Get the indices of the samples of a class, in increasing order. The returned array is a view on the index
+        and must be copied before being modified.
+
+        Args:
+            class_: the class label.
+        """
+        k = np.searchsorted(self.classes, class_)
+        if k == len(self.classes) or self.classes[k] != class_:
+            return self.order[:0]
+        return self.order[self.offsets[k] : self.offsets[k + 1]]
+
+    def subset(self, indices):
+        """Get the index of the samples at ``indices``, e.g. for a ``torch.utils.data.Subset``."""
+        return LabelIndex(self.labels[np.asarray(indices, dtype=np.int64)])
+
+
+_label_index_cache = weakref.WeakKeyDictionary()
+
+
+def get_label_index(dataset):
+    """
+    Get the ``LabelIndex`` of a dataset. The index is built once per dataset object and memoized, and the index of a
+    ``torch.utils.data.Subset`` (e.g. from ``random_split``) is derived from the index of the dataset it wraps, so
+    nested subsets share the label extraction of the underlying dataset.
+
+    Note:
+        The labels are read when the index is first built: changing the labels of a dataset afterwards
+        is not reflected in the cached index.
+
+    Returns:
+        LabelIndex: the label index, or None if the labels of the dataset cannot be found.
+    """
+    try:
+        return _label_index_cache[dataset]
+    except (KeyError, TypeError):
+        pass
+
+    if type(dataset) is torch.utils.data.Subset:
+        parent_index = get_label_index(dataset.dataset)
+        if parent_index is None:
+            return None
+        logging.debug(f"data subset of len {len(dataset.indices)} from {len(parent_index)}")
+        label_index = parent_index.subset(dataset.indices)
+    else:
+        labels = _read_labels(dataset)
+        if labels is None:
+            return None
+        label_index = LabelIndex(labels)
+
+    try:
+        _label_index_cache[dataset] = label_index
+    except TypeError:
+        logging.debug(f"cannot cache the label index of {type(dataset)}")
+    return label_index
+
+
 def get_labels(dataset):
     """
     Get class labels for dataset
     """
+    label_index = get_label_index(dataset)
+    if label_index is None:
+        return None
+    return label_index.labels
+
+
+def _read_labels(dataset):
+    """
+    Read the class labels stored by a (non-subset) dataset
+    """
     dataset_type = type(dataset)
     if dataset_type is torchvision.datasets.SVHN:
         return dataset.labels
     if dataset_type is torchvision.datasets.ImageFolder:
         return dataset.imgs[:][1]
 
-    # Handle subset, recurses into non-subset version
-    if dataset_type is torch.utils.data.Subset:
-        indices = dataset.indices
-        all_labels = get_labels(dataset.dataset)
-        logging.debug(f"data subset of len {len(indices)} from {len(all_labels)}")
-        labels = all_labels[indices]
-        if isinstance(labels, torch.Tensor):
-            return labels.numpy()
-        return labels
-
     try:
         logging.debug(dataset.targets.shape, type(dataset.targets))
         if isinstance(dataset.targets, torch.Tensor):
             return dataset.targets.numpy()
         return dataset.targets
     except AttributeError:
-        logging.error(type(dataset))
+        logging.warning(f"cannot read the labels of {type(dataset)} from its metadata")
+
+
+def _draw_class_slices(array, n, n_slices, random_state=np.random):
+    """
+    Draw ``n_slices`` slices of ``n`` items from ``array`` the way successive ``InfiniteSliceIterator.get(n)`` calls
+    would: consecutive slices of a random permutation, moving to a new permutation when the tail is too short, and
+    tiling the permutation when ``array`` holds fewer than ``n`` items.
+
+    Args:
+        array (np.ndarray): the items to draw from.
+        n (int): number of items per slice.
+        n_slices (int): number of slices to draw.
+        random_state (optional): source of randomness exposing ``random(size)``, e.g. ``np.random``,
+            a ``np.random.RandomState`` or a ``np.random.Generator``. Defaults to ``np.random``.
+
+    Returns:
+        np.ndarray: array of shape ``(n_slices, n)``.
+    """
+    len_ = len(array)
+    slices_per_perm = max(len_ // n, 1)
+    n_perms = int(np.ceil(n_slices / slices_per_perm))
+    perms = array[np.argsort(random_state.random((n_perms, len_)), axis=1)]
+    if len_ < n:
+        perms = np.tile(perms, (1, int(np.ceil(n / len_))))
+    return perms[:, : slices_per_perm * n].reshape(-1, n)[:n_slices]
+
+
+def _build_alias_table(weights):
+    """
+    Build a Walker alias table (Vose's method) for drawing from a discrete distribution in O(1).
+
+    Args:
+        weights (np.ndarray): non-negative weights of the k outcomes, not necessarily normalized.
+
+    Returns:
+        tuple: ``(prob, alias)`` arrays of length k. Outcome ``i`` is kept with probability ``prob[i]``
+        and replaced by ``alias[i]`` otherwise.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(weights)
+    scaled = weights * n / np.sum(weights)
+    prob = np.ones(n, dtype=np.float64)
+    alias = np.arange(n, dtype=np.int64)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s, l_ = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l_
+        scaled[l_] -= 1.0 - scaled[s]
+        if scaled[l_] < 1.0:
+            small.append(l_)
+        else:
+            large.append(l_)
+    # leftovers are exactly 1 up to rounding errors
+    return prob, alias
+
+
+def _draw_alias(prob, alias, size, random_state=np.random):
+    """
+    Draw ``size`` outcomes from an alias table built by ``_build_alias_table``, using one uniform per draw.
+
+    Returns:
+        np.ndarray: int64 array of outcomes in ``[0, len(prob))``.
+    """
+    u = random_state.random(size) * len(prob)
+    column = np.minimum(u.astype(np.int64), len(prob) - 1)
+    return np.where(u - column < prob[column], column, alias[column])
 
 
 class InfiniteSliceIterator:
-    def __init__(self, array, class_):
+    def __init__(self, array, class_, random_state=np.random):
         assert type(array) is np.ndarray
         self.array = array
         self.i = 0
         self.class_ = class_
+        self.random_state = random_state
 
     def reset(self):
         self.i = 0
 
+    def restart(self, random_state):
+        """Restore the initial (sorted) order of the items and draw the next permutations from ``random_state``."""
+        self.array.sort()
+        self.reset()
+        self.random_state = random_state
+
     def get(self, n):
         len_ = len(self.array)
         # not enough element in 'array'
         if len_ < n:
             logging.debug(f"there are really few items in class {self.class_}")
             self.reset()
-            np.random.shuffle(self.array)
+            self.random_state.shuffle(self.array)
             mul = n // len_
             rest = n - mul * len_
             return np.concatenate((np.tile(self.array, mul), self.array[:rest]))
@@ -264,7 +1050,7 @@ class InfiniteSliceIterator:
             self.reset()
 
         if self.i == 0:
-            np.random.shuffle(self.array)
+            self.random_state.shuffle(self.array)
         i = self.i
         self.i += n
         return self.array[i : self.i]
@@ -0,0 +1,177 @@
+"""
+Stratified splitting of datasets into train/validation and few-shot labeled/unlabeled parts. The partitions are
+computed in one vectorized pass over the label array, and can be saved to disk so that later runs (e.g. the runs of a
+hyperparameter sweep) reload the same splits instead of drawing them again.
+"""
+
+import hashlib
+import logging
+import os
+
+import numpy as np
+import torch.utils.data
+
+from kale.loaddata.sampler import get_labels
+
+
+def stratified_partition(labels, n_first, random_state=None):
+    """
+    Randomly partition the samples of each class into a first and a second part. Samples with several labels (e.g. the
+    verb and noun classes of EPIC-Kitchens) are stratified on their first label.
+
+    Args:
+        labels (np.ndarray): the label of each sample, or the labels of each sample as the rows of a 2-D array.
+        n_first (callable): maps the array of class sizes to the array of the number of samples of each class in the
+            first part.
+        random_state (int or np.random.Generator, optional): the seed or the random generator. Defaults to None.
+
+    Returns:
+        tuple: (first, second), the sorted int64 indices of the samples in each part.
+    """
+    labels = np.asarray(labels)
+    labels = labels.reshape(len(labels), -1)[:, 0]
+    random_state = np.random.default_rng(random_state)
+    permutation = random_state.permutation(len(labels))
+    # shuffled samples, grouped by class: the first samples of each group go to the first part
+    order = permutation[np.argsort(labels[permutation], kind="stable")]
+    _, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    rank = np.arange(len(labels)) - np.repeat(starts, counts)
+    in_first = rank < np.repeat(n_first(counts), counts)
+    return np.sort(order[in_first]), np.sort(order[~in_first])
+
+
+def get_fingerprint(dataset, labels=None):
+    """
+    Fingerprint of a dataset, from its type, its size, its labels and what identifies its content: the indices of a
+    ``torch.utils.data.Subset`` in the fingerprint of its dataset, the data files (e.g. ``root`` or
+    ``annotationfile_path``) and split of the dataset, and its in-memory ``data`` array if it has one.
+
+    Args:
+        dataset (Dataset): the dataset.
+        labels (np.ndarray, optional): the labels of the dataset. Defaults to None (=> read with ``get_labels``).
+
+    Returns:
+        string: a hexadecimal digest.
+    """
+    if labels is None:
+        labels = _get_all_labels(dataset)
+    digest = hashlib.sha1(f"{type(dataset).__name__}:{len(dataset)}".encode())
+    digest.update(np.ascontiguousarray(labels).tobytes())
+    _update_identity(digest, dataset)
+    return digest.hexdigest()
+
+
+# attributes locating the data of a dataset, e.g. of the torchvision and video datasets
+_IDENTITY_ATTRIBUTES = ["root", "root_path", "annotationfile_path", "train", "split", "dataset_split", "image_modality"]
+
+
+def _update_identity(digest, dataset):
+    if isinstance(dataset, torch.utils.data.Subset):
+        digest.update(np.asarray(dataset.indices, dtype=np.int64).tobytes())
+        _update_identity(digest, dataset.dataset)
+        return
+    attributes = [(name, str(getattr(dataset, name))) for name in _IDENTITY_ATTRIBUTES if hasattr(dataset, name)]
+    digest.update(repr(attributes).encode())
+    data = getattr(dataset, "data", None)
+    if isinstance(data, torch.Tensor):
+        data = data.cpu().numpy()
+    if isinstance(data, np.ndarray):
+        digest.update(np.ascontiguousarray(data).tobytes())
+
+
+def _get_all_labels(dataset):
+    labels = get_labels(dataset)
+    if labels is None or len(labels) != len(dataset):
+        labels = [np.asarray(dataset[i][1]) for i in range(len(dataset))]
+    labels = np.asarray(labels)
+    # one label per sample, or one row of labels per sample
+    return labels.reshape(len(dataset), -1) if labels.ndim > 1 else labels.reshape(len(dataset))
+
+
+class StratifiedSplitter:
+    """
+    Stratified train/validation and few-shot splits of datasets, keeping the class proportions in each part.
+
+    With a ``cache_dir``, the indices of each split are saved to a small ``.npz`` file named after the dataset
+    fingerprint (see ``get_fingerprint``), the kind of split, its parameters and the seed, and are reloaded from it
+    when the same split of the same dataset is requested again.
+
+    Args:
+        seed (int, optional): seed of the random partitions. Defaults to 0.
+        cache_dir (string, optional): directory where the split indices are saved. Defaults to None (=> not saved).
+    """
+
+    def __init__(self, seed=0, cache_dir=None):
+        self._seed = seed
+        self._cache_dir = cache_dir
+
+    def _get_indices(self, dataset, kind, param, n_first):
+        labels = _get_all_labels(dataset)
+        path = None
+        if self._cache_dir is not None:
+            key = f"{get_fingerprint(dataset, labels)}-{kind}-{param}-{self._seed}"
+            path = os.path.join(self._cache_dir, f"split-{hashlib.sha1(key.encode()).hexdigest()}.npz")
+            if os.path.exists(path):
+                logging.debug(f"load the {kind} split from {path}")
+                with np.load(path) as indices:
+                    return indices["first"], indices["second"]
+
+        first, second = stratified_partition(labels, n_first, self._seed)
+        if path is not None:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, first=first, second=second)
+            os.replace(tmp_path, path)
+        return first, second
+
+    def train_val_split(self, dataset, val_ratio):
+        """
+        Split a dataset into non-overlapping training and validation datasets, with ``val_ratio`` of the samples of
+        each class in the validation dataset.
+
+        Returns:
+            tuple: (train, valid) subsets of the dataset.
+        """
+        valid, train = self._get_indices(
+            dataset, "train_val", val_ratio, lambda counts: np.round(counts * val_ratio).astype(np.int64)
+        )
+        return torch.utils.data.Subset(dataset, train), torch.utils.data.Subset(dataset, valid)
+
+    def few_shot_split(self, dataset, n_fewshot):
+        """
+        Split a dataset into labeled and unlabeled datasets, with ``n_fewshot`` labeled samples per class.
+
+        Args:
+            dataset (Dataset): the dataset to split.
+            n_fewshot (int): number of labeled samples per class. Must not exceed the size of the smallest class.
+
+        Returns:
+            tuple: (labeled, unlabeled) subsets of the dataset.
+        """
+
+        def n_first(counts):
+            if np.any(counts < n_fewshot):
+                raise ValueError(f"Cannot take {n_fewshot} labeled samples from classes of {counts.min()} samples")
+            return np.full(len(counts), n_fewshot)
+
+        labeled, unlabeled = self._get_indices(dataset, "few_shot", n_fewshot, n_first)
+        return torch.utils.data.Subset(dataset, labeled), torch.utils.data.Subset(dataset, unlabeled)
+
+
+def seeded_train_val_split(dataset, val_ratio, seed):
+    """
+    Randomly split a dataset into train and validation subsets, reproducibly.
+
+    Args:
+        dataset (Dataset): the dataset to split.
+        val_ratio (float): the ratio of the validation subset.
+        seed (int): seed of the split.
+
+    Returns:
+        tuple: the train and validation ``torch.utils.data.Subset``.
+    """
+    ntotal = len(dataset)
+    ntrain = int((1 - val_ratio) * ntotal)
+    return torch.utils.data.random_split(
+        dataset, [ntrain, ntotal - ntrain], generator=torch.Generator().manual_seed(seed)
+    )
@@ -0,0 +1,175 @@
+"""
+In-memory caching of transformed datasets: each (transformed) sample is computed once and kept in a contiguous tensor
+store, so that the following epochs read tensors instead of decoding and transforming the raw data again.
+"""
+
+import collections
+import logging
+
+import torch
+import torch.utils.data
+
+from kale.loaddata.dataset_access import DatasetAccess
+from kale.loaddata.sampler import get_labels
+
+
+class TensorCacheDataset(torch.utils.data.Dataset):
+    """
+    Cache of the ``(input, label)`` samples of a dataset in contiguous tensors. Samples are cached the first time they
+    are read, so the transform of the wrapped dataset must be deterministic, e.g. resizing and normalization but no
+    random augmentation. Random augmentation can be applied to the cached inputs with ``transform``.
+
+    When the budget ``max_bytes`` is smaller than the whole dataset, the store holds as many samples as fit in it, and
+    the least recently used samples are evicted to make room for new ones.
+
+    With ``shared_memory``, the whole dataset is cached when the wrapper is created and the store is moved to shared
+    memory, so that data loader worker processes read it without copying it. Otherwise, each worker process fills its
+    own copy of the cache.
+
+    Args:
+        dataset (Dataset): dataset returning ``(input, label)`` samples, with tensor inputs of constant shape.
+        max_bytes (int, optional): memory budget of the cached inputs, in bytes. Defaults to None (=> no limit).
+        shared_memory (bool, optional): whether to cache the whole dataset at once in shared memory. Defaults to False.
+        transform (callable, optional): transform applied to copies of the cached inputs, each time they are read,
+            so in-place transforms do not modify the cache. Defaults to None.
+    """
+
+    def __init__(self, dataset, max_bytes=None, shared_memory=False, transform=None):
+        self.dataset = dataset
+        self.transform = transform
+        self.n_hits = 0
+        self.n_misses = 0
+        self._max_bytes = max_bytes
+        self._shared_memory = shared_memory
+        self._inputs = None
+        self._labels = None
+        self._label_is_int = False
+        # slot of each sample in the store, -1 when it is not cached
+        self._slots = None
+        # cached samples (index -> slot) from the least to the most recently used, when evicting
+        self._lru = None
+        if shared_memory:
+            self.materialize()
+
+    def __len__(self):
+        return len(self.dataset)
+
+    @property
+    def targets(self):
+        """The labels of the wrapped dataset, read from its metadata (see ``kale.loaddata.sampler.get_labels``)."""
+        labels = get_labels(self.dataset)
+        if labels is None:
+            raise AttributeError(f"cannot read the labels of {type(self.dataset)}")
+        return labels
+
+    @property
+    def n_cached(self):
+        """Number of samples currently in the cache."""
+        return 0 if self._slots is None else int((self._slots >= 0).sum())
+
+    def _allocate(self, x, y):
+        if not isinstance(x, torch.Tensor):
+            raise ValueError(f"Only tensor inputs can be cached, got {type(x)}")
+        n_samples = len(self.dataset)
+        n_slots = n_samples
+        if self._max_bytes is not None:
+            item_bytes = x.element_size() * x.nelement()
+            n_slots = min(n_samples, self._max_bytes // item_bytes)
+            if n_slots == 0:
+                raise ValueError(f"A budget of {self._max_bytes} bytes cannot hold a sample of {item_bytes} bytes")
+        if self._shared_memory and n_slots < n_samples:
+            raise ValueError(f"A shared cache must hold the whole dataset, only {n_slots}/{n_samples} samples fit")
+        logging.debug(f"caching {n_slots}/{n_samples} samples of {type(self.dataset)}")
+
+        self._label_is_int = not isinstance(y, torch.Tensor)
+        y = torch.as_tensor(y)
+        self._inputs = torch.empty((n_slots, *x.shape), dtype=x.dtype)
+        self._labels = torch.empty((n_slots, *y.shape), dtype=y.dtype)
+        self._slots = torch.full((n_samples,), -1, dtype=torch.int64)
+        if n_slots < n_samples:
+            self._lru = collections.OrderedDict()
+        if self._shared_memory:
+            for tensor in (self._inputs, self._labels, self._slots):
+                tensor.share_memory_()
+
+    def _insert(self, index, x, y):
+        if self._inputs is None:
+            self._allocate(x, y)
+        if self._lru is None:
+            slot = index
+        elif len(self._lru) < len(self._inputs):
+            slot = len(self._lru)
+        else:
+            evicted, slot = self._lru.popitem(last=False)
+            self._slots[evicted] = -1
+        self._inputs[slot] = x
+        self._labels[slot] = torch.as_tensor(y)
+        self._slots[index] = slot
+        if self._lru is not None:
+            self._lru[index] = slot
+        return slot
+
+    def _get_cached(self, index):
+        if index < 0:
+            index += len(self)
+        slot = -1 if self._slots is None else int(self._slots[index])
+        if slot < 0:
+            self.n_misses += 1
+            slot = self._insert(index, *self.dataset[index])
+        else:
+            self.n_hits += 1
+            if self._lru is not None:
+                self._lru.move_to_end(index)
+        x, y = self._inputs[slot], self._labels[slot]
+        if self._lru is not None or self.transform is not None:
+            # the slot may be reused before the batch is collated, and the transform may modify its input in place
+            x, y = x.clone(), y.clone()
+        return x, y.item() if self._label_is_int else y
+
+    def __getitem__(self, index):
+        x, y = self._get_cached(index)
+        if self.transform is not None:
+            x = self.transform(x)
+        return x, y
+
+    def materialize(self):
+        """Cache all the samples that fit in the budget, e.g. before starting worker processes."""
+        for index in range(len(self)):
+            if self._lru is not None and len(self._lru) == len(self._inputs):
+                break
+            if self._slots is None or self._slots[index] < 0:
+                self._insert(index, *self.dataset[index])
+        logging.debug(f"materialized {self.n_cached} samples of {type(self.dataset)}")
+
+
+class CachedDatasetAccess(DatasetAccess):
+    """
+    Access to the splits of a dataset through ``TensorCacheDataset`` caches. The cache of each split is created once
+    and returned by all the following calls, so the samples are transformed once for the whole training.
+
+    Args:
+        access (DatasetAccess): the dataset access to cache, with deterministic transforms.
+        max_bytes (int, optional): memory budget of the cache of each split, in bytes. Defaults to None (=> no limit).
+        shared_memory (bool, optional): whether to cache each split at once in shared memory, see
+            ``TensorCacheDataset``. Defaults to False.
+    """
+
+    def __init__(self, access, max_bytes=None, shared_memory=False):
+        super().__init__(n_classes=access.n_classes())
+        self._access = access
+        self._max_bytes = max_bytes
+        self._shared_memory = shared_memory
+        self._datasets = {}
+
+    def _get_split(self, split, get_dataset):
+        if split not in self._datasets:
+            self._datasets[split] = TensorCacheDataset(
+                get_dataset(), max_bytes=self._max_bytes, shared_memory=self._shared_memory
+            )
+        return self._datasets[split]
+
+    def get_train(self):
+        return self._get_split("train", self._access.get_train)
+
+    def get_test(self):
+        return self._get_split("test", self._access.get_test)
@@ -26,11 +26,13 @@ class USPS(data.Dataset):
         transform (callable, optional): A function/transform that takes in
             an PIL image and returns a transformed version.
             E.g, ``transforms.RandomCrop``
+        batch_transform (callable, optional): the batched counterpart of ``transform`` used by ``get_batch``, see
+            ``kale.prepdata.image_transform.get_batch_transform``. Defaults to None.
     """
 
     url = "https://raw.githubusercontent.com/mingyuliutw/CoGAN/master/cogan_pytorch/data/uspssample/usps_28x28.pkl"
 
-    def __init__(self, root, train=True, transform=None, download=False):
+    def __init__(self, root, train=True, transform=None, download=False, batch_transform=None):
         """Init USPS dataset."""
         # init params
         self.root = os.path.expanduser(root)
@@ -38,6 +40,7 @@ class USPS(data.Dataset):
         self.train = train
         # Num of Train = 7438, Num ot Test 1860
         self.transform = transform
+        self.batch_transform = batch_transform
         self.dataset_size = None
 
         # download dataset.
@@ -71,6 +74,18 @@ class USPS(data.Dataset):
         # label = torch.FloatTensor([label.item()])
         return img, label
 
+    def get_batch(self, indices):
+        """Get the images and targets of a whole batch at once, with ``batch_transform``.
+        Args:
+            indices (list): Indices of the batch
+        Returns:
+            tuple: (images, targets), batched like the collated outputs of ``__getitem__``.
+        """
+        if self.batch_transform is None:
+            raise ValueError("A batch_transform is required to get whole batches")
+        imgs = torch.from_numpy(np.ascontiguousarray(self.data[indices])).permute(0, 3, 1, 2).float()
+        return self.batch_transform(imgs), self.targets[indices].view(-1, 1)
+
     def __len__(self):
         """Return size of dataset."""
         return self.dataset_size
@@ -12,11 +12,11 @@ import os
 from copy import deepcopy
 from enum import Enum
 
-import torch
-
 import kale.prepdata.video_transform as video_transform
 from kale.loaddata.dataset_access import DatasetAccess
+from kale.loaddata.splits import seeded_train_val_split
 from kale.loaddata.video_datasets import BasicVideoDataset, EPIC
+from kale.loaddata.videos import JointVideoDataset, MultiViewVideoDataset
 
 
 def get_image_modality(image_modality):
@@ -210,10 +210,24 @@ class VideoDatasetAccess(DatasetAccess):
         n_classes (int): number of class
         transform_kind (string): types of video transforms
         seed: (int): seed value set manually.
+        decode_size (int, optional): minimum size of the shorter side of the decoded frames, see
+            ``kale.loaddata.videos.VideoFrameDataset``. Defaults to None (=> frames decoded at full resolution).
+        annotation_cache_dir (string, optional): directory where the parsed annotations are saved, see
+            ``kale.loaddata.video_datasets.load_annotations``. Defaults to None (=> not saved).
     """
 
     def __init__(
-        self, data_path, train_list, test_list, image_modality, frames_per_segment, n_classes, transform_kind, seed
+        self,
+        data_path,
+        train_list,
+        test_list,
+        image_modality,
+        frames_per_segment,
+        n_classes,
+        transform_kind,
+        seed,
+        decode_size=None,
+        annotation_cache_dir=None,
     ):
         super().__init__(n_classes)
         self._data_path = data_path
@@ -221,19 +235,30 @@ class VideoDatasetAccess(DatasetAccess):
         self._test_list = test_list
         self._image_modality = image_modality
         self._frames_per_segment = frames_per_segment
+        self._transform_kind = transform_kind
         self._transform = video_transform.get_transform(transform_kind, self._image_modality)
         self._seed = seed
+        self._decode_size = decode_size
+        self._annotation_cache_dir = annotation_cache_dir
 
     def get_train_val(self, val_ratio):
         """Get the train and validation dataset with the fixed random split. This is used for joint input like RGB and
         optical flow, which will call `get_train_val` twice. Fixing the random seed here can keep the seeds for twice
         the same."""
-        train_dataset = self.get_train()
-        ntotal = len(train_dataset)
-        ntrain = int((1 - val_ratio) * ntotal)
-        return torch.utils.data.random_split(
-            train_dataset, [ntrain, ntotal - ntrain], generator=torch.Generator().manual_seed(self._seed)
-        )
+        return seeded_train_val_split(self.get_train(), val_ratio, self._seed)
+
+    def get_test_views(self, n_clips, n_crops=1):
+        """Get the test dataset with ``n_clips`` clips times ``n_crops`` spatial crops of each video, see
+        ``kale.loaddata.videos.MultiViewVideoDataset``."""
+        return MultiViewVideoDataset(self._get_multi_crop_test(n_crops), n_clips)
+
+    def _get_multi_crop_test(self, n_crops):
+        test_dataset = self.get_test()
+        if n_crops > 1:
+            test_dataset.transform = video_transform.get_transform(
+                self._transform_kind, self._image_modality, n_crops=n_crops
+            )["test"]
+        return test_dataset
 
 
 class EPICDatasetAccess(VideoDatasetAccess):
@@ -252,6 +277,8 @@ class EPICDatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="train",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
 
     def get_test(self):
@@ -267,6 +294,8 @@ class EPICDatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="test",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
 
 
@@ -286,6 +315,8 @@ class GTEADatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="train",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
 
     def get_test(self):
@@ -301,6 +332,8 @@ class GTEADatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="test",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
 
 
@@ -320,6 +353,8 @@ class ADLDatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="train",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
 
     def get_test(self):
@@ -335,6 +370,8 @@ class ADLDatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="test",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
 
 
@@ -354,6 +391,8 @@ class KITCHENDatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="train",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
 
     def get_test(self):
@@ -369,4 +408,43 @@ class KITCHENDatasetAccess(VideoDatasetAccess):
             image_modality=self._image_modality,
             dataset_split="test",
             n_classes=self._n_classes,
+            decode_size=self._decode_size,
+            annotation_cache_dir=self._annotation_cache_dir,
         )
+
+
+class JointVideoDatasetAccess(DatasetAccess):
+    """
+    Access to the RGB and optical flow frames of the same videos, loaded together by
+    ``kale.loaddata.videos.JointVideoDataset``.
+
+    Args:
+        rgb_access (VideoDatasetAccess): access to the RGB frames.
+        flow_access (VideoDatasetAccess): access to the optical flow frames, with the same annotation files.
+        seed: (int): seed of the train/validation split.
+    """
+
+    def __init__(self, rgb_access, flow_access, seed):
+        super().__init__(n_classes=rgb_access.n_classes())
+        self._rgb_access = rgb_access
+        self._flow_access = flow_access
+        self._seed = seed
+
+    def get_train(self):
+        return JointVideoDataset(self._rgb_access.get_train(), self._flow_access.get_train())
+
+    def get_test(self):
+        return JointVideoDataset(self._rgb_access.get_test(), self._flow_access.get_test())
+
+    def get_test_views(self, n_clips, n_crops=1):
+        """Get the test dataset with the same views of the RGB and flow frames, see
+        ``VideoDatasetAccess.get_test_views``."""
+        return MultiViewVideoDataset(
+            JointVideoDataset(
+                self._rgb_access._get_multi_crop_test(n_crops), self._flow_access._get_multi_crop_test(n_crops)
+            ),
+            n_clips,
+        )
+
+    def get_train_val(self, val_ratio):
+        return seeded_train_val_split(self.get_train(), val_ratio, self._seed)
@@ -1,12 +1,109 @@
+import hashlib
 import logging
 import math
 import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-from PIL import Image
 
-from kale.loaddata.videos import VideoFrameDataset, VideoRecord
+from kale.loaddata.videos import VideoAnnotations, VideoFrameDataset
+
+EPIC_PARTICIPANTS = ("P01", "P08", "P22")
+
+
+def _to_columns(paths, start_frames, end_frames, labels, mask):
+    # each distinct path is stored once, and the samples refer to it by its index
+    path_ids, unique_paths = pd.factorize(paths[mask])
+    return {
+        "paths": np.asarray(unique_paths, dtype=str),
+        "path_ids": path_ids.astype(np.int64),
+        "start_frames": np.asarray(start_frames[mask], dtype=np.int64),
+        "end_frames": np.asarray(end_frames[mask], dtype=np.int64),
+        "labels": np.asarray(labels[mask], dtype=np.int64),
+    }
+
+
+def _to_rows(columns):
+    paths = columns["paths"][columns["path_ids"]]
+    return list(zip(paths.tolist(), *(columns[key].tolist() for key in ("start_frames", "end_frames", "labels"))))
+
+
+def read_basic_annotations(annotation_path, n_classes):
+    """
+    Read the annotations of GTEA, ADL and KITCHEN into columns, keeping the samples whose label is in [0, n_classes).
+
+    Args:
+        annotation_path (string): The pickled annotation DataFrame.
+        n_classes (int): The number of classes.
+
+    Returns:
+        dict: The arrays of the distinct "paths" of the videos, and the "path_ids", "start_frames", "end_frames" and
+            "labels" of the samples, see VideoAnnotations.
+    """
+    values = pd.read_pickle(annotation_path).values
+    # the frame ids and labels are stored as strings
+    start_frames, end_frames, labels = (pd.to_numeric(values[:, column]) for column in (1, 2, 5))
+    mask = (0 <= labels) & (labels < n_classes)
+    return _to_columns(values[:, 0].astype(str), start_frames, end_frames, labels, mask)
+
+
+def read_epic_annotations(annotation_path, n_classes, min_frames, participants=EPIC_PARTICIPANTS):
+    """
+    Read the annotations of EPIC-Kitchen into columns, keeping the samples of the given participants whose label is
+    in [0, n_classes) and which have at least min_frames frames.
+
+    Args:
+        annotation_path (string): The pickled annotation DataFrame.
+        n_classes (int): The number of classes.
+        min_frames (int): The minimum number of frames of a sample.
+        participants (tuple, optional): The ids of the participants. Defaults to EPIC_PARTICIPANTS.
+
+    Returns:
+        dict: The columns of the samples, see read_basic_annotations.
+    """
+    values = pd.read_pickle(annotation_path).values
+    participant_ids = values[:, 1].astype(str)
+    start_frames, end_frames, labels = (values[:, column].astype(np.int64) for column in (6, 7, 9))
+    mask = np.isin(participant_ids, list(participants))
+    mask &= (0 <= labels) & (labels < n_classes)
+    mask &= end_frames - start_frames + 1 >= min_frames
+    paths = np.char.add(np.char.add(participant_ids, os.sep), values[:, 2].astype(str))
+    return _to_columns(paths, start_frames, end_frames, labels, mask)
+
+
+def load_annotations(annotation_path, reader, cache_dir=None, **params):
+    """
+    Read the annotation columns of a dataset with ``reader(annotation_path, **params)``.
+
+    With a ``cache_dir``, the columns are saved to a ``.npz`` file named after the path, size and modification time of
+    the annotation file, the reader and its parameters, and are reloaded from it while the annotation file is unchanged.
+
+    Args:
+        annotation_path (string): The annotation file.
+        reader (callable): The reader of the annotation file, e.g. read_epic_annotations.
+        cache_dir (string, optional): The directory where the columns are saved. Defaults to None (=> not saved).
+
+    Returns:
+        dict: The columns of the samples, see read_basic_annotations.
+    """
+    if cache_dir is None:
+        return reader(annotation_path, **params)
+    annotation_path = os.path.abspath(annotation_path)
+    stat = os.stat(annotation_path)
+    key = f"{annotation_path}-{stat.st_size}-{stat.st_mtime_ns}-{reader.__name__}-{sorted(params.items())}"
+    path = os.path.join(cache_dir, f"annotations-{hashlib.sha1(key.encode()).hexdigest()}.npz")
+    if os.path.exists(path):
+        logging.debug(f"load the annotations of {annotation_path} from {path}")
+        with np.load(path) as columns:
+            return dict(columns)
+
+    columns = reader(annotation_path, **params)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **columns)
+    os.replace(tmp_path, path)
+    return columns
 
 
 class BasicVideoDataset(VideoFrameDataset):
@@ -27,6 +124,11 @@ class BasicVideoDataset(VideoFrameDataset):
                         a random(True) location inside the segment range.
         test_mode (bool): Whether this is a test dataset. If so, chooses frames from segments with random_shift=False.
         n_classes (int): The number of classes.
+        frame_archive (string): The root folder of an archive of the video frames, see VideoFrameDataset.
+        frame_cache (FrameCache): A cache of the decoded frames, see VideoFrameDataset.
+        decode_threads (int): The number of threads decoding the frames of a sample, see VideoFrameDataset.
+        decode_size (int): The minimum size of the shorter side of the decoded frames, see VideoFrameDataset.
+        annotation_cache_dir (string): The directory where the parsed annotations are saved, see load_annotations.
     """
 
     def __init__(
@@ -42,11 +144,17 @@ class BasicVideoDataset(VideoFrameDataset):
         random_shift: bool = True,
         test_mode: bool = False,
         n_classes: int = 8,
+        frame_archive: str = None,
+        frame_cache=None,
+        decode_threads: int = 0,
+        decode_size: int = None,
+        annotation_cache_dir: str = None,
     ):
         self.root_path = Path(root_path)
         self.image_modality = image_modality
         self.dataset = dataset_split
         self.n_classes = n_classes
+        self.annotation_cache_dir = annotation_cache_dir
         self.img_path = self.root_path.joinpath(self.image_modality)
         super(BasicVideoDataset, self).__init__(
             root_path,
@@ -58,10 +166,24 @@ class BasicVideoDataset(VideoFrameDataset):
             transform,
             random_shift,
             test_mode,
+            frame_archive,
+            frame_cache,
+            decode_threads,
+            decode_size,
         )
 
     def _parse_list(self):
-        self.video_list = [VideoRecord(x, self.img_path) for x in list(self.make_dataset())]
+        self.video_list = VideoAnnotations(**self.read_annotations(), root_datapath=self.img_path)
+        logging.info("Number of {:5} action segments: {}".format(self.dataset, len(self.video_list)))
+
+    def read_annotations(self):
+        """
+        Load the annotation columns from the list file, keeping the samples of the first n_classes classes.
+        Different datasets correspond to a different number of classes.
+        """
+        return load_annotations(
+            self.annotationfile_path, read_basic_annotations, self.annotation_cache_dir, n_classes=self.n_classes
+        )
 
     def make_dataset(self):
         """
@@ -71,21 +193,12 @@ class BasicVideoDataset(VideoFrameDataset):
         Returns:
             data (list): list of (video_name, start_frame, end_frame, label)
         """
-
-        data = []
-        i = 0
-        input_file = pd.read_pickle(self.annotationfile_path)
-        for line in input_file.values:
-            if 0 <= eval(line[5]) < self.n_classes:
-                data.append((line[0], eval(line[1]), eval(line[2]), eval(line[5])))
-                i = i + 1
-        logging.info("Number of {:5} action segments: {}".format(self.dataset, i))
-        return data
+        return _to_rows(self.read_annotations())
 
 
 class EPIC(VideoFrameDataset):
     """
-    Dataset for EPIC-Kitchen.
+    Dataset for EPIC-Kitchen. See BasicVideoDataset for the arguments.
     """
 
     def __init__(
@@ -101,11 +214,17 @@ class EPIC(VideoFrameDataset):
         random_shift: bool = True,
         test_mode: bool = False,
         n_classes: int = 8,
+        frame_archive: str = None,
+        frame_cache=None,
+        decode_threads: int = 0,
+        decode_size: int = None,
+        annotation_cache_dir: str = None,
     ):
         self.root_path = Path(root_path)
         self.image_modality = image_modality
         self.dataset = dataset_split
         self.n_classes = n_classes
+        self.annotation_cache_dir = annotation_cache_dir
         self.img_path = self.root_path.joinpath(self.image_modality, self.dataset)
         super(EPIC, self).__init__(
             root_path,
@@ -117,19 +236,35 @@ class EPIC(VideoFrameDataset):
             transform,
             random_shift,
             test_mode,
+            frame_archive,
+            frame_cache,
+            decode_threads,
+            decode_size,
         )
 
     def _parse_list(self):
-        self.video_list = [VideoRecord(x, self.img_path) for x in list(self.make_dataset())]
+        self.video_list = VideoAnnotations(**self.read_annotations(), root_datapath=self.img_path)
+        logging.info("Number of {:5} action segments: {}".format(self.dataset, len(self.video_list)))
 
-    def _load_image(self, directory, idx):
+    def read_annotations(self):
+        """
+        Load the annotation columns from the EPIC-Kitchen list file, keeping the samples of the first n_classes
+        classes with at least frames_per_segment frames.
+        """
+        return load_annotations(
+            self.annotationfile_path,
+            read_epic_annotations,
+            self.annotation_cache_dir,
+            n_classes=self.n_classes,
+            min_frames=self.frames_per_segment,
+        )
+
+    def _get_image_files(self, idx):
         if self.image_modality == "rgb":
-            return [Image.open(os.path.join(directory, self.imagefile_template.format(idx))).convert("RGB")]
+            return [(self.imagefile_template.format(idx), "RGB")]
         elif self.image_modality == "flow":
             idx = math.ceil(idx / 2) - 1 if idx > 2 else 1
-            u_img = Image.open(os.path.join(directory, "u", self.imagefile_template.format(idx))).convert("L")
-            v_img = Image.open(os.path.join(directory, "v", self.imagefile_template.format(idx))).convert("L")
-            return [u_img, v_img]
+            return [(os.path.join(channel, self.imagefile_template.format(idx)), "L") for channel in ["u", "v"]]
         else:
             raise RuntimeError("Input modality is not in [rgb, flow, joint]. Current is {}".format(self.image_modality))
 
@@ -138,16 +273,4 @@ class EPIC(VideoFrameDataset):
         Load data from the EPIC-Kitchen list file and make them into the united format.
         Because the original list files are not the same, inherit from class BasicVideoDataset and be modified.
         """
-
-        data = []
-        i = 0
-        input_file = pd.read_pickle(self.annotationfile_path)
-        for line in input_file.values:
-            if line[1] in ["P01", "P08", "P22"]:
-                if 0 <= line[9] < self.n_classes:
-                    if line[7] - line[6] + 1 >= self.frames_per_segment:
-                        label = line[9]
-                        data.append((os.path.join(line[1], line[2]), line[6], line[7], label))
-                        i = i + 1
-        logging.info("Number of {:5} action segments: {}".format(self.dataset, i))
-        return data
+        return _to_rows(self.read_annotations())
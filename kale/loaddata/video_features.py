@@ -0,0 +1,239 @@
+"""
+Offline features of video clips for training with a frozen backbone, e.g. the I3D or R3D_18 feature extractor of
+``kale.embed.video_feature_extractor.get_video_feat_extractor``. The backbone is run once over the clips of a video
+dataset, and their features are written to a memory-mapped ``.npy`` store, from which the classifier and the domain
+critic (e.g. ``ClassNetVideo`` and ``DomainNetVideo``) are trained without decoding the videos at each epoch.
+"""
+
+import hashlib
+import logging
+import os
+
+import numpy as np
+import torch
+import torch.utils.data
+
+from kale.loaddata.dataset_access import DatasetAccess
+from kale.loaddata.splits import get_fingerprint, seeded_train_val_split
+from kale.utils.seed import get_seed
+
+
+def get_clip_features_key(dataset, backbone_name, n_views):
+    """
+    Key of the features of the clips of a video dataset, from the fingerprint of the dataset (see
+    ``kale.loaddata.splits.get_fingerprint``), its clip sampling configuration, the backbone and the number of views.
+
+    Args:
+        dataset (VideoFrameDataset): the video dataset.
+        backbone_name (string): the name of the backbone and of its weights.
+        n_views (int): the number of views of each clip.
+
+    Returns:
+        string: a hexadecimal digest.
+    """
+    config = [
+        get_fingerprint(dataset, np.asarray(dataset.targets)),
+        str(dataset.annotationfile_path),
+        dataset.image_modality,
+        dataset.num_segments,
+        dataset.frames_per_segment,
+        dataset.imagefile_template,
+        dataset.random_shift and not dataset.test_mode,
+        repr(dataset.transform),
+        backbone_name,
+        n_views,
+    ]
+    return hashlib.sha1(repr(config).encode()).hexdigest()
+
+
+@torch.no_grad()
+def extract_clip_features(backbone, dataset, path, n_views=1, batch_size=16, num_workers=0, device=None):
+    """
+    Run a frozen backbone over the clips of a video dataset, and save their flattened features to a ``.npy`` file of
+    shape ``(n_views, len(dataset), feature_dim)``. Each view is a pass over the dataset, so that the views of a clip
+    differ by their random segments and crops when the dataset samples them randomly (e.g. for training). The file
+    is written to a temporary file first, and only appears at ``path`` when complete.
+
+    Args:
+        backbone (torch.nn.Module): the feature extractor of one modality, e.g. ``feature_network["rgb"]`` of
+            ``get_video_feat_extractor``. It is run in evaluation mode.
+        dataset (VideoFrameDataset): the video dataset.
+        path (string): the path of the ``.npy`` file.
+        n_views (int, optional): the number of views of each clip. Defaults to 1.
+        batch_size (int, optional): the number of clips run through the backbone at once. Defaults to 16.
+        num_workers (int, optional): how many subprocesses to use for data loading. Defaults to 0.
+        device (torch.device, optional): the device of the backbone. Defaults to None (=> the clips are not moved).
+    """
+    if len(dataset) == 0:
+        raise ValueError(f"Cannot extract the features of an empty dataset to {path}")
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+    training = backbone.training
+    backbone.eval()
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    features = None
+    try:
+        for view in range(n_views):
+            start = 0
+            for x, _ in loader:
+                batch_features = backbone(x.to(device)).flatten(1).cpu().numpy()
+                if features is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                    shape = (n_views, len(dataset), batch_features.shape[1])
+                    features = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=shape)
+                features[view, start : start + len(batch_features)] = batch_features
+                start += len(batch_features)
+        features.flush()
+        del features
+        os.replace(tmp_path, path)
+    finally:
+        backbone.train(training)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ClipFeatureDataset(torch.utils.data.Dataset):
+    """
+    Features of video clips, read from a store written by ``extract_clip_features``. ``self[index]`` is the
+    ``(features, label)`` pair of a clip, whose features are those of a random view of the clip when there are several.
+    The store is memory-mapped, and ``get_batch(indices)`` reads the features of a whole batch at once, see
+    ``kale.loaddata.sampler.BatchedFetchDataset``.
+
+    The views are drawn from a generator seeded by ``seed``. Each data loader worker process draws them from its own
+    generator, seeded by ``seed`` and the seed of the worker, so that the workers and the epochs draw different views.
+
+    Args:
+        path (string): the path of the ``.npy`` store.
+        labels (np.ndarray): the label of each clip.
+        seed (int or np.random.Generator, optional): seed of the random views. Defaults to None (=> drawn from the
+            global numpy random state).
+    """
+
+    def __init__(self, path, labels, seed=None):
+        self.path = path
+        self.labels = np.asarray(labels)
+        self._seed = get_seed(seed)
+        self._features = None
+        self._random_state = None
+        if self.features.shape[1] != len(self.labels):
+            raise ValueError(f"The store has the features of {self.features.shape[1]} clips, not {len(self.labels)}")
+
+    @property
+    def features(self):
+        """The memory-mapped array of features, of shape ``(n_views, n_clips, feature_dim)``."""
+        # each process maps the store itself
+        if self._features is None:
+            self._features = np.load(self.path, mmap_mode="r")
+        return self._features
+
+    @property
+    def targets(self):
+        return self.labels
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_features"] = None
+        state["_random_state"] = None
+        return state
+
+    def _get_views(self, size=None):
+        if self._random_state is None:
+            worker_info = torch.utils.data.get_worker_info()
+            seed = self._seed if worker_info is None else [self._seed, worker_info.seed]
+            self._random_state = np.random.default_rng(seed)
+        return self._random_state.integers(self.features.shape[0], size=size)
+
+    def __getitem__(self, index):
+        features = np.array(self.features[self._get_views(), index])
+        return torch.from_numpy(features), self.labels[index].tolist()
+
+    def get_batch(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        features = np.asarray(self.features[self._get_views(len(indices)), indices])
+        return torch.from_numpy(features), torch.from_numpy(self.labels[indices])
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class ClipFeatureDatasetAccess(DatasetAccess):
+    """
+    Access to the features of the clips of a video dataset access, extracted by a frozen backbone the first time each
+    split is requested, and read from ``cache_dir`` afterwards (see ``get_clip_features_key``).
+
+    Args:
+        video_access (VideoDatasetAccess): the access to the video frames.
+        backbone (torch.nn.Module): the frozen feature extractor, see ``extract_clip_features``.
+        backbone_name (string): the name of the backbone and of its weights, in the key of the features.
+        cache_dir (string): the directory of the feature stores.
+        seed (int): seed of the train/validation split and of the random training views.
+        n_train_views (int, optional): the number of views of each training clip. Defaults to 1.
+        batch_size (int, optional): see ``extract_clip_features``. Defaults to 16.
+        num_workers (int, optional): see ``extract_clip_features``. Defaults to 0.
+        device (torch.device, optional): see ``extract_clip_features``. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        video_access,
+        backbone,
+        backbone_name,
+        cache_dir,
+        seed,
+        n_train_views=1,
+        batch_size=16,
+        num_workers=0,
+        device=None,
+    ):
+        super().__init__(n_classes=video_access.n_classes())
+        self._video_access = video_access
+        self._backbone = backbone
+        self._backbone_name = backbone_name
+        self._cache_dir = cache_dir
+        self._seed = seed
+        self._n_train_views = n_train_views
+        self._extract_params = {"batch_size": batch_size, "num_workers": num_workers, "device": device}
+
+    def _get_features(self, dataset, n_views):
+        key = get_clip_features_key(dataset, self._backbone_name, n_views)
+        path = os.path.join(self._cache_dir, f"features-{key}.npy")
+        if not os.path.exists(path):
+            logging.info(f"extract the features of {len(dataset)} clips to {path}")
+            extract_clip_features(self._backbone, dataset, path, n_views, **self._extract_params)
+        return ClipFeatureDataset(path, dataset.targets, self._seed)
+
+    def get_train(self):
+        return self._get_features(self._video_access.get_train(), self._n_train_views)
+
+    def get_test(self):
+        return self._get_features(self._video_access.get_test(), 1)
+
+    def get_train_val(self, val_ratio):
+        return seeded_train_val_split(self.get_train(), val_ratio, self._seed)
+
+
+def get_feature_access_dict(access_dict, feature_network, backbone_name, cache_dir, seed, **params):
+    """
+    Wrap the video dataset accesses of each modality, e.g. returned by ``VideoDataset.get_source_target``, into
+    accesses to the features of their clips.
+
+    Args:
+        access_dict (dict): the ``VideoDatasetAccess`` of each modality ("rgb" and "flow"), or None.
+        feature_network (dict): the frozen feature extractor of each modality, see ``get_video_feat_extractor``.
+        backbone_name (string): see ``ClipFeatureDatasetAccess``.
+        cache_dir (string): see ``ClipFeatureDatasetAccess``.
+        seed (int): see ``ClipFeatureDatasetAccess``.
+        params: the other arguments of ``ClipFeatureDatasetAccess``.
+
+    Returns:
+        dict: the ``ClipFeatureDatasetAccess`` of each modality, or None.
+    """
+    return {
+        modality: (
+            None
+            if access is None
+            else ClipFeatureDatasetAccess(
+                access, feature_network[modality], f"{backbone_name}-{modality}", cache_dir, seed, **params
+            )
+        )
+        for modality, access in access_dict.items()
+    }
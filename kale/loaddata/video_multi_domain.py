@@ -10,10 +10,9 @@ import logging
 import numpy as np
 from sklearn.utils import check_random_state
 
-from kale.loaddata.dataset_access import get_class_subset
 from kale.loaddata.multi_domain import DatasetSizeType, MultiDomainDatasets, WeightingType
 from kale.loaddata.sampler import FixedSeedSamplingConfig, MultiDataLoader
-from kale.loaddata.video_access import get_image_modality
+from kale.loaddata.video_access import get_image_modality, JointVideoDatasetAccess
 
 
 class VideoMultiDomainDatasets(MultiDomainDatasets):
@@ -31,6 +30,13 @@ class VideoMultiDomainDatasets(MultiDomainDatasets):
         n_fewshot=None,
         random_state=None,
         class_ids=None,
+        num_workers=0,
+        n_prefetch=0,
+        infinite_loaders=False,
+        distributed=False,
+        splitter=None,
+        epoch_size=None,
+        joint_loading=False,
     ):
         """The class controlling how the source and target domains are iterated over when the input is joint.
             Inherited from MultiDomainDatasets.
@@ -40,6 +46,22 @@ class VideoMultiDomainDatasets(MultiDomainDatasets):
             image_modality (string): image type (RGB or Optical Flow)
             seed (int): seed value set manually.
             class_ids (list, optional): List of chosen subset of class ids. Defaults to None (=> All Classes).
+            num_workers (int, optional): Number of (persistent) worker processes of each domain loader.
+                Defaults to 0 (=> data loaded in the main process).
+            n_prefetch (int, optional): Number of batches fetched ahead for each domain by a background thread.
+                Defaults to 0 (=> no prefetching).
+            infinite_loaders (bool, optional): Whether each domain loader is an endless stream kept across
+                wrap-arounds and epochs. Defaults to False.
+            distributed (bool, optional): Whether each process of a distributed run samples its own share of the
+                batches of each epoch. Defaults to False.
+            splitter (StratifiedSplitter, optional): How to split the train/validation datasets. Defaults to None
+                (=> ``get_train_val`` of the accessors).
+            epoch_size (int or float, optional): Number of batches, samples or seconds of a training epoch, for the
+                "batches", "samples" or "time" size types. Defaults to None.
+            joint_loading (bool, optional): Whether, for the joint image modality, the RGB and optical flow frames of
+                each video are sampled once and loaded together (see ``kale.loaddata.videos.JointVideoDataset``),
+                with one loader per domain instead of one per domain and modality. The batches keep the layout of
+                separate RGB and flow loaders. Defaults to False.
         """
 
         self._image_modality = image_modality
@@ -55,22 +77,29 @@ class VideoMultiDomainDatasets(MultiDomainDatasets):
 
         weight_type = WeightingType(config_weight_type)
         size_type = DatasetSizeType(config_size_type)
+        self._loader_params = {
+            "num_workers": num_workers,
+            "persistent_workers": num_workers > 0,
+            "infinite": infinite_loaders,
+            "distributed": distributed,
+        }
+        self._n_prefetch = n_prefetch
 
         if weight_type is WeightingType.PRESET0:
             self._source_sampling_config = FixedSeedSamplingConfig(
-                class_weights=np.arange(source_access.n_classes(), 0, -1)
+                class_weights=np.arange(source_access.n_classes(), 0, -1), **self._loader_params
             )
             self._target_sampling_config = FixedSeedSamplingConfig(
-                class_weights=np.random.randint(1, 4, size=target_access.n_classes())
+                class_weights=np.random.randint(1, 4, size=target_access.n_classes()), **self._loader_params
             )
         elif weight_type is WeightingType.BALANCED:
-            self._source_sampling_config = FixedSeedSamplingConfig(balance=True)
-            self._target_sampling_config = FixedSeedSamplingConfig(balance=True)
+            self._source_sampling_config = FixedSeedSamplingConfig(balance=True, **self._loader_params)
+            self._target_sampling_config = FixedSeedSamplingConfig(balance=True, **self._loader_params)
         elif weight_type not in WeightingType:
             raise ValueError(f"Unknown weighting method {weight_type}.")
         else:
-            self._source_sampling_config = FixedSeedSamplingConfig(seed=self._seed)
-            self._target_sampling_config = FixedSeedSamplingConfig(seed=self._seed)
+            self._source_sampling_config = FixedSeedSamplingConfig(seed=self._seed, **self._loader_params)
+            self._target_sampling_config = FixedSeedSamplingConfig(seed=self._seed, **self._loader_params)
 
         self._source_access_dict = source_access_dict
         self._target_access_dict = target_access_dict
@@ -80,85 +109,56 @@ class VideoMultiDomainDatasets(MultiDomainDatasets):
         self._rgb_target_by_split = {}
         self._flow_target_by_split = {}
         self._size_type = size_type
+        self._epoch_size = epoch_size
+        DatasetSizeType.check_epoch_size(size_type, epoch_size)
         self._n_fewshot = n_fewshot
         self._random_state = check_random_state(random_state)
         self._source_by_split = {}
         self._labeled_target_by_split = None
         self._target_by_split = {}
+        self._train_val_by_key = {}
+        self._splitter = splitter
         self.class_ids = class_ids
+        self._joint_loading = joint_loading and self.rgb and self.flow
+        if self._joint_loading:
+            self._joint_access_dict = {
+                "source": JointVideoDatasetAccess(source_access_dict["rgb"], source_access_dict["flow"], seed),
+                "target": JointVideoDatasetAccess(target_access_dict["rgb"], target_access_dict["flow"], seed),
+            }
 
     def prepare_data_loaders(self):
-        if self.rgb:
-            logging.debug("Load RGB train and val")
-            (self._rgb_source_by_split["train"], self._rgb_source_by_split["valid"]) = self._source_access_dict[
-                "rgb"
-            ].get_train_val(self._val_split_ratio)
-            if self.class_ids is not None:
-                self._rgb_source_by_split["train"] = get_class_subset(
-                    self._rgb_source_by_split["train"], self.class_ids
-                )
-                self._rgb_source_by_split["valid"] = get_class_subset(
-                    self._rgb_source_by_split["valid"], self.class_ids
-                )
-
-            (self._rgb_target_by_split["train"], self._rgb_target_by_split["valid"]) = self._target_access_dict[
-                "rgb"
-            ].get_train_val(self._val_split_ratio)
-            if self.class_ids is not None:
-                self._rgb_target_by_split["train"] = get_class_subset(
-                    self._rgb_target_by_split["train"], self.class_ids
-                )
-                self._rgb_target_by_split["valid"] = get_class_subset(
-                    self._rgb_target_by_split["valid"], self.class_ids
-                )
-
-            logging.debug("Load RGB Test")
-            self._rgb_source_by_split["test"] = self._source_access_dict["rgb"].get_test()
-            self._rgb_target_by_split["test"] = self._target_access_dict["rgb"].get_test()
-            if self.class_ids is not None:
-                self._rgb_source_by_split["test"] = get_class_subset(self._rgb_source_by_split["test"], self.class_ids)
-                self._rgb_target_by_split["test"] = get_class_subset(self._rgb_target_by_split["test"], self.class_ids)
+        """Prepare the training split. The validation and test splits are prepared when they are first requested."""
+        self._prepare_split("train")
 
+    def _prepare_split(self, split):
+        if self._joint_loading:
+            if split not in self._source_by_split or split not in self._target_by_split:
+                logging.debug(f"Load joint {split}")
+                for domain, by_split in [("source", self._source_by_split), ("target", self._target_by_split)]:
+                    by_split[split] = self._get_access_split(self._joint_access_dict[domain], split, (domain, "joint"))
+            return
+        modalities = []
+        if self.rgb:
+            modalities.append(("rgb", self._rgb_source_by_split, self._rgb_target_by_split))
         if self.flow:
-            logging.debug("Load flow train and val")
-            (self._flow_source_by_split["train"], self._flow_source_by_split["valid"]) = self._source_access_dict[
-                "flow"
-            ].get_train_val(self._val_split_ratio)
-            if self.class_ids is not None:
-                self._flow_source_by_split["train"] = get_class_subset(
-                    self._flow_source_by_split["train"], self.class_ids
-                )
-                self._flow_source_by_split["valid"] = get_class_subset(
-                    self._flow_source_by_split["valid"], self.class_ids
-                )
-
-            (self._flow_target_by_split["train"], self._flow_target_by_split["valid"]) = self._target_access_dict[
-                "flow"
-            ].get_train_val(self._val_split_ratio)
-            if self.class_ids is not None:
-                self._flow_target_by_split["train"] = get_class_subset(
-                    self._flow_target_by_split["train"], self.class_ids
-                )
-                self._flow_target_by_split["valid"] = get_class_subset(
-                    self._flow_target_by_split["valid"], self.class_ids
-                )
-
-            logging.debug("Load flow Test")
-            self._flow_source_by_split["test"] = self._source_access_dict["flow"].get_test()
-            self._flow_target_by_split["test"] = self._target_access_dict["flow"].get_test()
-            if self.class_ids is not None:
-                self._flow_source_by_split["test"] = get_class_subset(
-                    self._flow_source_by_split["test"], self.class_ids
-                )
-                self._flow_target_by_split["test"] = get_class_subset(
-                    self._flow_target_by_split["test"], self.class_ids
-                )
+            modalities.append(("flow", self._flow_source_by_split, self._flow_target_by_split))
+        for modality, source_by_split, target_by_split in modalities:
+            if split in source_by_split and split in target_by_split:
+                continue
+            logging.debug(f"Load {modality} {split}")
+            source_access = self._source_access_dict[modality]
+            target_access = self._target_access_dict[modality]
+            source_by_split[split] = self._get_access_split(source_access, split, ("source", modality))
+            target_by_split[split] = self._get_access_split(target_access, split, ("target", modality))
 
     def get_domain_loaders(self, split="train", batch_size=32):
+        if self._joint_loading:
+            return _ModalitySplitLoader(super().get_domain_loaders(split, batch_size))
+        self._prepare_split(split)
         rgb_source_ds = rgb_target_ds = flow_source_ds = flow_target_ds = None
         rgb_source_loader = rgb_target_loader = flow_source_loader = flow_target_loader = None
         rgb_target_labeled_loader = flow_target_labeled_loader = None
-        rgb_target_unlabeled_loader = flow_target_unlabeled_loader = n_dataset = None
+        rgb_target_unlabeled_loader = flow_target_unlabeled_loader = domain_datasets = None
 
         if self.rgb:
             rgb_source_ds = self._rgb_source_by_split[split]
@@ -174,43 +174,44 @@ class VideoMultiDomainDatasets(MultiDomainDatasets):
             # unsupervised target domain
             if self.rgb:
                 rgb_target_loader = self._target_sampling_config.create_loader(rgb_target_ds, batch_size)
-                n_dataset = DatasetSizeType.get_size(self._size_type, rgb_source_ds, rgb_target_ds)
+                domain_datasets = [rgb_source_ds, rgb_target_ds]
             if self.flow:
                 flow_target_loader = self._target_sampling_config.create_loader(flow_target_ds, batch_size)
-                n_dataset = DatasetSizeType.get_size(self._size_type, flow_source_ds, flow_target_ds)
+                domain_datasets = [flow_source_ds, flow_target_ds]
 
             dataloaders = [rgb_source_loader, flow_source_loader, rgb_target_loader, flow_target_loader]
             dataloaders = [x for x in dataloaders if x is not None]
 
-            return MultiDataLoader(dataloaders=dataloaders, n_batches=max(n_dataset // batch_size, 1),)
+            return MultiDataLoader(
+                dataloaders=dataloaders,
+                n_batches=self._get_n_batches(batch_size, *domain_datasets),
+                n_prefetch=self._n_prefetch,
+                time_budget=self._get_time_budget(),
+            )
         else:
             # semi-supervised target domain
             if self.rgb:
                 rgb_target_labeled_ds = self._labeled_target_by_split[split]
                 rgb_target_unlabeled_ds = rgb_target_ds
                 # label domain: always balanced
-                rgb_target_labeled_loader = FixedSeedSamplingConfig(balance=True, class_weights=None).create_loader(
-                    rgb_target_labeled_ds, batch_size=min(len(rgb_target_labeled_ds), batch_size)
-                )
+                rgb_target_labeled_loader = FixedSeedSamplingConfig(
+                    balance=True, class_weights=None, **self._loader_params
+                ).create_loader(rgb_target_labeled_ds, batch_size=min(len(rgb_target_labeled_ds), batch_size))
 
                 rgb_target_unlabeled_loader = self._target_sampling_config.create_loader(
                     rgb_target_unlabeled_ds, batch_size
                 )
-                n_dataset = DatasetSizeType.get_size(
-                    self._size_type, rgb_source_ds, rgb_target_labeled_ds, rgb_target_unlabeled_ds
-                )
+                domain_datasets = [rgb_source_ds, rgb_target_labeled_ds, rgb_target_unlabeled_ds]
             if self.flow:
                 flow_target_labeled_ds = self._labeled_target_by_split[split]
                 flow_target_unlabeled_ds = flow_target_ds
-                flow_target_labeled_loader = FixedSeedSamplingConfig(balance=True, class_weights=None).create_loader(
-                    flow_target_labeled_ds, batch_size=min(len(flow_target_labeled_ds), batch_size)
-                )
+                flow_target_labeled_loader = FixedSeedSamplingConfig(
+                    balance=True, class_weights=None, **self._loader_params
+                ).create_loader(flow_target_labeled_ds, batch_size=min(len(flow_target_labeled_ds), batch_size))
                 flow_target_unlabeled_loader = self._target_sampling_config.create_loader(
                     flow_target_unlabeled_ds, batch_size
                 )
-                n_dataset = DatasetSizeType.get_size(
-                    self._size_type, rgb_source_ds, flow_target_labeled_ds, flow_target_unlabeled_ds
-                )
+                domain_datasets = [rgb_source_ds, flow_target_labeled_ds, flow_target_unlabeled_ds]
 
             # combine loaders into a list and remove the loader which is NONE.
             dataloaders = [
@@ -223,9 +224,18 @@ class VideoMultiDomainDatasets(MultiDomainDatasets):
             ]
             dataloaders = [x for x in dataloaders if x is not None]
 
-            return MultiDataLoader(dataloaders=dataloaders, n_batches=max(n_dataset // batch_size, 1))
+            return MultiDataLoader(
+                dataloaders=dataloaders,
+                n_batches=self._get_n_batches(batch_size, *domain_datasets),
+                n_prefetch=self._n_prefetch,
+                time_budget=self._get_time_budget(),
+            )
 
     def __len__(self):
+        """The number of training samples per domain, see ``DatasetSizeType.get_size``."""
+        if self._joint_loading:
+            return super().__len__()
+        self._prepare_split("train")
         if self.rgb:
             source_ds = self._rgb_source_by_split["train"]
             target_ds = self._rgb_target_by_split["train"]
@@ -238,3 +248,30 @@ class VideoMultiDomainDatasets(MultiDomainDatasets):
         else:
             labeled_target_ds = self._labeled_target_by_split["train"]
             return DatasetSizeType.get_size(self._size_type, source_ds, labeled_target_ds, target_ds)
+
+
+class _ModalitySplitLoader:
+    """
+    Yields the batches of a ``MultiDataLoader`` of joint RGB and optical flow samples in the layout of separate RGB and
+    flow loaders: [(x_rgb_1, y_1), (x_flow_1, y_1), ..., (x_rgb_s, y_s), (x_flow_s, y_s)] for s domains.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __iter__(self):
+        for batches in self._loader:
+            yield [(x[modality], y) for x, y in batches for modality in ["rgb", "flow"]]
+
+    def __len__(self):
+        return len(self._loader)
+
+    @property
+    def n_wraps(self):
+        return self._loader.n_wraps
+
+    def state_dict(self):
+        return self._loader.state_dict()
+
+    def load_state_dict(self, state_dict):
+        self._loader.load_state_dict(state_dict)
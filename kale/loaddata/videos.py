@@ -1,12 +1,17 @@
+import concurrent.futures
+import io
+import itertools
 import math
 import os
 import os.path
-import random
 from pathlib import Path
 
 import numpy as np
 import torch
 from PIL import Image
+from sklearn.utils import check_random_state
+
+from kale.loaddata.frame_archive import FrameArchive
 
 
 class VideoRecord(object):
@@ -25,6 +30,8 @@ class VideoRecord(object):
              5) any following elements are labels in the case of multi-label classification
     """
 
+    __slots__ = ("_data", "_path")
+
     def __init__(self, row, root_datapath):
         self._data = row
         self._path = os.path.join(root_datapath, row[0])
@@ -55,6 +62,153 @@ class VideoRecord(object):
             return [int(label_id) for label_id in self._data[3:]]
 
 
+class VideoAnnotations(object):
+    """
+    Compact store of the annotations of video samples, indexed like a list of VideoRecord. The samples are the rows
+    of one NumPy structured array of 16 bytes per sample (or 4 more bytes per extra label), and the path of each video
+    folder is stored once in a table of paths, however many samples it has. The records are created when they are
+    accessed, so the store holds no Python object per sample, and the processes forked by a DataLoader share it
+    instead of copying the pages touched by reference counting.
+
+    Args:
+        paths: The distinct paths of the video folders, excluding the root_datapath prefix.
+        path_ids: The index in paths of the video folder of each sample.
+        start_frames: The starting frame id of each sample.
+        end_frames: The inclusive ending frame id of each sample.
+        labels: The label index of each sample, or an array of shape (n_samples, n_labels) in the case of
+                multi-label classification.
+        root_datapath: The system path to the root folder of the videos.
+    """
+
+    def __init__(self, paths, path_ids, start_frames, end_frames, labels, root_datapath):
+        labels = np.asarray(labels)
+        self.paths = np.asarray(paths, dtype=str)
+        self.records = np.empty(
+            len(labels),
+            dtype=[
+                ("path_id", np.int32),
+                ("start_frame", np.int32),
+                ("end_frame", np.int32),
+                ("label", np.int32, labels.shape[1:]),
+            ],
+        )
+        self.records["path_id"] = path_ids
+        self.records["start_frame"] = start_frames
+        self.records["end_frame"] = end_frames
+        self.records["label"] = labels
+        self.root_datapath = str(root_datapath)
+
+    @classmethod
+    def from_rows(cls, rows, root_datapath):
+        """
+        Create the store from rows of annotations with the same number of labels, see VideoRecord.
+
+        Args:
+            rows: A list of rows (path, start_frame, end_frame, label, ...), whose fields can be strings.
+            root_datapath: The system path to the root folder of the videos.
+        """
+        paths, path_ids = np.unique([row[0] for row in rows], return_inverse=True)
+        values = np.array([row[1:] for row in rows], dtype=np.int64).reshape(len(rows), -1)
+        labels = values[:, 2] if values.shape[1] == 3 else values[:, 2:]
+        return cls(paths, path_ids, values[:, 0], values[:, 1], labels, root_datapath)
+
+    @property
+    def path_ids(self):
+        return self.records["path_id"]
+
+    @property
+    def start_frames(self):
+        return self.records["start_frame"]
+
+    @property
+    def end_frames(self):
+        return self.records["end_frame"]
+
+    @property
+    def labels(self):
+        return self.records["label"]
+
+    @property
+    def num_frames(self):
+        return self.end_frames - self.start_frames + 1  # +1 because end frame is inclusive
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        path_id, start_frame, end_frame, label = self.records[index].tolist()
+        labels = label.tolist() if isinstance(label, np.ndarray) else [label]
+        return VideoRecord((self.paths[path_id], start_frame, end_frame, *labels), self.root_datapath)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+def get_segment_offsets(num_frames, num_segments, frames_per_segment, random_shift=True, random_state=None):
+    """
+    Chooses the start frame indexes of the segments of a batch of video samples, relative to their start frames,
+    with vectorized operations over the whole batch.
+
+    With random_shift, each video is divided into num_segments segments of equal duration, and a random start index
+    is chosen in each segment. The segments of videos shorter than num_segments * frames_per_segment frames overlap:
+    their start indexes are num_segments distinct random indexes in [0, num_frames - frames_per_segment), in
+    ascending order. Without random_shift, the start indexes are evenly spaced, symmetrically around the middle of
+    the video.
+
+    Args:
+        num_frames: The number of frames of each video sample.
+        num_segments: The number of segments of each video sample.
+        frames_per_segment: The number of consecutive frames loaded from each segment.
+        random_shift: Whether to choose random (True) or symmetrical (False) start indexes. Defaults to True.
+        random_state: Seed or np.random.RandomState of the random start indexes. Defaults to None
+                      (=> the global numpy random state).
+    Returns:
+        Array of shape (len(num_frames), num_segments) of indices of segment start frames.
+    """
+
+    num_frames = np.asarray(num_frames, dtype=np.int64)
+    if not random_shift:
+        return get_clip_offsets(num_frames, num_segments, frames_per_segment, 1)[:, 0]
+
+    random_state = check_random_state(random_state)
+    offsets = np.empty((len(num_frames), num_segments), dtype=np.int64)
+    is_long = num_frames > num_segments * frames_per_segment - 1
+    segment_duration = (num_frames[is_long, None] - frames_per_segment + 1) // num_segments
+    offsets[is_long] = np.arange(num_segments) * segment_duration + random_state.randint(
+        segment_duration, size=(len(segment_duration), num_segments)
+    )
+
+    population = num_frames[~is_long] - frames_per_segment
+    if len(population) > 0:
+        if np.any(population < num_segments):
+            raise ValueError("Cannot choose {} distinct start frames in {}".format(num_segments, population.min()))
+        # the num_segments smallest random keys of each row give a random sample without replacement
+        keys = random_state.random_sample((len(population), population.max()))
+        keys[np.arange(population.max()) >= population[:, None]] = np.inf
+        offsets[~is_long] = np.sort(np.argsort(keys, axis=1)[:, :num_segments], axis=1)
+    return offsets
+
+
+def get_clip_offsets(num_frames, num_segments, frames_per_segment, n_clips):
+    """
+    Chooses the start frame indexes of the segments of n_clips clips of each video sample, for multi-view testing.
+    Each segment is divided into n_clips parts of equal duration, and the segment of clip k starts in the middle of
+    its k-th part. The single clip for n_clips = 1 is the symmetrical clip of get_segment_offsets.
+
+    Args:
+        num_frames: The number of frames of each video sample.
+        num_segments: The number of segments of each video sample.
+        frames_per_segment: The number of consecutive frames loaded from each segment.
+        n_clips: The number of clips of each video sample.
+    Returns:
+        Array of shape (len(num_frames), n_clips, num_segments) of indices of segment start frames.
+    """
+
+    tick = (np.asarray(num_frames, dtype=np.int64)[:, None, None] - frames_per_segment + 1) / float(num_segments)
+    clip_shift = (np.arange(n_clips)[:, None] + 0.5) / n_clips
+    return (tick * clip_shift + tick * np.arange(num_segments)).astype(np.int64)
+
+
 class VideoFrameDataset(torch.utils.data.Dataset):
     r"""
     A highly efficient and adaptable dataset class for videos.
@@ -117,6 +271,26 @@ class VideoFrameDataset(torch.utils.data.Dataset):
                       segment range.
         test_mode: Whether this is a test dataset. If so, chooses
                    frames from segments with random_shift=False.
+        frame_archive: The root folder of an archive of the video folders
+                       of root_path, packed by
+                       ``kale.loaddata.frame_archive.pack_frame_archive``.
+                       If given, the frames are read from the archive instead
+                       of individual image files.
+        frame_cache: A ``kale.loaddata.frame_cache.FrameCache`` of the
+                     decoded frames, which can be shared with other datasets.
+                     Useful with test_mode (or random_shift=False), where the
+                     same frames are loaded every epoch.
+        decode_threads: The number of threads decoding the frames of a
+                        sample in parallel, or 0 to decode them one after
+                        the other. Each process (e.g. data loader worker)
+                        keeps its own pool of threads.
+        decode_size: The minimum size of the shorter side of the decoded
+                     frames, e.g. 256 for the transforms of
+                     ``kale.prepdata.video_transform.get_transform``, which
+                     resize the frames to 256. JPEG frames at least twice as
+                     large are decoded directly at a reduced resolution (by a
+                     factor of 2, 4 or 8), which is faster and uses less
+                     memory. Defaults to None (=> full resolution).
 
     """
 
@@ -131,6 +305,10 @@ class VideoFrameDataset(torch.utils.data.Dataset):
         transform=None,
         random_shift: bool = True,
         test_mode: bool = False,
+        frame_archive: str = None,
+        frame_cache=None,
+        decode_threads: int = 0,
+        decode_size: int = None,
     ):
         super(VideoFrameDataset, self).__init__()
 
@@ -143,24 +321,85 @@ class VideoFrameDataset(torch.utils.data.Dataset):
         self.transform = transform
         self.random_shift = random_shift
         self.test_mode = test_mode
+        self.frame_archive = None if frame_archive is None else FrameArchive(frame_archive, self.root_path)
+        self.frame_cache = frame_cache
+        self.decode_threads = decode_threads
+        self.decode_size = decode_size
+        self._decode_pool = None
+        self._decode_pool_pid = None
         if self.image_modality == "flow" and self.frames_per_segment > 1:
             self.frames_per_segment //= 2
 
         self._parse_list()
 
-    def _load_image(self, directory, idx):
+    def _open_image(self, directory, filename):
+        """Open the frame file ``filename`` of a video folder, from the frame archive if there is one."""
+        if self.frame_archive is not None:
+            return Image.open(io.BytesIO(self.frame_archive.read(directory, filename)))
+        return Image.open(os.path.join(directory, filename))
+
+    def _decode_image(self, directory, filename, mode):
+        image = self._open_image(directory, filename)
+        if self.decode_size is not None:
+            scale = self.decode_size / min(image.size)
+            if scale < 1:
+                # JPEG images are downscaled while decoding, to the smallest size larger than the requested one
+                image.draft(None, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        return image.convert(mode)
+
+    def _read_frame(self, directory, filename, mode):
+        """Decode the frame file ``filename`` of a video folder into a PIL image of the given mode."""
+        if self.frame_cache is None:
+            return self._decode_image(directory, filename, mode)
+        key = os.path.join(directory, filename)
+        if self.decode_size is not None:
+            key = f"{key}@{self.decode_size}"
+        frame = self.frame_cache.get(key)
+        if frame is None:
+            frame = np.asarray(self._decode_image(directory, filename, mode))
+            self.frame_cache.put(key, frame)
+        return Image.fromarray(frame)
+
+    def _get_image_files(self, idx):
+        """The (file name, PIL mode) of each image of the frame id ``idx``: one RGB image, or the x and y flow images."""
         if self.image_modality == "rgb":
-            return [Image.open(os.path.join(directory, self.imagefile_template.format(idx))).convert("RGB")]
+            return [(self.imagefile_template.format(idx), "RGB")]
         elif self.image_modality == "flow":
             idx = math.ceil(idx / 2) - 1 if idx > 2 else 1
-            x_img = Image.open(os.path.join(directory, self.imagefile_template.format("x", idx))).convert("L")
-            y_img = Image.open(os.path.join(directory, self.imagefile_template.format("y", idx))).convert("L")
-            return [x_img, y_img]
+            return [(self.imagefile_template.format("x", idx), "L"), (self.imagefile_template.format("y", idx), "L")]
         else:
             raise ValueError("Input modality is not in [rgb, flow, joint]. Current is {}".format(self.image_modality))
 
+    def _load_image(self, directory, idx):
+        return [self._read_frame(directory, filename, mode) for filename, mode in self._get_image_files(idx)]
+
+    def _get_decode_pool(self):
+        # threads do not survive a fork, so each process creates its own pool
+        if self._decode_pool is None or self._decode_pool_pid != os.getpid():
+            self._decode_pool = concurrent.futures.ThreadPoolExecutor(self.decode_threads)
+            self._decode_pool_pid = os.getpid()
+        return self._decode_pool
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_decode_pool"] = None
+        return state
+
     def _parse_list(self):
-        self.video_list = [VideoRecord(x.strip().split(" "), self.root_path) for x in open(self.annotationfile_path)]
+        with open(self.annotationfile_path) as annotation_file:
+            rows = [x.strip().split(" ") for x in annotation_file if x.strip()]
+        if len({len(row) for row in rows}) != 1:
+            # samples with different numbers of labels do not fit in the columns of VideoAnnotations
+            self.video_list = [VideoRecord(row, self.root_path) for row in rows]
+        else:
+            self.video_list = VideoAnnotations.from_rows(rows, self.root_path)
+
+    @property
+    def targets(self):
+        """The label of each video sample, read from the annotations without loading any frame."""
+        if isinstance(self.video_list, VideoAnnotations):
+            return self.video_list.labels
+        return [record.label for record in self.video_list]
 
     def _get_random_indices(self, record):
         """
@@ -172,14 +411,7 @@ class VideoFrameDataset(torch.utils.data.Dataset):
             List of indices of segment start frames.
         """
 
-        if record.num_frames > self.num_segments * self.frames_per_segment - 1:
-            segment_duration = (record.num_frames - self.frames_per_segment + 1) // self.num_segments
-            offsets = np.multiply(list(range(self.num_segments)), segment_duration) + np.random.randint(
-                segment_duration, size=self.num_segments
-            )
-        else:
-            offsets = np.sort(random.sample(range(record.num_frames - self.frames_per_segment), self.num_segments))
-        return offsets
+        return get_segment_offsets([record.num_frames], self.num_segments, self.frames_per_segment)[0]
 
     def _get_symmetric_indices(self, record):
         """
@@ -191,11 +423,43 @@ class VideoFrameDataset(torch.utils.data.Dataset):
             List of indices of segment start frames.
         """
 
-        tick = (record.num_frames - self.frames_per_segment + 1) / float(self.num_segments)
+        offsets = get_segment_offsets(
+            [record.num_frames], self.num_segments, self.frames_per_segment, random_shift=False
+        )
+        return offsets[0]
 
-        offsets = np.array([int(tick / 2.0 + tick * x) for x in range(self.num_segments)])
+    def get_segment_offsets(self, indices=None, random_state=None):
+        """
+        Chooses the start frame indexes of the segments of many video samples at once, e.g. of a whole batch or
+        epoch, in the same way as for a single sample.
 
-        return offsets
+        Args:
+            indices: Indices of the video samples. Defaults to None (=> all the samples).
+            random_state: Seed or np.random.RandomState of the random start frames. Defaults to None
+                          (=> the global numpy random state).
+        Returns:
+            Array of shape (len(indices), num_segments) of indices of segment start frames.
+        """
+
+        if isinstance(self.video_list, VideoAnnotations):
+            num_frames = self.video_list.num_frames
+        else:
+            num_frames = np.array([record.num_frames for record in self.video_list], dtype=np.int64)
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        num_frames = num_frames[indices]
+        invalid = (num_frames < self.frames_per_segment) | (num_frames < self.num_segments)
+        invalid |= (num_frames < self.num_segments * self.frames_per_segment) & (
+            self.num_segments > num_frames - self.frames_per_segment + 1
+        )
+        if np.any(invalid):
+            self._check_num_frames(self.video_list[indices[np.argmax(invalid)]])
+        return get_segment_offsets(
+            num_frames,
+            self.num_segments,
+            self.frames_per_segment,
+            random_shift=self.random_shift and not self.test_mode,
+            random_state=random_state,
+        )
 
     def __getitem__(self, index):
         """
@@ -211,7 +475,46 @@ class VideoFrameDataset(torch.utils.data.Dataset):
         """
 
         record = self.video_list[index]
+        return self._get(record, self._sample_indices(record))
+
+    def get_batch(self, indices):
+        """
+        Loads a batch of video samples, choosing the start frames of all their segments at once, see
+        kale.loaddata.sampler.BatchedFetchDataset.
+
+        Args:
+            indices: Indices of the video samples.
+        Returns:
+            The collated samples, as returned by a DataLoader loading the samples one by one.
+        """
+
+        offsets = self.get_segment_offsets(indices)
+        samples = [
+            self._get(self.video_list[index], segment_offsets) for index, segment_offsets in zip(indices, offsets)
+        ]
+        return torch.utils.data.dataloader.default_collate(samples)
+
+    def _sample_indices(self, record):
+        """
+        Checks that a video is long enough and chooses the start frame indexes of its segments.
+
+        Args:
+            record: VideoRecord denoting a video sample.
+        Returns:
+            List of indices of segment start frames.
+        """
 
+        self._check_num_frames(record)
+        if not self.test_mode:
+            segment_indices = (
+                self._get_random_indices(record) if self.random_shift else self._get_symmetric_indices(record)
+            )
+        else:
+            segment_indices = self._get_symmetric_indices(record)
+
+        return segment_indices
+
+    def _check_num_frames(self, record):
         if record.num_frames < self.frames_per_segment:
             raise RuntimeError(
                 "Path:{}, start:{}, end:{}.\n Video_length is {}, which should be larger than "
@@ -241,15 +544,6 @@ class VideoFrameDataset(torch.utils.data.Dataset):
                     )
                 )
 
-        if not self.test_mode:
-            segment_indices = (
-                self._get_random_indices(record) if self.random_shift else self._get_symmetric_indices(record)
-            )
-        else:
-            segment_indices = self._get_symmetric_indices(record)
-
-        return self._get(record, segment_indices)
-
     def _get(self, record, indices):
         """
         Loads the frames of a video at the corresponding indices.
@@ -262,22 +556,162 @@ class VideoFrameDataset(torch.utils.data.Dataset):
             2) An integer denoting the video label.
         """
 
+        seg_imgs = self._load_images(record, self._get_image_indices(record, indices))
+        images = [image for seg_img in seg_imgs for image in seg_img]
+
+        if self.transform is not None:
+            images = self.transform(images)
+
+        return images, record.label
+
+    def _get_image_indices(self, record, indices):
+        """The frame ids of the frames of the segments starting at the given indices, in order."""
         indices = indices + record.start_frame
-        images = list()
         image_indices = list()
         for seg_ind in indices:
             frame_index = int(seg_ind)
             for i in range(self.frames_per_segment):
-                seg_img = self._load_image(record.path, frame_index)
-                images.extend(seg_img)
                 image_indices.append(frame_index)
                 if frame_index < record.end_frame:
                     frame_index += 1
+        return image_indices
+
+    def _load_images(self, record, image_indices):
+        """Loads the images of each frame id, as returned by _load_image."""
+        if self.decode_threads > 0:
+            # each image file (e.g. the x and y images of a flow frame) is decoded by its own task
+            image_files = [self._get_image_files(frame_index) for frame_index in image_indices]
+            filenames, modes = zip(*itertools.chain.from_iterable(image_files))
+            images = iter(
+                self._get_decode_pool().map(self._read_frame, itertools.repeat(record.path), filenames, modes)
+            )
+            # the images are returned in the order of their indices
+            return [[next(images) for _ in files] for files in image_files]
+        return [self._load_image(record.path, frame_index) for frame_index in image_indices]
 
-        if self.transform is not None:
-            images = self.transform(images)
+    def get_clips(self, index, n_clips):
+        """
+        Loads n_clips clips of a video sample for multi-view testing, at evenly spaced positions in its segments (see
+        get_clip_offsets). The frames shared by overlapping clips are decoded once.
 
-        return images, record.label
+        Args:
+            index: Video sample index.
+            n_clips: The number of clips.
+        Returns:
+            1) A list of n_clips lists of PIL images, or of the results of applying self.transform on these lists.
+            2) An integer denoting the video label.
+        """
+
+        record = self.video_list[index]
+        self._check_num_frames(record)
+        clip_offsets = get_clip_offsets([record.num_frames], self.num_segments, self.frames_per_segment, n_clips)[0]
+        return self._get_clips(record, clip_offsets)
+
+    def _get_clips(self, record, clip_offsets):
+        clip_indices = [self._get_image_indices(record, offsets) for offsets in clip_offsets]
+        frame_indices = sorted(set(frame_index for image_indices in clip_indices for frame_index in image_indices))
+        frames = dict(zip(frame_indices, self._load_images(record, frame_indices)))
+        clips = [
+            [image for frame_index in image_indices for image in frames[frame_index]] for image_indices in clip_indices
+        ]
+        if self.transform is not None:
+            clips = [self.transform(images) for images in clips]
+        return clips, record.label
 
     def __len__(self):
         return len(self.video_list)
+
+
+class JointVideoDataset(torch.utils.data.Dataset):
+    """
+    RGB and optical flow frames of the same videos, loaded together. The segment start frames of each video are
+    sampled once, by the RGB dataset, and both modalities are loaded at these frames, so that they are always aligned.
+    Returns ``({"rgb": rgb_frames, "flow": flow_frames}, label)`` samples.
+
+    Args:
+        rgb_dataset (VideoFrameDataset): the dataset of the RGB frames.
+        flow_dataset (VideoFrameDataset): the dataset of the optical flow frames, with the same videos in the same
+            order.
+    """
+
+    def __init__(self, rgb_dataset, flow_dataset):
+        if len(rgb_dataset) != len(flow_dataset):
+            raise ValueError(f"The RGB and flow datasets have {len(rgb_dataset)} and {len(flow_dataset)} videos")
+        self.rgb_dataset = rgb_dataset
+        self.flow_dataset = flow_dataset
+
+    @property
+    def targets(self):
+        """The label of each video sample, read from the annotations of the RGB dataset."""
+        return np.asarray(self.rgb_dataset.targets)
+
+    def __getitem__(self, index):
+        rgb_record = self.rgb_dataset.video_list[index]
+        flow_record = self.flow_dataset.video_list[index]
+        indices = self.rgb_dataset._sample_indices(rgb_record)
+        rgb_frames, label = self.rgb_dataset._get(rgb_record, indices)
+        flow_frames, _ = self.flow_dataset._get(flow_record, indices)
+        return {"rgb": rgb_frames, "flow": flow_frames}, label
+
+    def get_clips(self, index, n_clips):
+        """Loads n_clips clips of a video sample for multi-view testing, see VideoFrameDataset."""
+        rgb_record = self.rgb_dataset.video_list[index]
+        self.rgb_dataset._check_num_frames(rgb_record)
+        clip_offsets = get_clip_offsets(
+            [rgb_record.num_frames], self.rgb_dataset.num_segments, self.rgb_dataset.frames_per_segment, n_clips
+        )[0]
+        rgb_clips, label = self.rgb_dataset._get_clips(rgb_record, clip_offsets)
+        flow_clips, _ = self.flow_dataset._get_clips(self.flow_dataset.video_list[index], clip_offsets)
+        return [{"rgb": rgb, "flow": flow} for rgb, flow in zip(rgb_clips, flow_clips)], label
+
+    def get_batch(self, indices):
+        """Loads a batch of samples, choosing the start frames of all their segments at once, see VideoFrameDataset."""
+        offsets = self.rgb_dataset.get_segment_offsets(indices)
+        samples = []
+        for index, segment_offsets in zip(indices, offsets):
+            rgb_frames, label = self.rgb_dataset._get(self.rgb_dataset.video_list[index], segment_offsets)
+            flow_frames, _ = self.flow_dataset._get(self.flow_dataset.video_list[index], segment_offsets)
+            samples.append(({"rgb": rgb_frames, "flow": flow_frames}, label))
+        return torch.utils.data.dataloader.default_collate(samples)
+
+    def __len__(self):
+        return len(self.rgb_dataset)
+
+
+class MultiViewVideoDataset(torch.utils.data.Dataset):
+    """
+    Multiple views of each video sample for testing: n_clips clips at evenly spaced positions in the video (see
+    VideoFrameDataset.get_clips), times the spatial crops of each clip returned by the transform of the dataset, e.g.
+    kale.prepdata.video_transform.ClipTransform with n_crops > 1. Returns (views, label) samples, where views is a
+    tensor of shape (N_VIEWS x CHANNELS x NUM_IMAGES x HEIGHT x WIDTH), or a dict of such tensors for
+    JointVideoDataset, with N_VIEWS = n_clips * n_crops.
+
+    Args:
+        dataset (VideoFrameDataset or JointVideoDataset): the dataset of the videos, whose transform returns
+            tensors of shape (CHANNELS x NUM_IMAGES x HEIGHT x WIDTH) or (N_CROPS x CHANNELS x NUM_IMAGES x HEIGHT
+            x WIDTH).
+        n_clips (int): the number of clips of each video.
+    """
+
+    def __init__(self, dataset, n_clips):
+        self.dataset = dataset
+        self.n_clips = n_clips
+
+    @property
+    def targets(self):
+        """The label of each video sample, see VideoFrameDataset."""
+        return self.dataset.targets
+
+    def __getitem__(self, index):
+        clips, label = self.dataset.get_clips(index, self.n_clips)
+        if isinstance(clips[0], dict):
+            return {key: _stack_views([clip[key] for clip in clips]) for key in clips[0]}, label
+        return _stack_views(clips), label
+
+    def __len__(self):
+        return len(self.dataset)
+
+
+def _stack_views(clips):
+    # the crops of each clip are consecutive views
+    return torch.cat([clip.reshape(-1, *clip.shape[-4:]) for clip in clips])
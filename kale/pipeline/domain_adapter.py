@@ -275,6 +275,7 @@ class BaseAdaptTrainer(pl.LightningModule):
         self.classifier = task_classifier
         self._dataset.prepare_data_loaders()
         self._nb_training_batches = None  # to be set by method train_dataloader
+        self._train_dataloader = None
         self._optimizer_params = optimizer
 
     @property
@@ -282,8 +283,13 @@ class BaseAdaptTrainer(pl.LightningModule):
         return self._method
 
     def _update_batch_epoch_factors(self, batch_id):
+        if batch_id == 0 and self._train_dataloader is not None:
+            # the length of time-budgeted epochs is measured at the end of each epoch
+            self._nb_training_batches = len(self._train_dataloader)
         if self.current_epoch >= self._init_epochs:
             delta_epoch = self.current_epoch - self._init_epochs
+            # an epoch may run longer than the last one, but must not move the schedules past the next epoch
+            batch_id = min(batch_id, self._nb_training_batches)
             p = (batch_id + delta_epoch * self._nb_training_batches) / (
                 self._non_init_epochs * self._nb_training_batches
             )
@@ -441,6 +447,7 @@ class BaseAdaptTrainer(pl.LightningModule):
     def train_dataloader(self):
         dataloader = self._dataset.get_domain_loaders(split="train", batch_size=self._batch_size)
         self._nb_training_batches = len(dataloader)
+        self._train_dataloader = dataloader
         return dataloader
 
     def val_dataloader(self):
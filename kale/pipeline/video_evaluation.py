@@ -0,0 +1,69 @@
+"""Multi-view test-time evaluation of video models, e.g., for action recognition.
+
+Each test video is seen through several views, ``n_clips`` temporal clips times ``n_crops`` spatial crops (see
+``kale.loaddata.videos.MultiViewVideoDataset``), and the logits of its views are averaged into the logits of the
+video. The views of several videos are predicted in the same batch.
+"""
+
+import torch
+
+from kale.loaddata.video_access import get_image_modality
+from kale.pipeline.video_domain_adapter import BaseMMDLike4Video
+
+
+def get_video_predictor(model, image_modality):
+    """
+    Get the function predicting the class logits of a batch of views with a video domain adaptation model of
+    ``kale.pipeline.video_domain_adapter``, whose ``forward`` returns the class logits second. The views of a single
+    modality are passed as a tensor to the MMD-like trainers (DAN and JAN), and as a dict to the other trainers.
+
+    Args:
+        model (torch.nn.Module): the video model.
+        image_modality (string): image type (rgb, flow or joint).
+
+    Returns:
+        callable: maps a tensor of views (or a dict of tensors for joint input) to their logits.
+    """
+    rgb, flow = get_image_modality(image_modality)
+    dict_input = not isinstance(model, BaseMMDLike4Video)
+
+    def predict(views):
+        if dict_input and not isinstance(views, dict):
+            views = {"rgb": views if rgb else None, "flow": views if flow else None}
+        return model(views)[1]
+
+    return predict
+
+
+def _flatten_views(views, device):
+    """Flatten ``(N_VIDEOS, N_VIEWS, ...)`` views into a batch of ``N_VIDEOS * N_VIEWS`` views."""
+    if isinstance(views, dict):
+        return {key: _flatten_views(value, device) for key, value in views.items()}
+    return views.flatten(0, 1).to(device)
+
+
+@torch.no_grad()
+def predict_multi_view(predict, dataset, batch_size, num_workers=0, device=None):
+    """
+    Predict the logits of each video of a multi-view dataset, averaged over its views.
+
+    Args:
+        predict (callable): maps a batch of views to their logits, e.g. returned by ``get_video_predictor``. The
+            model should be in evaluation mode.
+        dataset (MultiViewVideoDataset): the views of the test videos.
+        batch_size (int): the number of videos whose views are predicted in the same batch.
+        num_workers (int, optional): how many subprocesses to use for data loading. Defaults to 0.
+        device (torch.device, optional): the device of the model. Defaults to None (=> the views are not moved).
+
+    Returns:
+        tuple: (logits, labels), the averaged logits of shape ``(N_VIDEOS, N_CLASSES)`` and the labels of the videos.
+    """
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, num_workers=num_workers)
+    all_logits = []
+    all_labels = []
+    for views, labels in loader:
+        n_videos = len(labels)
+        logits = predict(_flatten_views(views, device))
+        all_logits.append(logits.view(n_videos, -1, logits.shape[-1]).mean(dim=1).cpu())
+        all_labels.append(labels)
+    return torch.cat(all_logits), torch.cat(all_labels)
@@ -92,6 +92,41 @@ def get_transform(kind, augment=False):
     return transform
 
 
+def get_batch_transform(kind):
+    """
+    Define the batched counterpart of the digit transforms of ``get_transform``, applied to a whole batch of images
+    at once (see ``get_batch`` of ``kale.loaddata.usps.USPS`` and ``kale.loaddata.mnistm.MNISTM``). The resizing is
+    done on tensors, so the results are close to, but not bit-identical with, the per-image PIL transforms.
+
+    Args:
+        kind (string): the dataset (transformation) name, one of the digit transform kinds of ``get_transform``.
+
+    Returns:
+        callable: a transform of float tensors of shape ``(batch_size, n_channels, height, width)`` with values in
+        [0, 1].
+    """
+    if kind in ["mnist32", "usps32"]:
+        transform = transforms.Compose([transforms.Resize(32), transforms.Normalize([0.5], [0.5])])
+    elif kind in ["mnist32rgb", "usps32rgb"]:
+        transform = transforms.Compose(
+            [
+                transforms.Resize(32),
+                transforms.Lambda(_repeat_gray_channel),
+                transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5)),
+            ]
+        )
+    elif kind in ["mnistm", "svhn"]:
+        transform = transforms.Compose([transforms.Resize(32), transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))])
+    else:
+        raise ValueError(f"Unknown batch transform kind '{kind}'")
+    return transform
+
+
+def _repeat_gray_channel(imgs):
+    """Batched counterpart of ``transforms.Grayscale(3)`` for single-channel images."""
+    return imgs.expand(-1, 3, -1, -1)
+
+
 def reg_img_stack(images, coords, dst_id=0):
     """Registration for stacked images
 
@@ -1,19 +1,32 @@
+import numpy as np
 import torch
 from torchvision import transforms
 
 
-def get_transform(kind, image_modality):
+def get_transform(kind, image_modality, fused=False, n_crops=1):
     """
     Define transforms (for commonly used datasets)
 
     Args:
         kind ([type]): the dataset (transformation) name
         image_modality (string): image type (RGB or Optical Flow)
+        fused (bool, optional): whether to return the equivalent ``ClipTransform`` of each transform pipeline.
+            Defaults to False.
+        n_crops (int, optional): number of spatial crops of each clip of the test transform, see ``ClipTransform``.
+            The test transform is a ``ClipTransform`` when ``n_crops > 1``. Defaults to 1.
     """
 
     if kind in ["epic", "gtea", "adl", "kitchen"]:
         transform = dict()
-        if image_modality == "rgb":
+        if fused and image_modality in ["rgb", "flow"]:
+            n_channels = 3 if image_modality == "rgb" else 2
+            transform = {
+                split: ClipTransform(
+                    resize=256, crop_size=224, mean=[0.5] * n_channels, std=[0.5] * n_channels, random_crop=random_crop
+                )
+                for split, random_crop in [("train", True), ("valid", False), ("test", False)]
+            }
+        elif image_modality == "rgb":
             transform = {
                 "train": transforms.Compose(
                     [
@@ -79,6 +92,11 @@ def get_transform(kind, image_modality):
             }
         else:
             raise ValueError("Input modality is not in [rgb, flow, joint]. Current is {}".format(image_modality))
+        if n_crops > 1:
+            n_channels = 3 if image_modality == "rgb" else 2
+            transform["test"] = ClipTransform(
+                resize=256, crop_size=224, mean=[0.5] * n_channels, std=[0.5] * n_channels, n_crops=n_crops
+            )
     else:
         raise ValueError(f"Unknown transform kind '{kind}'")
     return transform
@@ -122,3 +140,91 @@ class TensorPermute(torch.nn.Module):
 
     def forward(self, tensor):
         return tensor.permute(1, 0, 2, 3).contiguous()
+
+
+class ClipTransform(torch.nn.Module):
+    """
+    Fused equivalent of the pipeline ``ImglistToTensor``, ``transforms.Resize``, ``transforms.RandomCrop`` or
+    ``transforms.CenterCrop``, ``transforms.Normalize`` and ``TensorPermute``. The frames are copied once into a
+    ``uint8`` clip tensor, which is converted to float and resized in one batched call, and the crop is normalized
+    directly into the ``CHANNELS x NUM_IMAGES x HEIGHT x WIDTH`` output tensor, instead of allocating a new clip tensor
+    at each step.
+
+    With ``n_crops > 1``, the transform returns ``n_crops`` crops of each clip for multi-view testing, evenly spaced
+    along the longer side of the frames (e.g. left, center and right crops for 3 crops) and centered along the shorter
+    side. The frames are resized once for all the crops.
+
+    Args:
+        resize (int): size of the smaller side of the resized frames.
+        crop_size (int): size of the square crop of the resized frames.
+        mean (list): mean of each channel.
+        std (list): standard deviation of each channel.
+        random_crop (bool, optional): whether to crop at a random location, or at the center. Defaults to False.
+        n_crops (int, optional): number of crops of each clip. Defaults to 1.
+    """
+
+    def __init__(self, resize, crop_size, mean, std, random_crop=False, n_crops=1):
+        super().__init__()
+        if n_crops > 1 and random_crop:
+            raise ValueError("Multiple crops are taken at fixed locations, not at random locations")
+        self.resize = resize
+        self.crop_size = crop_size
+        self.random_crop = random_crop
+        self.n_crops = n_crops
+        self.register_buffer("mean", torch.as_tensor(mean, dtype=torch.float32).view(-1, 1, 1, 1))
+        self.register_buffer("std", torch.as_tensor(std, dtype=torch.float32).view(-1, 1, 1, 1))
+
+    def forward(self, frames):
+        """
+        Args:
+            frames: list of RGB frames, or of optical flow frames (x(u)_img, y(v)_img, ...) as for
+                ``ImglistToTensor``. The frames are PIL images or ``uint8`` arrays of shape ``(HEIGHT, WIDTH, 3)`` (RGB)
+                or ``(HEIGHT, WIDTH)`` (flow).
+        Returns:
+            tensor of size ``CHANNELS x NUM_IMAGES x CROP_SIZE x CROP_SIZE``, or
+            ``N_CROPS x CHANNELS x NUM_IMAGES x CROP_SIZE x CROP_SIZE`` if ``n_crops > 1``.
+        """
+        clip = _stack_frames(frames)
+        clip = transforms.functional.resize(clip.to(dtype=torch.float32).div_(255), [self.resize])
+        height, width = clip.shape[-2:]
+        if self.random_crop:
+            top, left, _, _ = transforms.RandomCrop.get_params(clip, (self.crop_size, self.crop_size))
+            corners = [(top, left)]
+        elif self.n_crops == 1:
+            corners = [(int(round((height - self.crop_size) / 2.0)), int(round((width - self.crop_size) / 2.0)))]
+        else:
+            corners = self._get_corners(height, width)
+        output = torch.empty((len(corners), clip.shape[1], clip.shape[0], self.crop_size, self.crop_size))
+        for corner_output, (top, left) in zip(output, corners):
+            crop = clip[..., top : top + self.crop_size, left : left + self.crop_size].transpose(0, 1)
+            torch.sub(crop, self.mean, out=corner_output).div_(self.std)
+        return output if self.n_crops > 1 else output[0]
+
+    def _get_corners(self, height, width):
+        """Top left corners of ``n_crops`` crops evenly spaced along the longer side, and centered along the other."""
+        steps = np.linspace(0, 1, self.n_crops)
+        if width >= height:
+            top = int(round((height - self.crop_size) / 2.0))
+            return [(top, int(round(step * (width - self.crop_size)))) for step in steps]
+        left = int(round((width - self.crop_size) / 2.0))
+        return [(int(round(step * (height - self.crop_size))), left) for step in steps]
+
+
+def _stack_frames(frames):
+    """Copy RGB or flow frames into a ``uint8`` tensor of shape ``(NUM_IMAGES, CHANNELS, HEIGHT, WIDTH)``."""
+    arrays = [np.asarray(frame) for frame in frames]
+    if arrays[0].ndim == 3:
+        clip = torch.empty((len(arrays), *arrays[0].shape), dtype=torch.uint8)
+        clip_array = clip.numpy()
+        for i, array in enumerate(arrays):
+            clip_array[i] = array
+        return clip.permute(0, 3, 1, 2)
+    elif arrays[0].ndim == 2:
+        # frame 1_x, frame 1_y, frame 2_x, ... => [[frame 1_x, frame 1_y], [frame 2_x, frame 2_y], ...]
+        clip = torch.empty((len(arrays) // 2, 2, *arrays[0].shape), dtype=torch.uint8)
+        clip_array = clip.numpy().reshape(-1, *arrays[0].shape)
+        for i, array in enumerate(arrays):
+            clip_array[i] = array
+        return clip
+    else:
+        raise RuntimeError("Image modality is not in [rgb, flow].")
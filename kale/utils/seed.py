@@ -33,3 +33,23 @@ def set_seed(seed=1000):
     if torch.cuda.is_available():
         torch.backends.cudnn.deterministic = True
         torch.backends.cudnn.benchmark = False
+
+
+def get_seed(generator):
+    """
+    Get a seed from an int, a ``np.random.Generator`` or ``np.random.RandomState`` to draw it from, or None to draw it
+    from the global numpy random state (e.g. as set by ``set_seed``).
+
+    Args:
+        generator (int, np.random.Generator or np.random.RandomState): the seed or the generator to draw it from.
+
+    Returns:
+        int: the seed.
+    """
+    if generator is None:
+        return int(np.random.randint(2 ** 31 - 1))
+    if isinstance(generator, (int, np.integer)):
+        return int(generator)
+    if isinstance(generator, np.random.Generator):
+        return int(generator.integers(2 ** 31 - 1))
+    return int(generator.randint(2 ** 31 - 1))
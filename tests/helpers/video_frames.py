@@ -0,0 +1,33 @@
+"""Small synthetic video frame folders, for testing the video datasets without downloading data."""
+
+import os
+
+import numpy as np
+from PIL import Image
+
+
+def save_frame(path, seed, size=(8, 10)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pixels = np.random.RandomState(seed).randint(0, 256, size=(*size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+
+
+def make_video_frames(root, n_videos=3, n_frames=12, size=(8, 10)):
+    """
+    Write the RGB frames ``img_{:05d}.jpg`` and the optical flow frames ``flow_{x,y}_{:05d}.jpg`` of ``n_videos``
+    videos in ``root/frames/video_<i>``, and the annotation file ``root/annotations.txt`` of VideoFrameDataset.
+
+    Returns:
+        tuple: (frames root, annotation file) paths.
+    """
+    frames_root = os.path.join(root, "frames")
+    annotation_path = os.path.join(root, "annotations.txt")
+    with open(annotation_path, "w") as annotations:
+        for video in range(n_videos):
+            video_dir = os.path.join(frames_root, f"video_{video}")
+            for i in range(1, n_frames + 1):
+                save_frame(os.path.join(video_dir, f"img_{i:05d}.jpg"), 100 * video + i, size)
+                save_frame(os.path.join(video_dir, f"flow_x_{i:05d}.jpg"), 10000 + 100 * video + i, size)
+                save_frame(os.path.join(video_dir, f"flow_y_{i:05d}.jpg"), 20000 + 100 * video + i, size)
+            annotations.write(f"video_{video} 1 {n_frames} {video}\n")
+    return frames_root, annotation_path
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import torch
+
+from kale.loaddata.dataset_access import get_class_subset
+
+CLASS_SUBSETS = [[1, 3, 8], [0]]
+
+
+class LabelledDataset(torch.utils.data.Dataset):
+    def __init__(self, targets):
+        self.targets = torch.as_tensor(targets)
+        self.n_loaded = 0
+
+    def __getitem__(self, index):
+        self.n_loaded += 1
+        return torch.zeros(1), self.targets[index]
+
+    def __len__(self):
+        return len(self.targets)
+
+
+class UnlabelledDataset(torch.utils.data.Dataset):
+    """Same samples, but the labels can only be read by loading the samples."""
+
+    def __init__(self, targets):
+        self._targets = torch.as_tensor(targets)
+        self.n_loaded = 0
+
+    def __getitem__(self, index):
+        self.n_loaded += 1
+        return torch.zeros(1), self._targets[index]
+
+    def __len__(self):
+        return len(self._targets)
+
+
+@pytest.mark.parametrize("class_subset", CLASS_SUBSETS)
+def test_get_class_subset(class_subset):
+    targets = np.random.RandomState(0).randint(0, 10, size=100)
+    expected = [i for i in range(len(targets)) if targets[i] in class_subset]
+
+    dataset = LabelledDataset(targets)
+    subset = get_class_subset(dataset, class_subset)
+    assert list(subset.indices) == expected
+    assert dataset.n_loaded == 0
+
+    # labels of a subset are read through the wrapped dataset
+    split = torch.utils.data.Subset(dataset, list(range(50)))
+    assert list(get_class_subset(split, class_subset).indices) == [i for i in expected if i < 50]
+    assert dataset.n_loaded == 0
+
+    # fall back to loading the samples
+    dataset = UnlabelledDataset(targets)
+    subset = get_class_subset(dataset, class_subset)
+    assert list(subset.indices) == expected
+    assert dataset.n_loaded == len(targets)
@@ -84,3 +84,17 @@ def test_class_subsets(class_subset, val_ratio, download_path):
     assert len(dataset_subset._source_by_split["val"]) == val_dataset_subset_length
     assert len(dataset_subset._source_by_split["test"]) == test_dataset_subset_length
     assert len(dataset_subset) == train_dataset_subset_length
+
+
+@pytest.mark.parametrize("dataset_name", ["USPS", "MNISTM"])
+def test_get_batch(dataset_name, download_path):
+    source, _, _ = DigitDataset.get_source_target(DigitDataset(dataset_name), DigitDataset("MNISTM"), download_path)
+    dataset = source.get_test()
+    indices = [3, 0, 7, 7]
+
+    imgs, labels = dataset.get_batch(indices)
+    expected_imgs, expected_labels = torch.utils.data.default_collate([dataset[i] for i in indices])
+    assert imgs.shape == expected_imgs.shape == (4, 3, 32, 32)
+    assert torch.equal(labels, expected_labels)
+    # tensor and PIL resizing differ slightly
+    assert torch.allclose(imgs, expected_imgs, atol=0.1)
@@ -0,0 +1,111 @@
+import concurrent.futures
+import os
+import pickle
+
+import pandas as pd
+import pytest
+import torch
+
+from kale.loaddata.frame_archive import FrameArchive, FrameShard, get_shard_path, pack_frame_archive, pack_video
+from kale.loaddata.video_datasets import EPIC
+from kale.loaddata.videos import VideoFrameDataset
+from kale.prepdata.video_transform import ImglistToTensor
+from tests.helpers.video_frames import make_video_frames, save_frame
+
+N_FRAMES = 12
+
+
+def test_pack_video(tmp_path):
+    video_dir = tmp_path / "video"
+    for name in ["img_1.jpg", "img_2.jpg", os.path.join("u", "img_1.jpg")]:
+        save_frame(str(video_dir / name), len(name))
+    shard_path = str(tmp_path / "video.frames")
+    assert pack_video(str(video_dir), shard_path) == 3
+
+    shard = FrameShard(shard_path)
+    assert shard.names == ["img_1.jpg", "img_2.jpg", "u/img_1.jpg"]
+    for name in shard.names:
+        with open(video_dir / name, "rb") as frame:
+            assert shard.read(name) == frame.read()
+    with pytest.raises(KeyError, match="img_3.jpg"):
+        shard.read("img_3.jpg")
+    shard.close()
+
+    with pytest.raises(ValueError, match="not in the frames folder"):
+        get_shard_path(str(tmp_path / "archive"), str(video_dir), str(tmp_path))
+
+
+@pytest.mark.parametrize("image_modality", ["rgb", "flow"])
+def test_video_frame_dataset_archive(tmp_path, image_modality):
+    frames_root, annotation_path = make_video_frames(str(tmp_path), n_frames=N_FRAMES)
+    template = "img_{:05d}.jpg" if image_modality == "rgb" else "flow_{}_{:05d}.jpg"
+    params = dict(
+        root_path=frames_root,
+        annotationfile_path=annotation_path,
+        image_modality=image_modality,
+        num_segments=2,
+        frames_per_segment=4,
+        imagefile_template=template,
+        transform=ImglistToTensor(),
+        test_mode=True,
+    )
+    dataset = VideoFrameDataset(**params)
+    archive_root = str(tmp_path / "archive")
+    assert pack_frame_archive(dataset, archive_root) == 3
+    assert pack_frame_archive(dataset, archive_root) == 0
+    archive_dataset = VideoFrameDataset(frame_archive=archive_root, **params)
+
+    for index in range(len(dataset)):
+        (frames, label), (archive_frames, archive_label) = dataset[index], archive_dataset[index]
+        assert label == archive_label
+        assert torch.equal(frames, archive_frames)
+    # the open shards are not pickled with the dataset
+    assert len(pickle.loads(pickle.dumps(archive_dataset)).frame_archive._shards) == 0
+
+
+def test_frame_archive_threads(tmp_path):
+    frames_root, annotation_path = make_video_frames(str(tmp_path), n_frames=N_FRAMES)
+    dataset = VideoFrameDataset(
+        root_path=frames_root, annotationfile_path=annotation_path, imagefile_template="img_{:05d}.jpg"
+    )
+    archive_root = str(tmp_path / "archive")
+    pack_frame_archive(dataset, archive_root)
+    # the frames of all the videos are read at once, evicting the shards of one another
+    archive = pickle.loads(pickle.dumps(FrameArchive(archive_root, frames_root, max_open_shards=1)))
+    frames = [
+        (f"video_{video}", f"img_{i:05d}.jpg") for _ in range(10) for video in range(3) for i in range(1, N_FRAMES + 1)
+    ]
+
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        contents = list(pool.map(lambda frame: archive.read(os.path.join(frames_root, frame[0]), frame[1]), frames))
+    for (video_dir, name), content in zip(frames, contents):
+        with open(os.path.join(frames_root, video_dir, name), "rb") as frame:
+            assert content == frame.read()
+    assert len(archive._shards) == 1
+    archive.close()
+
+
+def test_epic_archive(tmp_path):
+    root = tmp_path / "EPIC"
+    for i in range(1, N_FRAMES + 1):
+        for channel in ["u", "v"]:
+            save_frame(str(root / "flow" / "train" / "P01" / "P01_01" / channel / f"img_{i:010d}.jpg"), i)
+    rows = [[0, "P01", "P01_01", 0, 0, 0, 1, 2 * N_FRAMES, 0, 3]]
+    pd.DataFrame(rows).to_pickle(str(tmp_path / "annotations.pkl"))
+    params = dict(
+        root_path=str(root),
+        annotationfile_path=str(tmp_path / "annotations.pkl"),
+        dataset_split="train",
+        image_modality="flow",
+        frames_per_segment=8,
+        transform=ImglistToTensor(),
+        test_mode=True,
+    )
+    dataset = EPIC(**params)
+    archive_root = str(tmp_path / "archive")
+    assert pack_frame_archive(dataset, archive_root) == 1
+    assert os.path.exists(get_shard_path(archive_root, root, root / "flow" / "train" / "P01" / "P01_01"))
+
+    archive_dataset = EPIC(frame_archive=archive_root, **params)
+    assert isinstance(archive_dataset.frame_archive, FrameArchive)
+    assert torch.equal(dataset[0][0], archive_dataset[0][0])
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import torch
+
+from kale.loaddata.frame_cache import FrameCache
+from kale.loaddata.videos import VideoFrameDataset
+from kale.prepdata.video_transform import ImglistToTensor
+from tests.helpers.video_frames import make_video_frames
+
+
+def test_frame_cache():
+    cache = FrameCache(max_bytes=3 * 100, max_frame_bytes=100)
+    assert cache.n_slots == 3
+    frames = {f"frame_{i}": np.full((4, 5), i, dtype=np.uint8) for i in range(4)}
+    assert cache.get("frame_0") is None
+    for key in ["frame_0", "frame_1", "frame_2"]:
+        cache.put(key, frames[key])
+    assert len(cache) == 3
+    assert np.array_equal(cache.get("frame_0"), frames["frame_0"])
+
+    # frame_1 is the least recently used frame
+    cache.put("frame_3", frames["frame_3"])
+    assert cache.get("frame_1") is None
+    for key in ["frame_0", "frame_2", "frame_3"]:
+        assert np.array_equal(cache.get(key), frames[key])
+    assert (cache.n_hits, cache.n_misses) == (4, 2)
+
+    # frames larger than a slot are not cached
+    cache.put("large", np.zeros((3, 4, 10), dtype=np.uint8))
+    assert cache.get("large") is None
+    with pytest.raises(ValueError, match="uint8"):
+        cache.put("float", np.zeros((4, 5)))
+    with pytest.raises(ValueError, match="cannot hold"):
+        FrameCache(max_bytes=10, max_frame_bytes=100)
+
+
+@pytest.mark.parametrize("image_modality", ["rgb", "flow"])
+def test_video_frame_dataset_cache(tmp_path, image_modality):
+    frames_root, annotation_path = make_video_frames(str(tmp_path))
+    params = dict(
+        root_path=frames_root,
+        annotationfile_path=annotation_path,
+        image_modality=image_modality,
+        num_segments=2,
+        frames_per_segment=4,
+        imagefile_template="img_{:05d}.jpg" if image_modality == "rgb" else "flow_{}_{:05d}.jpg",
+        transform=ImglistToTensor(),
+        test_mode=True,
+    )
+    cache = FrameCache(max_bytes=2 ** 20, max_frame_bytes=8 * 10 * 3)
+    dataset = VideoFrameDataset(**params)
+    cached_dataset = VideoFrameDataset(frame_cache=cache, **params)
+    # each clip has 8 frames, read from 8 rgb images or 4 pairs of flow images (consecutive frames share their flow)
+    n_images = len(dataset) * 8
+
+    loader = torch.utils.data.DataLoader(cached_dataset, batch_size=2, num_workers=2)
+    for _ in range(2):
+        cached_frames = torch.cat([frames for frames, _ in loader])
+        assert torch.equal(cached_frames, torch.stack([dataset[i][0] for i in range(len(dataset))]))
+    # the workers fill the same cache, and read it during the second epoch
+    assert cache.n_misses == len(cache) <= n_images
+    assert cache.n_hits + cache.n_misses == 2 * n_images
@@ -0,0 +1,151 @@
+import pytest
+import torch
+
+from kale.loaddata.dataset_access import DatasetAccess
+from kale.loaddata.multi_domain import DatasetSizeType, DomainsDatasetBase, MultiDomainDatasets, MultiSourceDatasets
+from kale.loaddata.splits import StratifiedSplitter
+
+N_CLASSES = 4
+
+
+class RangeDataset(torch.utils.data.Dataset):
+    def __init__(self, size, offset):
+        self.data = torch.arange(offset, offset + size, dtype=torch.float32).unsqueeze(1)
+        self.targets = torch.arange(size) % N_CLASSES
+
+    def __getitem__(self, index):
+        return self.data[index], self.targets[index]
+
+    def __len__(self):
+        return len(self.targets)
+
+
+class RangeAccess(DatasetAccess):
+    """Domain whose samples are the numbers offset, offset + 1, ..., offset + size - 1."""
+
+    def __init__(self, size, offset):
+        super().__init__(n_classes=N_CLASSES)
+        self._size = size
+        self._offset = offset
+        self.n_loaded = {"train": 0, "test": 0}
+
+    def get_train(self):
+        self.n_loaded["train"] += 1
+        return RangeDataset(self._size, self._offset)
+
+    def get_test(self):
+        self.n_loaded["test"] += 1
+        return RangeDataset(self._size // 4, self._offset)
+
+
+@pytest.mark.parametrize("weight_type", ["natural", "balanced"])
+@pytest.mark.parametrize("schedule", ["round_robin", "temperature"])
+def test_multi_source_datasets(weight_type, schedule):
+    sources = [RangeAccess(size, 1000 * (i + 1)) for i, size in enumerate([200, 100, 80, 40, 40])]
+    dataset = MultiSourceDatasets(
+        sources,
+        RangeAccess(100, 0),
+        config_weight_type=weight_type,
+        schedule=schedule,
+        n_sources_per_step=2,
+        max_active_sources=3,
+        seed=0,
+    )
+    assert isinstance(dataset, DomainsDatasetBase)
+    dataset.prepare_data_loaders()
+    assert len(dataset) == int(0.9 * 460)
+
+    loader = dataset.get_domain_loaders(split="train", batch_size=8)
+    assert len(loader) == len(dataset) // 2 // 8
+    for source_1, source_2, target in loader:
+        for x, _, d in [source_1, source_2]:
+            # samples of domain d are in [1000 * (d + 1), 1000 * (d + 2))
+            assert torch.all(x // 1000 == d.unsqueeze(1) + 1)
+        assert torch.all(target[0] < 1000)
+    assert len(list(dataset.get_domain_loaders(split="test", batch_size=8))) == (50 + 25 + 20 + 10 + 10) // 2 // 8
+
+    with pytest.raises(ValueError, match="n_sources_per_step"):
+        MultiSourceDatasets(sources, RangeAccess(100, 0), n_sources_per_step=6)
+
+
+def test_multi_source_datasets_seeds():
+    sources = [RangeAccess(40, 1000), RangeAccess(40, 2000)]
+    params = dict(n_sources_per_step=2, seed=0, splitter=StratifiedSplitter(seed=0))
+    dataset = MultiSourceDatasets(sources, RangeAccess(40, 0), **params)
+    source_1, source_2, target = next(iter(dataset.get_domain_loaders(split="train", batch_size=8)))
+    # the domains of the same size are not sampled in lockstep
+    assert not torch.equal(source_1[0] % 1000, source_2[0] % 1000)
+    assert not torch.equal(source_1[0] % 1000, target[0])
+
+    # the samplers are seeded
+    other_dataset = MultiSourceDatasets(sources, RangeAccess(40, 0), **params)
+    other_source_1, _, _ = next(iter(other_dataset.get_domain_loaders(split="train", batch_size=8)))
+    assert torch.equal(source_1[0], other_source_1[0])
+
+
+@pytest.mark.parametrize(
+    "size_type, epoch_size, n_batches",
+    [
+        ("max", None, 400 // 8),
+        ("source", None, 200 // 8),
+        ("min", None, 200 // 8),
+        ("batches", 7, 7),
+        ("samples", 100, 100 // 8),
+        ("time", 1000.0, 400 // 8),
+    ],
+)
+def test_size_type(size_type, epoch_size, n_batches):
+    source, target = RangeAccess(200, 1000), RangeAccess(400, 0)
+    dataset = MultiDomainDatasets(
+        source, target, config_size_type=size_type, val_split_ratio=0.0, epoch_size=epoch_size
+    )
+    dataset.prepare_data_loaders()
+    loader = dataset.get_domain_loaders(split="train", batch_size=8)
+    assert len(loader) == n_batches
+    assert len(list(loader)) == n_batches
+
+
+@pytest.mark.parametrize("size_type", ["batches", "samples", "time"])
+def test_size_type_needs_epoch_size(size_type):
+    with pytest.raises(ValueError, match="epoch size"):
+        MultiDomainDatasets(RangeAccess(200, 1000), RangeAccess(400, 0), config_size_type=size_type)
+    with pytest.raises(ValueError, match="epoch size"):
+        DatasetSizeType.get_n_batches(DatasetSizeType(size_type), 8, 0, RangeDataset(10, 0))
+
+
+@pytest.mark.parametrize("n_fewshot", [None, 2])
+def test_lazy_splits(n_fewshot):
+    source, target = RangeAccess(200, 1000), RangeAccess(400, 0)
+    dataset = MultiDomainDatasets(source, target, n_fewshot=n_fewshot, class_ids=[0, 1, 2])
+    dataset.prepare_data_loaders()
+    assert source.n_loaded == target.n_loaded == {"train": 1, "test": 0}
+    assert len(dataset) >= len(dataset._source_by_split["train"]) > 0
+
+    # the validation split comes from the same train/val split, the test split is loaded on demand
+    train_indices = set(dataset._source_by_split["train"].dataset.indices)
+    dataset.get_domain_loaders(split="valid", batch_size=8)
+    assert not train_indices & set(dataset._source_by_split["valid"].dataset.indices)
+    assert source.n_loaded == {"train": 1, "test": 0}
+    for _ in range(2):
+        dataset.get_domain_loaders(split="test", batch_size=8)
+    assert source.n_loaded == target.n_loaded == {"train": 1, "test": 1}
+    assert dataset.is_semi_supervised() == (len(dataset._labeled_target_by_split or {}) == 3)
+
+    with pytest.raises(ValueError, match="Unknown split"):
+        dataset.get_domain_loaders(split="val")
+
+
+def test_splitter(tmp_path):
+    def make_dataset():
+        splitter = StratifiedSplitter(seed=0, cache_dir=tmp_path)
+        dataset = MultiDomainDatasets(RangeAccess(200, 1000), RangeAccess(400, 0), n_fewshot=3, splitter=splitter)
+        dataset.prepare_data_loaders()
+        return dataset
+
+    dataset = make_dataset()
+    assert len(dataset._source_by_split["train"]) == 180
+    assert len(dataset._labeled_target_by_split["train"]) == 3 * N_CLASSES
+    # a new run reuses the saved splits
+    other = make_dataset()
+    for splits in ["_source_by_split", "_target_by_split", "_labeled_target_by_split"]:
+        assert list(getattr(other, splits)["train"].indices) == list(getattr(dataset, splits)["train"].indices)
@@ -0,0 +1,405 @@
+import types
+
+import numpy as np
+import pytest
+import torch
+
+import kale.loaddata.sampler
+from kale.loaddata.sampler import (
+    _build_alias_table,
+    _draw_alias,
+    BalancedBatchSampler,
+    BatchedFetchDataset,
+    get_label_index,
+    get_labels,
+    InfiniteBatchSampler,
+    MultiDataLoader,
+    RandomBatchSampler,
+    ReweightedBatchSampler,
+    SamplingConfig,
+    ScheduledMultiDataLoader,
+)
+
+N_CLASSES = 4
+N_SAMPLES = 203
+
+
+class LabelledDataset(torch.utils.data.Dataset):
+    """A small in-memory dataset exposing its labels through ``targets``, like the torchvision datasets."""
+
+    def __init__(self, targets):
+        self.targets = torch.as_tensor(targets)
+        self.data = torch.arange(len(targets), dtype=torch.float32).unsqueeze(1)
+
+    def __getitem__(self, index):
+        return self.data[index], self.targets[index]
+
+    def __len__(self):
+        return len(self.targets)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    # imbalanced labels, with the last class smaller than the per-class sample size
+    targets = np.concatenate([np.full(100, 0), np.full(60, 1), np.full(40, 2), np.full(3, 3)])
+    return LabelledDataset(targets)
+
+
+@pytest.mark.parametrize("precompute", [False, True])
+def test_balanced_batch_sampler(dataset, precompute):
+    batch_size = 32
+    sampler = BalancedBatchSampler(dataset, batch_size=batch_size, precompute=precompute)
+    batches = list(sampler)
+    n_per_class = batch_size // N_CLASSES
+
+    assert len(batches) == len(sampler) == N_SAMPLES // batch_size
+    labels = dataset.targets.numpy()
+    for batch in batches:
+        assert len(batch) == n_per_class * N_CLASSES
+        assert np.all(np.bincount(labels[np.asarray(batch)], minlength=N_CLASSES) == n_per_class)
+
+
+def test_balanced_batch_sampler_plan(dataset):
+    sampler = BalancedBatchSampler(dataset, batch_size=32, precompute=True)
+    plan = sampler._get_epoch_plan(np.random.default_rng(0))
+    assert plan.dtype == np.int64
+    assert plan.shape == (len(sampler), 32)
+    # a class with enough items never repeats an index inside a batch
+    labels = dataset.targets.numpy()
+    for row in plan:
+        class_0 = row[labels[row] == 0]
+        assert len(np.unique(class_0)) == len(class_0)
+
+
+@pytest.mark.parametrize("precompute", [False, True])
+def test_reweighted_batch_sampler(dataset, precompute):
+    class_weights = np.array([0.1, 0.2, 0.3, 0.4])
+    sampler = ReweightedBatchSampler(
+        dataset,
+        batch_size=16,
+        class_weights=class_weights,
+        precompute=precompute,
+        generator=np.random.default_rng(0),
+    )
+    batches = list(sampler)
+
+    assert len(batches) == len(sampler) == N_SAMPLES // 16
+    assert all(len(batch) == 16 for batch in batches)
+    indices = np.concatenate([np.asarray(batch) for batch in batches])
+    assert np.all((indices >= 0) & (indices < N_SAMPLES))
+
+
+def test_alias_table():
+    weights = np.array([5.0, 1.0, 0.0, 3.0, 1.0])
+    prob, alias = _build_alias_table(weights)
+    # the alias table encodes the normalized distribution exactly
+    recovered = prob.copy()
+    np.add.at(recovered, alias, 1 - prob)
+    assert np.allclose(recovered / len(weights), weights / weights.sum())
+
+    draws = _draw_alias(prob, alias, 200000, np.random.default_rng(0))
+    frequencies = np.bincount(draws, minlength=len(weights)) / len(draws)
+    assert frequencies[2] == 0
+    assert np.allclose(frequencies, weights / weights.sum(), atol=0.01)
+
+
+def test_label_index(dataset):
+    label_index = get_label_index(dataset)
+    labels = dataset.targets.numpy()
+
+    assert get_label_index(dataset) is label_index
+    assert np.array_equal(label_index.classes, np.arange(N_CLASSES))
+    assert np.array_equal(label_index.counts, np.bincount(labels))
+    for class_ in label_index.classes:
+        assert np.array_equal(label_index.class_indices(class_), np.where(labels == class_)[0])
+    assert len(label_index.class_indices(N_CLASSES)) == 0
+
+
+def test_label_index_nested_subsets(dataset):
+    train, _ = torch.utils.data.random_split(dataset, [150, 53], generator=torch.Generator().manual_seed(0))
+    subset = torch.utils.data.Subset(train, np.arange(0, 150, 3))
+    expected = np.array([subset[i][1].item() for i in range(len(subset))])
+
+    assert np.array_equal(get_labels(subset), expected)
+    label_index = get_label_index(subset)
+    for class_ in label_index.classes:
+        assert np.array_equal(label_index.class_indices(class_), np.where(expected == class_)[0])
+
+
+@pytest.mark.parametrize("n_prefetch", [0, 2])
+def test_multi_dataloader(dataset, n_prefetch):
+    small = torch.utils.data.Subset(dataset, list(range(40)))
+    config = SamplingConfig()
+    loaders = [config.create_loader(dataset, 16), config.create_loader(small, 16)]
+    multi_loader = MultiDataLoader(loaders, n_batches=10, n_prefetch=n_prefetch)
+
+    for _ in range(2):
+        batches = list(multi_loader)
+        assert len(batches) == len(multi_loader) == 10
+        for source_batch, target_batch in batches:
+            assert source_batch[0].shape == target_batch[0].shape == (16, 1)
+            # the small domain wraps around and stays within its subset
+            assert torch.all(target_batch[0] < 40)
+
+
+class FakeClock:
+    """Replaces ``time.monotonic`` in the sampler module by a clock advanced by the test."""
+
+    def __init__(self, monkeypatch):
+        self.now = 0.0
+        monkeypatch.setattr(kale.loaddata.sampler, "time", types.SimpleNamespace(monotonic=lambda: self.now))
+
+
+@pytest.mark.parametrize("n_prefetch", [0, 2])
+def test_multi_dataloader_time_budget(dataset, n_prefetch, monkeypatch):
+    clock = FakeClock(monkeypatch)
+    loaders = [SamplingConfig().create_loader(dataset, 16), SamplingConfig().create_loader(dataset, 16)]
+    multi_loader = MultiDataLoader(loaders, n_batches=100, n_prefetch=n_prefetch, time_budget=3.5)
+    assert len(multi_loader) == 100
+    for _ in range(2):
+        n_batches = 0
+        for _ in multi_loader:
+            clock.now += 1
+            n_batches += 1
+        # the epoch ends at the first batch past the budget, and its length is kept for the schedules
+        assert n_batches == len(multi_loader) == multi_loader.n_batches_last_epoch == 4
+
+    with pytest.raises(ValueError, match="time_budget"):
+        MultiDataLoader(loaders, n_batches=10, time_budget=0)
+
+
+def test_multi_dataloader_prefetch_carry_over(dataset, monkeypatch):
+    clock = FakeClock(monkeypatch)
+    samples = []
+    for n_prefetch in [0, 2]:
+        loaders = [
+            SamplingConfig(infinite=True, seed=0).create_loader(dataset, 16),
+            SamplingConfig(infinite=True, seed=1).create_loader(dataset, 8),
+        ]
+        multi_loader = MultiDataLoader(loaders, n_batches=100, n_prefetch=n_prefetch, time_budget=3.5)
+        samples.append([])
+        for _ in range(3):
+            for batches in multi_loader:
+                clock.now += 1
+                samples[-1].append([x.flatten().tolist() for x, _ in batches])
+        assert len(samples[-1]) == 12
+    # the batches prefetched past the budget are consumed in the next epoch, so no sample is skipped
+    assert samples[0] == samples[1]
+
+
+def test_multi_dataloader_prefetch_error(dataset):
+    class BrokenDataset(LabelledDataset):
+        def __getitem__(self, index):
+            raise RuntimeError("cannot load sample")
+
+    loaders = [SamplingConfig().create_loader(dataset, 16), SamplingConfig().create_loader(BrokenDataset([0] * 32), 16)]
+    with pytest.raises(RuntimeError, match="cannot load sample"):
+        list(MultiDataLoader(loaders, n_batches=4, n_prefetch=2))
+
+
+@pytest.mark.parametrize("n_prefetch", [0, 2])
+def test_multi_dataloader_infinite(dataset, n_prefetch):
+    small = torch.utils.data.Subset(dataset, list(range(40)))
+    loaders = [
+        SamplingConfig(infinite=True).create_loader(dataset, 16),
+        SamplingConfig(infinite=True).create_loader(small, 16),
+    ]
+    assert isinstance(loaders[0].batch_sampler, InfiniteBatchSampler)
+    assert len(loaders[1]) == 2
+
+    multi_loader = MultiDataLoader(loaders, n_batches=5, n_prefetch=n_prefetch)
+    iterators = list(multi_loader._iterators)
+    for _ in range(2):
+        assert len(list(multi_loader)) == 5
+    # the streams are kept across epochs and wrap around without being restarted
+    assert multi_loader._iterators == iterators
+    assert multi_loader.n_wraps[0] == 0
+    assert multi_loader.n_wraps[1] >= 4
+
+
+def test_multi_dataloader_n_wraps(dataset):
+    small = torch.utils.data.Subset(dataset, list(range(40)))
+    loaders = [SamplingConfig().create_loader(dataset, 16), SamplingConfig().create_loader(small, 16)]
+    multi_loader = MultiDataLoader(loaders, n_batches=5)
+    list(multi_loader)
+    assert multi_loader.n_wraps == [0, 2]
+
+
+SAMPLERS = [
+    lambda dataset, seed, **kwargs: RandomBatchSampler(dataset, 16, generator=seed, **kwargs),
+    lambda dataset, seed, **kwargs: BalancedBatchSampler(dataset, 16, generator=seed, **kwargs),
+    lambda dataset, seed, **kwargs: BalancedBatchSampler(dataset, 16, precompute=True, generator=seed, **kwargs),
+    lambda dataset, seed, **kwargs: ReweightedBatchSampler(
+        dataset, 16, np.array([0.1, 0.2, 0.3, 0.4]), generator=seed, **kwargs
+    ),
+    lambda dataset, seed, **kwargs: ReweightedBatchSampler(
+        dataset, 16, np.array([0.1, 0.2, 0.3, 0.4]), precompute=True, generator=seed, **kwargs
+    ),
+]
+
+
+def _as_lists(batches):
+    return [np.asarray(batch).tolist() for batch in batches]
+
+
+@pytest.mark.parametrize("make_sampler", SAMPLERS)
+def test_sampler_resume(dataset, make_sampler):
+    sampler = make_sampler(dataset, 0)
+    epochs = [_as_lists(sampler) for _ in range(2)]
+    # same seed, same batches; each epoch is a new draw
+    assert _as_lists(make_sampler(dataset, 0)) == epochs[0]
+    assert epochs[0] != epochs[1]
+
+    sampler = make_sampler(dataset, 0)
+    iterator = iter(sampler)
+    for _ in range(5):
+        next(iterator)
+    state = sampler.state_dict()
+    assert state["epoch"] == 0 and state["position"] == 5
+
+    resumed = make_sampler(dataset, 1)
+    resumed.load_state_dict(state)
+    assert _as_lists(resumed) == epochs[0][5:]
+    assert _as_lists(resumed) == epochs[1]
+
+
+def test_sampler_global_seed(dataset):
+    np.random.seed(0)
+    batches = _as_lists(RandomBatchSampler(dataset, batch_size=16))
+    np.random.seed(0)
+    assert _as_lists(RandomBatchSampler(dataset, batch_size=16)) == batches
+
+
+@pytest.mark.parametrize("n_prefetch", [0, 2])
+@pytest.mark.parametrize("infinite", [False, True])
+def test_multi_dataloader_resume(dataset, n_prefetch, infinite):
+    small = torch.utils.data.Subset(dataset, list(range(40)))
+
+    def make_multi_loader():
+        config = SamplingConfig(infinite=infinite, seed=0)
+        loaders = [config.create_loader(dataset, 16), config.create_loader(small, 16)]
+        return MultiDataLoader(loaders, n_batches=6, n_prefetch=n_prefetch)
+
+    def as_lists(batches):
+        return [[domain_batch[0].flatten().tolist() for domain_batch in batch] for batch in batches]
+
+    multi_loader = make_multi_loader()
+    expected = as_lists(multi_loader) + as_lists(multi_loader)
+
+    multi_loader = make_multi_loader()
+    consumed = []
+    for batch in multi_loader:
+        consumed.append(batch)
+        if len(consumed) == 4:
+            break
+    state = multi_loader.state_dict()
+    assert state["position"] == 4
+
+    resumed = make_multi_loader()
+    resumed.load_state_dict(state)
+    assert as_lists(consumed) + as_lists(resumed) + as_lists(resumed) == expected
+
+
+@pytest.mark.parametrize("make_sampler", SAMPLERS)
+@pytest.mark.parametrize("num_replicas", [2, 3])
+def test_sampler_distributed(dataset, make_sampler, num_replicas):
+    full_plan = _as_lists(make_sampler(dataset, 0))
+    shards = []
+    for rank in range(num_replicas):
+        sampler = make_sampler(dataset, 0, num_replicas=num_replicas, rank=rank)
+        shards.append(_as_lists(sampler))
+        assert len(shards[rank]) == len(sampler) == len(full_plan) // num_replicas
+
+    # the processes get disjoint batches of the same plan
+    n_batches = len(shards[0]) * num_replicas
+    dealt = [shards[k % num_replicas][k // num_replicas] for k in range(n_batches)]
+    assert dealt == full_plan[:n_batches]
+
+    with pytest.raises(ValueError, match="Cannot resume"):
+        make_sampler(dataset, 0).load_state_dict(sampler.state_dict())
+
+
+def test_balanced_batch_sampler_distributed(dataset):
+    labels = dataset.targets.numpy()
+    for rank in range(2):
+        sampler = BalancedBatchSampler(dataset, batch_size=16, precompute=True, generator=0, num_replicas=2, rank=rank)
+        for batch in sampler:
+            assert np.all(np.bincount(labels[batch], minlength=N_CLASSES) == 16 // N_CLASSES)
+    with pytest.raises(ValueError, match="Invalid rank"):
+        BalancedBatchSampler(dataset, batch_size=16, num_replicas=2, rank=2)
+
+
+class BatchedDataset(LabelledDataset):
+    def __init__(self, targets):
+        super().__init__(targets)
+        self.n_batch_calls = 0
+
+    def get_batch(self, indices):
+        self.n_batch_calls += 1
+        return self.data[indices], self.targets[indices]
+
+
+def test_batched_fetch(dataset):
+    batched = BatchedDataset(dataset.targets)
+    train, _ = torch.utils.data.random_split(batched, [150, 53], generator=torch.Generator().manual_seed(0))
+    subset = torch.utils.data.Subset(train, np.arange(0, 150, 2))
+
+    for config in [
+        SamplingConfig(seed=0, batched_fetch=True),
+        SamplingConfig(seed=0, batched_fetch=True, infinite=True),
+    ]:
+        loader = config.create_loader(subset, 16)
+        per_sample = SamplingConfig(seed=0).create_loader(subset, 16)
+        n_batch_calls = batched.n_batch_calls
+        for (x_ref, y_ref), (x, y) in zip(per_sample, loader):
+            assert torch.equal(x, x_ref) and torch.equal(y, y_ref)
+        assert batched.n_batch_calls - n_batch_calls == len(per_sample)
+
+    multi_loader = MultiDataLoader([loader, SamplingConfig(batched_fetch=True).create_loader(batched, 16)], 3)
+    assert len(list(multi_loader)) == 3
+    assert multi_loader.state_dict()["position"] == 0
+
+    with pytest.raises(ValueError, match="get_batch"):
+        BatchedFetchDataset(dataset)
+
+
+@pytest.mark.parametrize("schedule", ScheduledMultiDataLoader.SCHEDULES)
+def test_scheduled_multi_dataloader(dataset, schedule):
+    sizes = [160, 80, 32, 16, 16]
+    domains = [torch.utils.data.Subset(dataset, list(range(size))) for size in sizes]
+    loaders = [SamplingConfig().create_loader(domain, 16) for domain in domains]
+    target_loader = SamplingConfig().create_loader(dataset, 8)
+    multi_loader = ScheduledMultiDataLoader(
+        loaders,
+        n_batches=300,
+        schedule=schedule,
+        n_per_step=2,
+        temperature=2.0,
+        always_dataloaders=[target_loader],
+        max_active=3,
+        seed=0,
+    )
+
+    for batches in multi_loader:
+        assert len(batches) == 3
+        (x_1, _, d_1), (x_2, _, d_2), (x_target, _) = batches
+        assert d_1[0] != d_2[0] and x_1.shape == x_2.shape == (16, 1) and x_target.shape == (8, 1)
+        for x, d in [(x_1, d_1), (x_2, d_2)]:
+            assert torch.all(d == d[0]) and torch.all(x < sizes[d[0]])
+        assert len(multi_loader._iterators) <= 3
+
+    frequencies = multi_loader.domain_counts / multi_loader.domain_counts.sum()
+    if schedule == "round_robin":
+        assert np.all(multi_loader.domain_counts == 120)
+    else:
+        # larger domains are drawn more often
+        assert np.all(np.diff(frequencies[:3]) < 0)
+
+
+def test_scheduled_multi_dataloader_round_robin():
+    loaders = [[(torch.zeros(1), torch.zeros(1))]] * 3
+    multi_loader = ScheduledMultiDataLoader(loaders, n_batches=2, sizes=[1, 1, 1])
+    assert multi_loader.get_schedule().ravel().tolist() == [0, 1]
+    assert multi_loader.get_schedule().ravel().tolist() == [2, 0]
+    with pytest.raises(ValueError, match="Unknown schedule"):
+        ScheduledMultiDataLoader(loaders, n_batches=2, schedule="random")
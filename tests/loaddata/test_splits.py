@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from kale.loaddata.splits import get_fingerprint, stratified_partition, StratifiedSplitter
+
+
+class LabelledDataset(torch.utils.data.Dataset):
+    def __init__(self, targets, root="data"):
+        self.targets = torch.as_tensor(targets)
+        self.root = root
+
+    def __getitem__(self, index):
+        return torch.zeros(1), self.targets[index]
+
+    def __len__(self):
+        return len(self.targets)
+
+
+@pytest.fixture
+def dataset():
+    targets = np.concatenate([np.full(100, 0), np.full(60, 1), np.full(40, 2), np.full(10, 3)])
+    return LabelledDataset(np.random.RandomState(0).permutation(targets))
+
+
+def test_stratified_partition(dataset):
+    labels = dataset.targets.numpy()
+    first, second = stratified_partition(labels, lambda counts: counts // 10, random_state=0)
+    assert np.array_equal(np.sort(np.concatenate([first, second])), np.arange(len(labels)))
+    assert np.array_equal(np.bincount(labels[first]), [10, 6, 4, 1])
+
+    same_first, _ = stratified_partition(labels, lambda counts: counts // 10, random_state=0)
+    other_first, _ = stratified_partition(labels, lambda counts: counts // 10, random_state=1)
+    assert np.array_equal(first, same_first)
+    assert not np.array_equal(first, other_first)
+
+
+def test_stratified_splitter(dataset):
+    splitter = StratifiedSplitter(seed=0)
+    train, valid = splitter.train_val_split(dataset, 0.2)
+    labels = dataset.targets.numpy()
+    assert np.array_equal(np.bincount(labels[valid.indices]), [20, 12, 8, 2])
+    assert len(train) + len(valid) == len(dataset)
+
+    labeled, unlabeled = splitter.few_shot_split(train, 3)
+    assert np.array_equal(np.bincount(labels[np.asarray(train.indices)[labeled.indices]]), [3, 3, 3, 3])
+    assert len(labeled) + len(unlabeled) == len(train)
+    with pytest.raises(ValueError, match="Cannot take"):
+        splitter.few_shot_split(train, 9)
+
+
+def test_stratified_splitter_cache(dataset, tmp_path):
+    first_train, first_valid = StratifiedSplitter(seed=3, cache_dir=tmp_path).train_val_split(dataset, 0.1)
+    assert len(os.listdir(tmp_path)) == 1
+
+    # the saved split is reloaded as is
+    path = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+    np.savez(path, first=np.array([0, 1]), second=np.array([2, 3]))
+    train, valid = StratifiedSplitter(seed=3, cache_dir=tmp_path).train_val_split(dataset, 0.1)
+    assert list(valid.indices) == [0, 1] and list(train.indices) == [2, 3]
+
+    # other parameters, seeds or datasets have their own splits
+    StratifiedSplitter(seed=4, cache_dir=tmp_path).train_val_split(dataset, 0.1)
+    StratifiedSplitter(seed=3, cache_dir=tmp_path).train_val_split(dataset, 0.2)
+    StratifiedSplitter(seed=3, cache_dir=tmp_path).few_shot_split(dataset, 2)
+    StratifiedSplitter(seed=3, cache_dir=tmp_path).train_val_split(first_train, 0.1)
+    assert len(os.listdir(tmp_path)) == 5
+    assert get_fingerprint(dataset) != get_fingerprint(first_train)
+
+
+def test_fingerprint_identity(dataset):
+    labels = dataset.targets.numpy()
+    assert get_fingerprint(dataset) == get_fingerprint(LabelledDataset(labels))
+    # datasets of the same type and labels, but of other data files, or other subsets, have their own fingerprints
+    assert get_fingerprint(dataset) != get_fingerprint(LabelledDataset(labels, root="other_data"))
+    first = torch.utils.data.Subset(dataset, np.flatnonzero(labels == 0)[:10])
+    second = torch.utils.data.Subset(dataset, np.flatnonzero(labels == 0)[10:20])
+    assert get_fingerprint(first) != get_fingerprint(second)
+
+
+def test_stratified_splitter_multi_label():
+    # verb and noun classes of each sample, like the EPIC-Kitchens annotations
+    verbs = np.random.RandomState(0).permutation(np.repeat([0, 1, 2], [50, 30, 20]))
+    targets = np.stack([verbs, np.arange(100) % 7], axis=1)
+    dataset = LabelledDataset(targets)
+    train, valid = StratifiedSplitter(seed=0).train_val_split(dataset, 0.2)
+    assert np.array_equal(np.bincount(verbs[valid.indices]), [10, 6, 4])
+    assert len(train) + len(valid) == len(dataset)
+    assert get_fingerprint(dataset) != get_fingerprint(LabelledDataset(np.stack([verbs, np.arange(100) % 5], axis=1)))
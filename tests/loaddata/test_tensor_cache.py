@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import torch
+
+from kale.loaddata.dataset_access import DatasetAccess
+from kale.loaddata.sampler import get_labels, SamplingConfig
+from kale.loaddata.tensor_cache import CachedDatasetAccess, TensorCacheDataset
+
+N_SAMPLES = 20
+
+
+class TransformedDataset(torch.utils.data.Dataset):
+    """Small images with a deterministic transform counting its calls."""
+
+    def __init__(self):
+        self.data = torch.arange(N_SAMPLES * 12, dtype=torch.float32).reshape(N_SAMPLES, 3, 2, 2)
+        self.targets = torch.arange(N_SAMPLES) % 4
+        self.n_transformed = 0
+
+    def __getitem__(self, index):
+        self.n_transformed += 1
+        return self.data[index] / 2, int(self.targets[index])
+
+    def __len__(self):
+        return N_SAMPLES
+
+
+class TransformedAccess(DatasetAccess):
+    def __init__(self):
+        super().__init__(n_classes=4)
+
+    def get_train(self):
+        return TransformedDataset()
+
+    def get_test(self):
+        return TransformedDataset()
+
+
+@pytest.mark.parametrize("shared_memory", [False, True])
+def test_tensor_cache(shared_memory):
+    dataset = TransformedDataset()
+    cached = TensorCacheDataset(dataset, shared_memory=shared_memory)
+    assert dataset.n_transformed == (N_SAMPLES if shared_memory else 0)
+
+    for _ in range(2):
+        for i in range(N_SAMPLES):
+            x, y = cached[i]
+            assert torch.equal(x, dataset.data[i] / 2)
+            assert y == dataset.targets[i] and isinstance(y, int)
+    assert dataset.n_transformed == N_SAMPLES
+    assert cached.n_cached == N_SAMPLES
+    assert cached.n_hits == (2 if shared_memory else 1) * N_SAMPLES
+    assert np.array_equal(get_labels(cached), dataset.targets.numpy())
+    assert cached._inputs.is_shared() == shared_memory
+
+
+def test_tensor_cache_eviction():
+    dataset = TransformedDataset()
+    item_bytes = 3 * 2 * 2 * 4
+    cached = TensorCacheDataset(dataset, max_bytes=5 * item_bytes + 1)
+
+    for i in range(8):
+        cached[i]
+    assert cached.n_cached == 5
+    # the least recently used samples were evicted, a recently used one is still cached
+    cached[4]
+    cached[8]
+    assert dataset.n_transformed == 9
+    assert set(np.flatnonzero(cached._slots.numpy() >= 0)) == {4, 5, 6, 7, 8}
+    for i in range(N_SAMPLES):
+        assert torch.equal(cached[i][0], dataset.data[i] / 2)
+
+    with pytest.raises(ValueError, match="cannot hold"):
+        TensorCacheDataset(dataset, max_bytes=item_bytes - 1)[0]
+    with pytest.raises(ValueError, match="whole dataset"):
+        TensorCacheDataset(dataset, max_bytes=item_bytes, shared_memory=True)
+
+
+@pytest.mark.parametrize("shared_memory", [False, True])
+def test_tensor_cache_in_place_transform(shared_memory):
+    dataset = TransformedDataset()
+    cached = TensorCacheDataset(dataset, shared_memory=shared_memory, transform=lambda x: x.mul_(-1))
+    for _ in range(2):
+        for i in range(N_SAMPLES):
+            assert torch.equal(cached[i][0], -dataset.data[i] / 2)
+    # the cached inputs are not modified by the transform
+    assert torch.equal(cached._inputs, dataset.data / 2)
+
+
+def test_cached_dataset_access():
+    access = CachedDatasetAccess(TransformedAccess())
+    assert access.n_classes() == 4
+    assert access.get_train() is access.get_train()
+    assert access.get_test() is not access.get_train()
+
+    train, val = access.get_train_val(0.25)
+    loader = SamplingConfig().create_loader(train, 5)
+    for _ in range(2):
+        for x, y in loader:
+            assert x.shape == (5, 3, 2, 2)
+    assert access.get_train().dataset.n_transformed == len(train)
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kale.loaddata.video_datasets import BasicVideoDataset, EPIC, load_annotations, read_epic_annotations
+from kale.loaddata.videos import VideoAnnotations
+
+N_CLASSES = 4
+
+
+@pytest.fixture
+def epic_annotations(tmp_path):
+    random_state = np.random.RandomState(0)
+    rows = []
+    for i in range(200):
+        participant = random_state.choice(["P01", "P02", "P08", "P22"])
+        video = f"{participant}_{random_state.randint(1, 4):02d}"
+        start = random_state.randint(1, 100)
+        end = start + random_state.randint(0, 30)
+        rows.append([i, participant, video, 0, 0, 0, start, end, 0, random_state.randint(-1, N_CLASSES + 2)])
+    path = str(tmp_path / "epic.pkl")
+    pd.DataFrame(rows).to_pickle(path)
+    return path, rows
+
+
+@pytest.fixture
+def basic_annotations(tmp_path):
+    random_state = np.random.RandomState(0)
+    rows = []
+    for i in range(100):
+        start = random_state.randint(1, 100)
+        end = start + random_state.randint(0, 30)
+        # the frame ids and labels are strings
+        rows.append([f"video_{i % 7}", str(start), str(end), "", "", str(random_state.randint(0, N_CLASSES + 2))])
+    path = str(tmp_path / "basic.pkl")
+    pd.DataFrame(rows).to_pickle(path)
+    return path, rows
+
+
+def get_params(annotation_path, **kwargs):
+    return dict(
+        root_path="root",
+        annotationfile_path=annotation_path,
+        dataset_split="train",
+        image_modality="rgb",
+        frames_per_segment=8,
+        n_classes=N_CLASSES,
+        **kwargs,
+    )
+
+
+def assert_records(dataset, expected_rows):
+    assert isinstance(dataset.video_list, VideoAnnotations)
+    assert len(dataset) == len(expected_rows)
+    for record, (path, start, end, label) in zip(dataset.video_list, expected_rows):
+        assert record.path == os.path.join(dataset.img_path, path)
+        assert (record.start_frame, record.end_frame, record.label) == (start, end, label)
+    assert np.array_equal(dataset.targets, [row[3] for row in expected_rows])
+    assert dataset.make_dataset() == expected_rows
+
+
+def test_epic_annotations(epic_annotations):
+    path, rows = epic_annotations
+    expected_rows = [
+        (os.path.join(row[1], row[2]), row[6], row[7], row[9])
+        for row in rows
+        if row[1] in ["P01", "P08", "P22"] and 0 <= row[9] < N_CLASSES and row[7] - row[6] + 1 >= 8
+    ]
+    dataset = EPIC(**get_params(path))
+    assert_records(dataset, expected_rows)
+    # each video folder is stored once
+    assert len(dataset.video_list.paths) == len({row[0] for row in expected_rows})
+
+
+def test_basic_annotations(basic_annotations):
+    path, rows = basic_annotations
+    expected_rows = [
+        (row[0], int(row[1]), int(row[2]), int(row[5])) for row in rows if 0 <= int(row[5]) < N_CLASSES
+    ]
+    assert_records(BasicVideoDataset(**get_params(path)), expected_rows)
+
+
+def test_annotation_cache(epic_annotations, tmp_path, monkeypatch):
+    path, _ = epic_annotations
+    cache_dir = str(tmp_path / "cache")
+    dataset = EPIC(**get_params(path, annotation_cache_dir=cache_dir))
+    assert len(os.listdir(cache_dir)) == 1
+
+    # the annotation file is not read again
+    def read_pickle(*args, **kwargs):
+        raise AssertionError("the annotations should be read from the cache")
+
+    with monkeypatch.context() as context:
+        context.setattr(pd, "read_pickle", read_pickle)
+        cached_dataset = EPIC(**get_params(path, annotation_cache_dir=cache_dir))
+    assert cached_dataset.make_dataset() == dataset.make_dataset()
+
+    # other parameters are cached separately
+    columns = load_annotations(path, read_epic_annotations, cache_dir, n_classes=2, min_frames=1)
+    assert np.all(columns["labels"] < 2)
+    assert len(os.listdir(cache_dir)) == 2
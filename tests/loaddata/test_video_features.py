@@ -0,0 +1,162 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from kale.loaddata.dataset_access import DatasetAccess
+from kale.loaddata.sampler import SamplingConfig
+from kale.loaddata.video_features import (
+    ClipFeatureDataset,
+    ClipFeatureDatasetAccess,
+    extract_clip_features,
+    get_clip_features_key,
+    get_feature_access_dict,
+)
+from kale.loaddata.video_multi_domain import VideoMultiDomainDatasets
+from kale.loaddata.videos import VideoFrameDataset
+from kale.prepdata.video_transform import ImglistToTensor, TensorPermute
+from tests.helpers.video_frames import make_video_frames
+
+N_VIDEOS = 6
+FEATURE_DIM = 5
+
+
+class Backbone(torch.nn.Module):
+    """Tiny 3D CNN with pooled features, counting its calls."""
+
+    def __init__(self, n_channels=3):
+        super().__init__()
+        self.conv = torch.nn.Conv3d(n_channels, FEATURE_DIM, kernel_size=3, padding=1)
+        self.dropout = torch.nn.Dropout(0.5)
+        self.n_calls = 0
+
+    def forward(self, x):
+        self.n_calls += 1
+        return self.dropout(self.conv(x)).mean(dim=(2, 3, 4), keepdim=True)
+
+
+class FramesAccess(DatasetAccess):
+    """Access to synthetic frames, with random clips for training and symmetrical clips for testing."""
+
+    def __init__(self, video_frames, image_modality="rgb"):
+        super().__init__(n_classes=N_VIDEOS)
+        self._video_frames = video_frames
+        self._image_modality = image_modality
+
+    def _get_dataset(self, test_mode):
+        frames_root, annotation_path = self._video_frames
+        return VideoFrameDataset(
+            root_path=frames_root,
+            annotationfile_path=annotation_path,
+            image_modality=self._image_modality,
+            num_segments=2,
+            frames_per_segment=4,
+            imagefile_template="img_{:05d}.jpg" if self._image_modality == "rgb" else "flow_{}_{:05d}.jpg",
+            transform=torch.nn.Sequential(ImglistToTensor(), TensorPermute()),
+            test_mode=test_mode,
+        )
+
+    def get_train(self):
+        return self._get_dataset(test_mode=False)
+
+    def get_test(self):
+        return self._get_dataset(test_mode=True)
+
+
+@pytest.fixture(scope="module")
+def video_frames(tmp_path_factory):
+    return make_video_frames(str(tmp_path_factory.mktemp("videos")), n_videos=N_VIDEOS, n_frames=20)
+
+
+@pytest.mark.parametrize("n_views", [1, 3])
+def test_extract_clip_features(video_frames, tmp_path, n_views):
+    dataset = FramesAccess(video_frames).get_test()
+    backbone = Backbone()
+    path = str(tmp_path / "features" / "rgb.npy")
+    extract_clip_features(backbone, dataset, path, n_views=n_views, batch_size=4)
+    # the backbone is run in evaluation mode, once per batch of clips
+    assert backbone.training
+    assert backbone.n_calls == n_views * 2
+    assert os.listdir(tmp_path / "features") == ["rgb.npy"]
+
+    backbone.eval()
+    with torch.no_grad():
+        expected = torch.cat([backbone(x).flatten(1) for x, _ in torch.utils.data.DataLoader(dataset, batch_size=4)])
+    features_dataset = ClipFeatureDataset(path, dataset.targets)
+    assert features_dataset.features.shape == (n_views, N_VIDEOS, FEATURE_DIM)
+    # the views of symmetrical clips are the same
+    for view in range(n_views):
+        assert np.allclose(features_dataset.features[view], expected.numpy(), atol=1e-6)
+
+    features, label = features_dataset[2]
+    assert torch.allclose(features, expected[2], atol=1e-6)
+    assert label == 2
+    features, labels = features_dataset.get_batch([4, 1])
+    assert torch.allclose(features, expected[[4, 1]], atol=1e-6)
+    assert labels.tolist() == [4, 1]
+    # the memory map is not pickled
+    assert pickle.loads(pickle.dumps(features_dataset))._features is None
+
+    with pytest.raises(ValueError, match="clips"):
+        ClipFeatureDataset(path, np.arange(N_VIDEOS - 1))
+    with pytest.raises(ValueError, match="empty"):
+        extract_clip_features(backbone, torch.utils.data.Subset(dataset, []), str(tmp_path / "empty.npy"))
+
+
+def test_clip_feature_access(video_frames, tmp_path):
+    backbone = Backbone()
+    cache_dir = str(tmp_path / "cache")
+    access = ClipFeatureDatasetAccess(FramesAccess(video_frames), backbone, "backbone", cache_dir, 0, n_train_views=2)
+    train = access.get_train()
+    test = access.get_test()
+    assert train.features.shape == (2, N_VIDEOS, FEATURE_DIM)
+    assert test.features.shape == (1, N_VIDEOS, FEATURE_DIM)
+    # the random clips of the training views differ
+    assert not np.allclose(train.features[0], train.features[1])
+    assert len(os.listdir(cache_dir)) == 2
+
+    # the features are extracted once
+    n_calls = backbone.n_calls
+    assert np.array_equal(access.get_train().features, train.features)
+    assert backbone.n_calls == n_calls
+    # the random views are seeded
+    indices = np.arange(N_VIDEOS).repeat(4)
+    views = ClipFeatureDataset(train.path, train.labels, seed=1).get_batch(indices)[0]
+    assert torch.equal(views, ClipFeatureDataset(train.path, train.labels, seed=1).get_batch(indices)[0])
+    assert not torch.equal(views, ClipFeatureDataset(train.path, train.labels, seed=2).get_batch(indices)[0])
+    train_part, valid_part = access.get_train_val(0.5)
+    assert len(train_part) == len(valid_part) == N_VIDEOS // 2
+
+    # other sampling configurations have other keys
+    video_access = FramesAccess(video_frames)
+    assert get_clip_features_key(video_access.get_train(), "backbone", 2) != get_clip_features_key(
+        video_access.get_test(), "backbone", 2
+    )
+    assert get_clip_features_key(video_access.get_test(), "backbone", 1) != get_clip_features_key(
+        video_access.get_test(), "other", 1
+    )
+
+
+@pytest.mark.parametrize("batched_fetch", [False, True])
+def test_train_on_clip_features(video_frames, tmp_path, batched_fetch):
+    access_dict = {"rgb": FramesAccess(video_frames), "flow": None}
+    feature_dict = get_feature_access_dict(access_dict, {"rgb": Backbone(), "flow": None}, "backbone", str(tmp_path), 0)
+    assert feature_dict["flow"] is None
+    dataset = VideoMultiDomainDatasets(
+        feature_dict,
+        feature_dict,
+        image_modality="rgb",
+        seed=0,
+        val_split_ratio=0.5,
+        config_size_type="max",
+        source_sampling_config=SamplingConfig(seed=0, batched_fetch=batched_fetch),
+        target_sampling_config=SamplingConfig(seed=1, batched_fetch=batched_fetch),
+    )
+    dataset.prepare_data_loaders()
+    # the batches of features are the input of the classifier and the critic, e.g. ClassNetVideo and DomainNetVideo
+    for (x_s, y_s), (x_t, y_t) in dataset.get_domain_loaders(split="train", batch_size=2):
+        assert x_s.shape == x_t.shape == (2, FEATURE_DIM)
+        assert x_s.dtype == torch.float32
+        assert y_s.shape == y_t.shape == (2,)
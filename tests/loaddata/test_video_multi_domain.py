@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import torch
+
+from kale.loaddata.dataset_access import DatasetAccess
+from kale.loaddata.video_multi_domain import VideoMultiDomainDatasets
+from kale.loaddata.videos import JointVideoDataset, VideoFrameDataset
+from kale.prepdata.video_transform import ImglistToTensor
+from tests.helpers.video_frames import make_video_frames
+
+N_VIDEOS = 6
+
+
+class FramesAccess(DatasetAccess):
+    """Access to synthetic RGB or flow frames, with the same videos in the train and test splits."""
+
+    def __init__(self, video_frames, image_modality):
+        super().__init__(n_classes=N_VIDEOS)
+        self._video_frames = video_frames
+        self._image_modality = image_modality
+
+    def get_train(self):
+        frames_root, annotation_path = self._video_frames
+        return VideoFrameDataset(
+            root_path=frames_root,
+            annotationfile_path=annotation_path,
+            image_modality=self._image_modality,
+            num_segments=2,
+            frames_per_segment=4,
+            imagefile_template="img_{:05d}.jpg" if self._image_modality == "rgb" else "flow_{}_{:05d}.jpg",
+            transform=ImglistToTensor(),
+        )
+
+    def get_test(self):
+        return self.get_train()
+
+
+@pytest.fixture(scope="module")
+def video_frames(tmp_path_factory):
+    return make_video_frames(str(tmp_path_factory.mktemp("videos")), n_videos=N_VIDEOS, n_frames=30)
+
+
+def test_joint_video_dataset(video_frames):
+    rgb_dataset = FramesAccess(video_frames, "rgb").get_train()
+    flow_dataset = FramesAccess(video_frames, "flow").get_train()
+    dataset = JointVideoDataset(rgb_dataset, flow_dataset)
+    assert np.array_equal(dataset.targets, np.arange(N_VIDEOS))
+
+    np.random.seed(0)
+    x, label = dataset[1]
+    # the flow frames are loaded at the segments sampled for the rgb frames
+    np.random.seed(0)
+    indices = rgb_dataset._sample_indices(rgb_dataset.video_list[1])
+    assert torch.equal(x["rgb"], rgb_dataset._get(rgb_dataset.video_list[1], indices)[0])
+    assert torch.equal(x["flow"], flow_dataset._get(flow_dataset.video_list[1], indices)[0])
+    assert label == 1
+
+    with pytest.raises(ValueError, match="videos"):
+        JointVideoDataset(rgb_dataset, torch.utils.data.Subset(flow_dataset, [0]))
+
+
+def test_joint_loading(video_frames):
+    access_dict = {modality: FramesAccess(video_frames, modality) for modality in ["rgb", "flow"]}
+    dataset = VideoMultiDomainDatasets(
+        access_dict, access_dict, image_modality="joint", seed=0, val_split_ratio=0.5, joint_loading=True
+    )
+    dataset.prepare_data_loaders()
+    assert len(dataset) == N_VIDEOS // 2
+
+    loader = dataset.get_domain_loaders(split="train", batch_size=2)
+    assert len(loader) == 1
+    for batch in loader:
+        # the batches have the layout of separate rgb and flow loaders
+        (x_s_rgb, y_s), (x_s_flow, y_s_flow), (x_t_rgb, y_t), (x_t_flow, y_t_flow) = batch
+        assert x_s_rgb.shape == x_t_rgb.shape == (2, 8, 3, 8, 10)
+        assert x_s_flow.shape == x_t_flow.shape == (2, 4, 2, 8, 10)
+        assert torch.equal(y_s, y_s_flow) and torch.equal(y_t, y_t_flow)
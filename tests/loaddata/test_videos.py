@@ -0,0 +1,201 @@
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from kale.loaddata.sampler import BatchedFetchDataset, SamplingConfig
+from kale.loaddata.videos import (
+    get_clip_offsets,
+    get_segment_offsets,
+    MultiViewVideoDataset,
+    VideoAnnotations,
+    VideoFrameDataset,
+    VideoRecord,
+)
+from kale.prepdata.video_transform import ImglistToTensor
+from tests.helpers.video_frames import make_video_frames
+
+
+@pytest.fixture(scope="module")
+def video_frames(tmp_path_factory):
+    return make_video_frames(str(tmp_path_factory.mktemp("videos")), n_videos=4, n_frames=20)
+
+
+def get_dataset(video_frames, image_modality="rgb", **kwargs):
+    frames_root, annotation_path = video_frames
+    params = dict(
+        root_path=frames_root,
+        annotationfile_path=annotation_path,
+        image_modality=image_modality,
+        num_segments=3,
+        frames_per_segment=4,
+        imagefile_template="img_{:05d}.jpg" if image_modality == "rgb" else "flow_{}_{:05d}.jpg",
+        transform=ImglistToTensor(),
+        test_mode=True,
+    )
+    params.update(kwargs)
+    return VideoFrameDataset(**params)
+
+
+@pytest.mark.parametrize("image_modality", ["rgb", "flow"])
+def test_decode_threads(video_frames, image_modality):
+    dataset = get_dataset(video_frames, image_modality)
+    threaded_dataset = get_dataset(video_frames, image_modality, decode_threads=4)
+    for index in range(len(dataset)):
+        frames, label = dataset[index]
+        threaded_frames, threaded_label = threaded_dataset[index]
+        # the frames keep their order
+        assert torch.equal(frames, threaded_frames)
+        assert label == threaded_label
+    # the pool is reused across samples, and not pickled
+    pool = threaded_dataset._decode_pool
+    threaded_dataset[0]
+    assert threaded_dataset._decode_pool is pool
+    assert pickle.loads(pickle.dumps(threaded_dataset))._decode_pool is None
+
+    loader = torch.utils.data.DataLoader(threaded_dataset, batch_size=2, num_workers=2)
+    assert torch.equal(torch.cat([frames for frames, _ in loader]), torch.stack([x for x, _ in dataset]))
+
+    # each image file is decoded by its own task, e.g. the x and y images of each flow frame
+    n_tasks = []
+
+    class CountingPool:
+        def map(self, fn, *iterables):
+            args = list(zip(*iterables))
+            n_tasks.append(len(args))
+            return pool.map(fn, *zip(*args))
+
+    threaded_dataset._get_decode_pool = CountingPool
+    threaded_frames, _ = threaded_dataset[1]
+    assert torch.equal(threaded_frames, dataset[1][0])
+    assert n_tasks == [len(threaded_frames) * (2 if image_modality == "flow" else 1)]
+
+
+@pytest.mark.parametrize(
+    "decode_size, expected_size", [(None, (64, 96)), (100, (64, 96)), (32, (32, 48)), (16, (16, 24))]
+)
+def test_decode_size(tmp_path, decode_size, expected_size):
+    frames = make_video_frames(str(tmp_path), n_videos=1, size=(64, 96))
+    frames_tensor, _ = get_dataset(frames, decode_size=decode_size)[0]
+    assert frames_tensor.shape[-2:] == expected_size
+
+    # the reduced frames are close to the downscaled full resolution frames, even for the noise of the test frames
+    full_frames, _ = get_dataset(frames)[0]
+    resized_frames = torch.nn.functional.interpolate(full_frames, size=expected_size, mode="area")
+    assert torch.mean(torch.abs(frames_tensor - resized_frames)) < 0.1
+
+
+@pytest.mark.parametrize(
+    "rows",
+    [
+        [["a/0", "1", "10", "0"], ["a/0", "5", "12", "1"], ["b/1", "3", "30", "2"]],
+        # multiple labels per sample
+        [["a/0", "1", "10", "0", "3", "4"], ["b/1", "3", "30", "2", "1", "0"]],
+        # different numbers of labels per sample, stored as VideoRecord
+        [["a/0", "1", "10", "0", "3"], ["b/1", "3", "30", "2"]],
+    ],
+)
+def test_video_annotations(tmp_path, rows):
+    annotation_path = tmp_path / "annotations.txt"
+    annotation_path.write_text("".join(" ".join(row) + "\n" for row in rows))
+    dataset = VideoFrameDataset(str(tmp_path), str(annotation_path))
+    assert len(dataset) == len(rows)
+    if len({len(row) for row in rows}) == 1:
+        assert isinstance(dataset.video_list, VideoAnnotations)
+        # 16 bytes per sample, and 4 more bytes per extra label
+        assert dataset.video_list.records.itemsize == 16 + 4 * (len(rows[0]) - 4)
+        assert len(dataset.video_list.paths) == len({row[0] for row in rows})
+    for record, row in zip(dataset.video_list, rows):
+        expected = VideoRecord(row, tmp_path)
+        assert record.path == expected.path
+        assert (record.start_frame, record.end_frame, record.num_frames) == (
+            expected.start_frame,
+            expected.end_frame,
+            expected.num_frames,
+        )
+        assert record.label == expected.label
+    assert [np.asarray(label).tolist() for label in dataset.targets] == [record.label for record in dataset.video_list]
+
+
+@pytest.mark.parametrize("num_segments, frames_per_segment", [(1, 16), (3, 4), (8, 1)])
+def test_get_segment_offsets(num_segments, frames_per_segment):
+    num_frames = np.arange(num_segments + frames_per_segment, 300)
+    # symmetrical start frames, as computed for each sample before
+    tick = (num_frames - frames_per_segment + 1) / float(num_segments)
+    expected = [[int(t / 2.0 + t * x) for x in range(num_segments)] for t in tick]
+    assert np.array_equal(get_segment_offsets(num_frames, num_segments, frames_per_segment, False), expected)
+
+    offsets = get_segment_offsets(num_frames, num_segments, frames_per_segment, random_state=0)
+    assert offsets.shape == (len(num_frames), num_segments)
+    # the segments are in ascending order, and their frames are in the videos
+    assert np.all(np.diff(offsets, axis=1) > 0)
+    assert np.all(offsets >= 0) and np.all(offsets + frames_per_segment <= num_frames[:, None])
+    # long videos have one start frame in each segment
+    is_long = num_frames >= num_segments * frames_per_segment
+    duration = (num_frames[is_long, None] - frames_per_segment + 1) // num_segments
+    assert np.array_equal(
+        offsets[is_long] // duration, np.broadcast_to(np.arange(num_segments), offsets[is_long].shape)
+    )
+    assert np.array_equal(offsets, get_segment_offsets(num_frames, num_segments, frames_per_segment, random_state=0))
+
+    with pytest.raises(ValueError, match="distinct"):
+        get_segment_offsets([6], 3, 4)
+
+
+@pytest.mark.parametrize("test_mode", [True, False])
+def test_get_batch(video_frames, test_mode):
+    dataset = get_dataset(video_frames, test_mode=test_mode)
+    np.random.seed(0)
+    offsets = dataset.get_segment_offsets()
+    assert offsets.shape == (len(dataset), dataset.num_segments)
+    if test_mode:
+        assert np.array_equal(offsets, [dataset._sample_indices(record) for record in dataset.video_list])
+
+    indices = [2, 0, 3]
+    np.random.seed(0)
+    frames, labels = dataset.get_batch(indices)
+    np.random.seed(0)
+    expected = [dataset._get(dataset.video_list[i], o) for i, o in zip(indices, dataset.get_segment_offsets(indices))]
+    assert torch.equal(frames, torch.stack([x for x, _ in expected]))
+    assert labels.tolist() == [y for _, y in expected]
+
+    loader = SamplingConfig(seed=0, batched_fetch=True).create_loader(dataset, 2)
+    assert isinstance(loader.dataset, BatchedFetchDataset)
+    frames, labels = next(iter(loader))
+    assert frames.shape == (2, 12, 3, 8, 10)
+
+    with pytest.raises(RuntimeError, match="frame_per_segment"):
+        get_dataset(video_frames, frames_per_segment=24).get_segment_offsets()
+
+
+@pytest.mark.parametrize("n_clips", [1, 2, 5])
+def test_get_clip_offsets(n_clips):
+    num_frames = np.arange(12, 200)
+    offsets = get_clip_offsets(num_frames, 3, 4, n_clips)
+    assert offsets.shape == (len(num_frames), n_clips, 3)
+    assert np.all(offsets >= 0) and np.all(offsets + 4 <= num_frames[:, None, None])
+    # the clips are ordered, and the middle clip is the symmetrical one
+    assert np.all(np.diff(offsets, axis=1) >= 0)
+    if n_clips % 2 == 1:
+        assert np.array_equal(offsets[:, n_clips // 2], get_segment_offsets(num_frames, 3, 4, random_shift=False))
+
+
+def test_multi_view_dataset(video_frames, monkeypatch):
+    dataset = get_dataset(video_frames, frames_per_segment=8)
+    loaded = []
+    load_image = dataset._load_image
+    monkeypatch.setattr(dataset, "_load_image", lambda *args: loaded.append(args[1]) or load_image(*args))
+
+    clips, label = dataset.get_clips(0, 4)
+    assert len(clips) == 4
+    # the 4 clips of 3 segments of 8 frames overlap, and their frames are loaded once
+    clip_offsets = get_clip_offsets([20], 3, 8, 4)[0]
+    assert sorted(loaded) == sorted({1 + o + i for o in clip_offsets.flatten() for i in range(8)})
+    assert len(loaded) < 4 * 24
+    for clip, offsets in zip(clips, clip_offsets):
+        assert torch.equal(clip, dataset._get(dataset.video_list[0], offsets)[0])
+
+    views, view_label = MultiViewVideoDataset(dataset, 4)[0]
+    assert torch.equal(views, torch.stack(clips))
+    assert view_label == label
@@ -0,0 +1,95 @@
+import pytest
+import torch
+
+from kale.loaddata.videos import JointVideoDataset, MultiViewVideoDataset, VideoFrameDataset
+from kale.pipeline.video_domain_adapter import BaseMMDLike4Video
+from kale.pipeline.video_evaluation import get_video_predictor, predict_multi_view
+from kale.prepdata.video_transform import ClipTransform
+from tests.helpers.video_frames import make_video_frames
+
+N_VIDEOS = 5
+
+
+class MeanModel(torch.nn.Module):
+    """Predicts logits from the mean of each modality, returned second like the video trainers."""
+
+    def forward(self, x):
+        logits = sum(x[key].mean(dim=(1, 2, 3, 4)) for key in ["rgb", "flow"] if x[key] is not None)
+        return None, torch.stack([logits, -logits], dim=1), None
+
+
+class MeanMMDModel(BaseMMDLike4Video):
+    """Video MMD-like trainer (e.g. DAN or JAN) without training setup, whose forward takes a tensor of one modality."""
+
+    def __init__(self, image_modality):
+        torch.nn.Module.__init__(self)
+        self.image_modality = image_modality
+        mean = torch.nn.AdaptiveAvgPool3d(1)
+        self.feat = {
+            "rgb": mean if image_modality != "flow" else None,
+            "flow": mean if image_modality != "rgb" else None,
+        }
+        self.rgb_feat = self.feat["rgb"]
+        self.flow_feat = self.feat["flow"]
+        n_channels = 5 if image_modality == "joint" else 3 if image_modality == "rgb" else 2
+        self.classifier = torch.nn.Linear(n_channels, 2)
+
+
+@pytest.fixture(scope="module")
+def video_frames(tmp_path_factory):
+    return make_video_frames(str(tmp_path_factory.mktemp("videos")), n_videos=N_VIDEOS, n_frames=16, size=(8, 12))
+
+
+def get_dataset(video_frames, image_modality, n_crops):
+    frames_root, annotation_path = video_frames
+    n_channels = 3 if image_modality == "rgb" else 2
+    return VideoFrameDataset(
+        root_path=frames_root,
+        annotationfile_path=annotation_path,
+        image_modality=image_modality,
+        num_segments=2,
+        frames_per_segment=4,
+        imagefile_template="img_{:05d}.jpg" if image_modality == "rgb" else "flow_{}_{:05d}.jpg",
+        transform=ClipTransform(8, 6, [0.5] * n_channels, [0.5] * n_channels, n_crops=n_crops),
+        test_mode=True,
+    )
+
+
+@pytest.mark.parametrize("image_modality", ["rgb", "flow", "joint"])
+@pytest.mark.parametrize("n_clips, n_crops", [(1, 1), (3, 1), (2, 3)])
+def test_predict_multi_view(video_frames, image_modality, n_clips, n_crops):
+    if image_modality == "joint":
+        dataset = JointVideoDataset(
+            get_dataset(video_frames, "rgb", n_crops), get_dataset(video_frames, "flow", n_crops)
+        )
+    else:
+        dataset = get_dataset(video_frames, image_modality, n_crops)
+    views_dataset = MultiViewVideoDataset(dataset, n_clips)
+    predict = get_video_predictor(MeanModel(), image_modality)
+    logits, labels = predict_multi_view(predict, views_dataset, batch_size=2)
+    assert logits.shape == (N_VIDEOS, 2)
+    assert labels.tolist() == list(range(N_VIDEOS))
+
+    # the logits of each video are the mean of the logits of its n_clips * n_crops views
+    for index in range(N_VIDEOS):
+        views, _ = views_dataset[index]
+        n_views = len(views["rgb"] if image_modality == "joint" else views)
+        assert n_views == n_clips * n_crops
+        expected = predict(views).mean(dim=0)
+        assert torch.allclose(logits[index], expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("image_modality", ["rgb", "flow", "joint"])
+def test_predict_multi_view_mmd(video_frames, image_modality):
+    if image_modality == "joint":
+        dataset = JointVideoDataset(get_dataset(video_frames, "rgb", 2), get_dataset(video_frames, "flow", 2))
+    else:
+        dataset = get_dataset(video_frames, image_modality, 2)
+    views_dataset = MultiViewVideoDataset(dataset, 2)
+    model = MeanMMDModel(image_modality).eval()
+    logits, _ = predict_multi_view(get_video_predictor(model, image_modality), views_dataset, batch_size=2)
+    assert logits.shape == (N_VIDEOS, 2)
+    views, _ = views_dataset[1]
+    with torch.no_grad():
+        expected = model(views)[1].mean(dim=0)
+    assert torch.allclose(logits[1], expected, atol=1e-6)
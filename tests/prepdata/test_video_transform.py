@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from kale.prepdata.video_transform import _stack_frames, ClipTransform, get_transform
+
+
+def _make_frames(image_modality, n_frames=4, size=(300, 400)):
+    random_state = np.random.RandomState(0)
+    if image_modality == "rgb":
+        shape, mode = (*size, 3), "RGB"
+    else:
+        shape, mode = size, "L"
+        n_frames *= 2
+    return [Image.fromarray(random_state.randint(0, 256, size=shape, dtype=np.uint8), mode) for _ in range(n_frames)]
+
+
+@pytest.mark.parametrize("image_modality", ["rgb", "flow"])
+@pytest.mark.parametrize("split", ["train", "valid", "test"])
+def test_clip_transform(image_modality, split):
+    frames = _make_frames(image_modality)
+    transform = get_transform("epic", image_modality)[split]
+    fused_transform = get_transform("epic", image_modality, fused=True)[split]
+    assert isinstance(fused_transform, ClipTransform)
+
+    torch.manual_seed(0)
+    expected = transform(frames)
+    torch.manual_seed(0)
+    clip = fused_transform(frames)
+    assert clip.shape == expected.shape == (3 if image_modality == "rgb" else 2, 4, 224, 224)
+    assert clip.is_contiguous()
+    assert torch.allclose(clip, expected, atol=1e-6)
+
+    # the frames can also be uint8 arrays
+    torch.manual_seed(0)
+    assert torch.allclose(fused_transform([np.asarray(frame) for frame in frames]), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("image_modality", ["rgb", "flow"])
+@pytest.mark.parametrize("size", [(300, 400), (400, 300)])
+def test_clip_transform_crops(image_modality, size):
+    frames = _make_frames(image_modality, size=size)
+    transform = get_transform("epic", image_modality, n_crops=3)["test"]
+    assert isinstance(transform, ClipTransform) and transform.n_crops == 3
+    crops = transform(frames)
+    assert crops.shape == (3, 3 if image_modality == "rgb" else 2, 4, 224, 224)
+    # the middle crop is the center crop
+    assert torch.allclose(crops[1], get_transform("epic", image_modality)["test"](frames), atol=1e-6)
+    # the other crops are at both ends of the longer side
+    resized = transforms.functional.resize(_stack_frames(frames).float() / 255, [256]).transpose(0, 1)
+    resized = (resized - 0.5) / 0.5
+    if size[1] > size[0]:
+        first, last = resized[..., 16:240, :224], resized[..., 16:240, -224:]
+    else:
+        first, last = resized[..., :224, 16:240], resized[..., -224:, 16:240]
+    assert torch.allclose(crops[0], first, atol=1e-6)
+    assert torch.allclose(crops[2], last, atol=1e-6)
+
+    with pytest.raises(ValueError, match="fixed"):
+        ClipTransform(resize=256, crop_size=224, mean=[0.5], std=[0.5], random_crop=True, n_crops=3)
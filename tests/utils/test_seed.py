@@ -5,7 +5,7 @@ import pytest
 import torch
 from numpy import testing
 
-from kale.utils.seed import set_seed
+from kale.utils.seed import get_seed, set_seed
 
 
 @pytest.fixture
@@ -39,3 +39,12 @@ def test_set_seed_torch(torch_rand):
     set_seed()
     result = torch.rand(1).item()
     testing.assert_equal(result, torch_rand)
+
+
+@pytest.mark.parametrize("generator", [None, 3, np.int64(3), np.random.default_rng(0), np.random.RandomState(0)])
+def test_get_seed(generator):
+    set_seed()
+    seed = get_seed(generator)
+    assert isinstance(seed, int) and 0 <= seed < 2 ** 31 - 1
+    if generator is not None and not isinstance(generator, (np.random.Generator, np.random.RandomState)):
+        assert seed == 3